@@ -0,0 +1,165 @@
+# Class to measure the load and the errors of the CAN bus.
+import json
+import subprocess
+import time
+from threading import Lock
+import can
+
+
+class BusMonitor(can.Listener):
+    """
+    Measures, from the passive socket of the CanNetwork, how busy the
+    bus is and how healthy:
+
+     - the bus utilization, from the nominal length in bits of every
+       frame (bit stuffing excluded) over the bitrate;
+     - the frame rate of every COB-ID;
+     - the error frames reported by the SocketCAN driver, by class, and
+       in particular the bus-off events and the controller overflows.
+
+    The rates are computed over windows of window seconds: the last
+    completed window is reported, together with the peak utilization
+    seen so far. Every frame only costs a few additions and a dict
+    update, so the monitor can run permanently.
+
+    The counters of the interface itself (dropped frames, overruns)
+    are read from sysfs when the statistics are requested. The CAN
+    specific ones (restarts after bus-off...) are only available from
+    "ip -details -statistics", which is run at most once every
+    XSTATS_TTL seconds.
+    """
+    # Frame length in bits, without data and stuff bits: SOF, id, control
+    # field, CRC, ACK, EOF and interframe space
+    STANDARD_FRAME_BITS = 47
+    EXTENDED_FRAME_BITS = 67
+    # Error classes of the SocketCAN error frames (linux/can/error.h)
+    ERROR_CLASSES = {0x001: "tx_timeout", 0x002: "lost_arbitration", 0x004: "controller", 0x008: "protocol",
+                     0x010: "transceiver", 0x020: "no_ack", 0x040: "bus_off", 0x080: "bus_error",
+                     0x100: "restarted"}
+    CONTROLLER_ERRORS = {0x01: "rx_overflow", 0x02: "tx_overflow", 0x04: "rx_warning", 0x08: "tx_warning",
+                         0x10: "rx_passive", 0x20: "tx_passive"}
+    BUS_OFF = 0x040
+    CONTROLLER = 0x004
+    INTERFACE_COUNTERS = ["rx_packets", "tx_packets", "rx_errors", "tx_errors", "rx_dropped", "tx_dropped",
+                          "rx_over_errors"]
+    # Seconds for which the CAN specific counters are reused
+    XSTATS_TTL = 60
+
+    def __init__(self, interface_name: str, bitrate: int, window=5.0):
+        """
+        :param interface_name: the CANbus interface monitored.
+        :param bitrate: the bitrate of the bus.
+        :param window: the length in seconds of the measurement windows.
+        """
+        self.interface_name = interface_name
+        self.bitrate = bitrate
+        self.window = window
+        # Frames arrive on the notifier thread, statistics are read by
+        # the CanProcess
+        self.lock = Lock()
+        self.window_start = None
+        self.window_bits = 0
+        self.window_counts = {}
+        self.utilization = None
+        self.peak_utilization = 0.0
+        self.rates = {}
+        self.frames = 0
+        self.error_frames = 0
+        self.errors = {}
+        self.last_bus_off = None
+        self.receive_errors = 0
+        self.xstats = {}
+        self.xstats_time = None
+
+    def on_message_received(self, message: can.Message) -> None:
+        now = time.monotonic()
+        with self.lock:
+            if self.window_start is None:
+                self.window_start = now
+            elif now - self.window_start >= self.window:
+                self.close_window(now)
+            self.frames += 1
+            if message.is_error_frame:
+                self.count_error(message)
+                return
+            bits = self.EXTENDED_FRAME_BITS if message.is_extended_id else self.STANDARD_FRAME_BITS
+            if not message.is_remote_frame:
+                bits += 8 * message.dlc
+            self.window_bits += bits
+            self.window_counts[message.arbitration_id] = self.window_counts.get(message.arbitration_id, 0) + 1
+
+    def on_error(self, exc: Exception) -> None:
+        # Errors of the socket itself, e.g. the interface went down
+        self.receive_errors += 1
+
+    def close_window(self, now: float) -> None:
+        elapsed = now - self.window_start
+        self.utilization = self.window_bits / (self.bitrate * elapsed)
+        self.peak_utilization = max(self.peak_utilization, self.utilization)
+        self.rates = {cob_id: count / elapsed for cob_id, count in self.window_counts.items()}
+        self.window_start = now
+        self.window_bits = 0
+        self.window_counts = {}
+
+    def count_error(self, message: can.Message) -> None:
+        self.error_frames += 1
+        for flag, name in self.ERROR_CLASSES.items():
+            if message.arbitration_id & flag:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        if message.arbitration_id & self.CONTROLLER and message.dlc > 1:
+            for flag, name in self.CONTROLLER_ERRORS.items():
+                if message.data[1] & flag:
+                    self.errors[name] = self.errors.get(name, 0) + 1
+        if message.arbitration_id & self.BUS_OFF:
+            self.last_bus_off = time.monotonic()
+
+    def read_xstats(self) -> dict:
+        """
+        :return: for real CAN interfaces, the CAN specific counters
+                 (bus-off, restarts...) from "ip -details -statistics",
+                 read again only if older than XSTATS_TTL seconds.
+        """
+        now = time.monotonic()
+        if self.xstats_time is not None and now - self.xstats_time < self.XSTATS_TTL:
+            return self.xstats
+        self.xstats_time = now
+        self.xstats = {}
+        completed_process = subprocess.run(["ip", "-details", "-statistics", "-json", "link", "show",
+                                            self.interface_name], encoding="utf-8", capture_output=True)
+        if completed_process.returncode == 0:
+            try:
+                self.xstats = json.loads(completed_process.stdout)[0]["linkinfo"]["info_xstats"]
+            except (ValueError, IndexError, KeyError, TypeError):
+                pass
+        return self.xstats
+
+    def read_interface_counters(self) -> dict:
+        """
+        :return: the counters of the interface from sysfs, and the CAN
+                 specific ones (see read_xstats).
+        """
+        counters = {}
+        for name in self.INTERFACE_COUNTERS:
+            try:
+                with open(f"/sys/class/net/{self.interface_name}/statistics/{name}", 'r') as counter_file:
+                    counters[name] = int(counter_file.read())
+            except (OSError, ValueError):
+                pass
+        counters.update(self.read_xstats())
+        return counters
+
+    def statistics(self) -> dict:
+        with self.lock:
+            # A silent bus does not close the windows by itself
+            now = time.monotonic()
+            if self.window_start is not None and now - self.window_start >= self.window:
+                self.close_window(now)
+        return {"utilization_pct": None if self.utilization is None else round(self.utilization * 100, 1),
+                "peak_utilization_pct": round(self.peak_utilization * 100, 1),
+                "frames": self.frames,
+                "frames_per_s": {hex(cob_id): round(rate, 1) for cob_id, rate in sorted(self.rates.items())},
+                "error_frames": self.error_frames,
+                "errors": dict(self.errors),
+                "last_bus_off_s": None if self.last_bus_off is None else round(time.monotonic() - self.last_bus_off),
+                "receive_errors": self.receive_errors,
+                "interface": self.read_interface_counters()}
@@ -1,13 +1,22 @@
 # Giulio Ganzerli 08/10/2020
 # Class to manage the CanOPEN connection to the nodes.
 import time
+import json
 import canopen
 from canopen.profiles.p402 import BaseNode402
 from sys import platform
 import logging
 import os
 import subprocess
+from functools import partial
 import can
+from interfaces.outputimage import OutputImage
+from interfaces.edscache import EdsCache
+from interfaces.nodesupervisor import NodeSupervisor
+from interfaces.canrecorder import CanRecorder
+from interfaces.busmonitor import BusMonitor
+from interfaces.nodepool import NodePool
+from interfaces.faulthistory import FaultHistory
 
 
 class CanNetwork:
@@ -23,9 +32,32 @@ class CanNetwork:
     SWITCH_ON_DISABLED = 0x80
     SWITCHED_ON = 0x07
     OPERATION_ENABLED = 0x0F
+    # Controlwords sent to enable a drive, and seconds between two of them
+    ENABLE_SEQUENCE = (SWITCH_ON_DISABLED, SWITCHED_ON, OPERATION_ENABLED)
+    ENABLE_STEP_DELAY = 0.2
+    EDS_PATH = 'LOVATO_VLB3.eds'
+    # Producer heartbeat time in ms configured on every node
+    HEARTBEAT_PERIOD = 500
+    # Flag of /sys/class/net/<interface>/flags
+    IFF_UP = 0x1
 
-    def __init__(self, interface_name="can0", bitrate=500000, bustype='socketcan', autoconnect=False):
+    def __init__(self, interface_name="can0", bitrate=500000, bustype='socketcan', autoconnect=False,
+                 record_directory=None, on_fault=None, clock=None):
+        """
+        :param interface_name: the name of the CANbus interface.
+        :param bitrate: the bitrate of the CAN network.
+        :param bustype: the python-can interface type.
+        :param autoconnect: if True, the network is connected right away.
+        :param record_directory: if not None, all the traffic of the
+            network is recorded in this directory (see CanRecorder).
+        :param on_fault: if not None, called with every fault (as a
+            dict, see FaultHistory.record) as soon as its EMCY arrives,
+            from the CAN notifier thread.
+        :param clock: the clock of the CanProcess, which times the
+            enable sequence. If None, time.monotonic is used.
+        """
         self.logger = logging.getLogger(__name__)
+        self.monotonic = time.monotonic if clock is None else clock.monotonic
         self.interface_name = interface_name
         self.bitrate = bitrate
         self.bustype = bustype
@@ -36,6 +68,26 @@ class CanNetwork:
         self.speed = 0
         self.state = None
         self.nodes_list = []
+        # Every setpoint sent to the nodes goes through the output
+        # image, so that unchanged values are not sent again
+        self.output_image = OutputImage()
+        # Nodes whose enable sequence is in progress: the index of the
+        # next controlword of ENABLE_SEQUENCE and the time it is due
+        self.enabling = {}
+        self.eds_cache = EdsCache(self.EDS_PATH, bus_name=interface_name)
+        self.supervisor = NodeSupervisor(self)
+        # Operations on several nodes are carried out concurrently
+        self.node_pool = NodePool()
+        self.record_directory = record_directory
+        self.recorder = None
+        # Passive listeners (bus monitor and recorder) share a socket of
+        # their own, separate from the canopen one
+        self.bus_monitor = BusMonitor(interface_name, bitrate)
+        self.passive_bus = None
+        self.passive_notifier = None
+        # The faults are reported by the nodes with EMCY messages
+        self.fault_history = FaultHistory()
+        self.on_fault = on_fault
         # Check dependencies
         # TODO install canopen from github pip install https://github.com/christiansandberg/canopen/archive/master.zip
         # Check if can interface is up and running (or turn it on forcibly)
@@ -53,25 +105,59 @@ class CanNetwork:
             self.logger.error("No CANbus interface found. Please connect a CANbus interface and restart the software.")
             raise IOError("No CANbus interface found. Please connect a CANbus interface and restart the software.")
         else:
-            self.disable_can_interface()
-            time.sleep(0.2)
-            self.setup_can_interface()
-            time.sleep(0.2)
-            if self.setup:
-                self.logger.info("CANbus interface setup.")
-            self.enable_can_interface()
-            if self.enabled:
-                self.logger.info("CANbus interface enabled.")
+            # The interface is reconfigured only if needed: taking it
+            # down would reset the bus and every node on it
+            up, bitrate, kind = self.read_can_interface()
+            self.enabled = up
+            if up and (bitrate == self.bitrate or kind == "vcan"):
+                self.setup = True
+                self.logger.info("CANbus interface already set up and enabled.")
+            else:
+                self.disable_can_interface()
+                time.sleep(0.2)
+                if kind == "vcan":
+                    # Virtual interfaces have no bitrate
+                    self.setup = True
+                else:
+                    self.setup_can_interface()
+                    time.sleep(0.2)
+                if self.setup:
+                    self.logger.info("CANbus interface setup.")
+                self.enable_can_interface()
+                if self.enabled:
+                    self.logger.info("CANbus interface enabled.")
             if autoconnect:
                 self.connect()
 
     def has_can_interface(self):
-        completed_process = subprocess.run(["ifconfig", "-a"], encoding="utf-8", capture_output=True)
-        output = completed_process.stdout
-        if self.interface_name in output:
-            return True
-        else:
-            return False
+        return os.path.isdir(f"/sys/class/net/{self.interface_name}")
+
+    def read_can_interface(self):
+        """
+        Reads the current state of the CANbus interface. Whether it is
+        up is read from sysfs; the bitrate is not exposed there, so it
+        is read from the netlink details reported by "ip -details".
+
+        :return: a tuple (up, bitrate, kind). bitrate is None if it
+                 can't be read, kind is "can", "vcan" or None.
+        """
+        try:
+            with open(f"/sys/class/net/{self.interface_name}/flags", 'r') as flags_file:
+                up = bool(int(flags_file.read().strip(), 16) & self.IFF_UP)
+        except (OSError, ValueError):
+            up = False
+        bitrate = None
+        kind = None
+        completed_process = subprocess.run(["ip", "-details", "-json", "link", "show", self.interface_name],
+                                           encoding="utf-8", capture_output=True)
+        if completed_process.returncode == 0:
+            try:
+                link_info = json.loads(completed_process.stdout)[0].get("linkinfo", {})
+                kind = link_info.get("info_kind")
+                bitrate = link_info.get("info_data", {}).get("bittiming", {}).get("bitrate")
+            except (ValueError, IndexError, AttributeError):
+                pass
+        return up, bitrate, kind
 
     def setup_can_interface(self):
         if self.setup:
@@ -118,10 +204,15 @@ class CanNetwork:
             raise IOError(f"Could not disable the {self.interface_name} interface.")
 
     def connect(self):
+        if self.connected and self.network is not None:
+            # The bus is already open: connecting again would only
+            # leak the previous one
+            return
         try:
             self.network = canopen.Network()
             self.network.connect(bitrate=self.bitrate, channel=self.interface_name, bustype=self.bustype)
             self.connected = True
+            self.start_passive_listeners()
         except OSError:
             self.connected = False
             self.logger.error(f"Could not connect on  the {self.interface_name} interface."
@@ -129,40 +220,58 @@ class CanNetwork:
             raise can.CanError(f"Could not connect on  the {self.interface_name} interface."
                                " A reboot will probably solve the problem")
 
+    def start_passive_listeners(self) -> None:
+        """
+        Opens a second socket on the interface and starts the bus
+        monitor and, if requested, the recorder on it. They are
+        diagnostic aids: if they can't be started, the network is used
+        anyway.
+        """
+        if self.passive_notifier is not None:
+            return
+        listeners = [self.bus_monitor]
+        if self.record_directory is not None:
+            recorder = CanRecorder(self.interface_name, self.record_directory)
+            try:
+                recorder.start()
+                self.recorder = recorder
+                listeners.append(recorder)
+            except OSError as e:
+                self.logger.warning(f"Could not record the {self.interface_name} traffic: {e}")
+        try:
+            self.passive_bus = can.interface.Bus(channel=self.interface_name, bustype=self.bustype)
+            self.passive_notifier = can.Notifier(self.passive_bus, listeners, 1)
+        except (OSError, can.CanError) as e:
+            self.logger.warning(f"Could not monitor the {self.interface_name} traffic: {e}")
+            if self.recorder is not None:
+                self.recorder.stop()
+                self.recorder = None
+
+    def get_recording_statistics(self):
+        return None if self.recorder is None else self.recorder.statistics()
+
+    def get_bus_statistics(self) -> dict:
+        return self.bus_monitor.statistics()
+
     def initialize_nodes(self):
         try:
-            # For some reason, reconnect is needed...
             self.connect()
             self.network.scanner.search()
             # Give time to complete the search process
             time.sleep(0.5)
             self.logger.info(f"CAN Network scan result: nodes number {self.network.scanner.nodes}")
-            for node_id in self.network.scanner.nodes:
-                new_node = BaseNode402(node_id, 'LOVATO_VLB3.eds')
-                self.network.add_node(new_node)
-                new_node.nmt.state = "PRE-OPERATIONAL"
-                time.sleep(0.2)
-                new_node.rpdo.read()
-                new_node.tpdo.read()
-                new_node.rpdo[1].enable = True
-                new_node.rpdo[1].start(0.05)
-                new_node.rpdo[1]['CiA: Controlword'].bits[0] = 1
-                new_node.rpdo[1]['CiA: Controlword'].bits[1] = 1
-                new_node.rpdo[1]['CiA: Controlword'].bits[3] = 1
-                new_node.nmt.state = 'OPERATIONAL'
-                new_node.rpdo[1]['CiA: Controlword'].bits[0] = 1
-                new_node.rpdo[1]['CiA: Controlword'].bits[1] = 1
-                new_node.rpdo[1]['CiA: Controlword'].bits[3] = 1
-                time.sleep(0.2)
-                self.reset_faulty_node(new_node)
-                new_node.rpdo[1]['CiA: Controlword'].raw = self.SWITCH_ON_DISABLED
-                self.nodes_list.append(new_node)
+            # The nodes are set up all at the same time
+            nodes = [self.create_node(node_id) for node_id in self.network.scanner.nodes]
+            self.for_each_node(self.setup_node, nodes)
+            self.nodes_list.extend(nodes)
             if len(self.nodes_list) > 0:
                 self.logger.info(f"Node number {self.nodes_list[0].id} identified")
             else:
                 self.logger.warning("No nodes found...")
         except can.CanError:
             self.connected = False
+            # Tells whether error frames or a bus-off are behind the failure
+            self.logger.error(f"Bus status: {self.get_bus_statistics()}")
             self.logger.error("Connection was successful but no active node is completing the bus,"
                               " meaning that communication is impossible. Please setup a node before"
                               " trying to connect again")
@@ -172,12 +281,220 @@ class CanNetwork:
         # Wait before setting all to ready
         time.sleep(0.5)
         self.set_network_state(self.SWITCHED_ON)
+        # From now on, nodes that boot up late or reboot are handled
+        # in the background
+        self.supervisor.start()
+
+    def create_node(self, node_id: int) -> BaseNode402:
+        new_node = BaseNode402(node_id, self.eds_cache.get_object_dictionary(node_id))
+        self.network.add_node(new_node)
+        new_node.emcy.add_callback(partial(self.on_emcy, node_id))
+        return new_node
+
+    def on_emcy(self, node_id: int, error) -> None:
+        """
+        Callback of the CAN notifier thread, called with the
+        canopen.emcy.EmcyError of every EMCY sent by the node.
+        """
+        fault = self.fault_history.record(node_id, error.code, error.register, error.timestamp, error.get_desc())
+        if error.code == FaultHistory.NO_ERROR:
+            self.logger.info(f"Node {node_id} faults cleared")
+        else:
+            self.logger.warning(f"Node {node_id} fault 0x{error.code:04X} ({fault['description']}),"
+                                f" error register 0x{error.register:02X}")
+        if self.on_fault is not None:
+            self.on_fault(fault)
+
+    def add_node(self, node_id: int) -> BaseNode402:
+        new_node = self.create_node(node_id)
+        if not self.has_expected_identity(new_node):
+            del self.network[node_id]
+            raise IOError(f"Node {node_id} is not a drive described by {self.EDS_PATH}")
+        self.setup_node(new_node)
+        self.nodes_list.append(new_node)
+        return new_node
+
+    def for_each_node(self, function, nodes: list, *args) -> dict:
+        """
+        Calls function(node, *args) for all the given nodes
+        concurrently, see NodePool. Every node is attempted even if
+        some fail.
+
+        :return: the result of every node id.
+        :raises: the exception raised for the first failed node, if
+                 any, once all the nodes are done.
+        """
+        results = self.node_pool.map(function, nodes, *args)
+        errors = [(node_id, result) for node_id, result in results.items() if isinstance(result, Exception)]
+        for node_id, error in errors:
+            self.logger.error(f"Operation {function.__name__} failed on node {node_id}: {error}")
+        if errors:
+            raise errors[0][1]
+        return results
+
+    def setup_node(self, node: BaseNode402) -> None:
+        """
+        Brings a node to the OPERATIONAL state with the cyclic RPDO
+        running and the drive in SWITCH ON DISABLED. It is used both
+        for new nodes and for nodes that have rebooted.
+        """
+        node.nmt.state = "PRE-OPERATIONAL"
+        time.sleep(0.2)
+        self.read_pdo_maps(node)
+        self.enable_heartbeat(node)
+        node.rpdo[1].enable = True
+        # A rebooted node still has its periodic task running
+        node.rpdo[1].stop()
+        node.rpdo[1].start(0.05)
+        node.rpdo[1]['CiA: Controlword'].bits[0] = 1
+        node.rpdo[1]['CiA: Controlword'].bits[1] = 1
+        node.rpdo[1]['CiA: Controlword'].bits[3] = 1
+        node.nmt.state = 'OPERATIONAL'
+        node.rpdo[1]['CiA: Controlword'].bits[0] = 1
+        node.rpdo[1]['CiA: Controlword'].bits[1] = 1
+        node.rpdo[1]['CiA: Controlword'].bits[3] = 1
+        time.sleep(0.2)
+        self.reset_faulty_node(node)
+        self.enabling.pop(node.id, None)
+        self.output_image.forget(node.id)
+        self.set_node_state(node, self.SWITCH_ON_DISABLED)
+
+    def enable_heartbeat(self, node: BaseNode402) -> None:
+        try:
+            node.sdo[0x1017].raw = self.HEARTBEAT_PERIOD
+            self.supervisor.expect_heartbeat(node.id)
+        except (canopen.SdoAbortedError, canopen.SdoCommunicationError):
+            self.logger.warning(f"Node {node.id} does not support heartbeats, it will not be supervised")
+
+    def has_expected_identity(self, node: BaseNode402) -> bool:
+        """
+        :return: True if the vendor id and the product code in the
+                 identity object (0x1018) of the node are the ones of
+                 the EDS, so that the node can be driven as a pump.
+        """
+        vendor_id, product_code, _, _ = self.eds_cache.read_identity(node)
+        expected = node.object_dictionary.device_information
+        if (vendor_id, product_code) == (expected.vendor_number, expected.product_number):
+            return True
+        self.logger.warning(f"Node {node.id} has vendor id 0x{vendor_id:X} and product code 0x{product_code:X},"
+                            f" not 0x{expected.vendor_number:X} and 0x{expected.product_number:X}")
+        return False
+
+    def reinitialize_node(self, node_id: int) -> None:
+        """
+        Called by the NodeSupervisor, on a thread of the NodePool, when
+        a node boots up after the initial scan. A new node is attached
+        only if its identity matches the EDS.
+        """
+        # No other operation must be in progress on the node meanwhile
+        with self.node_pool.lock(node_id):
+            node = self.get_node(node_id)
+            if node is None:
+                self.logger.info(f"New node {node_id} found on the network")
+                node = self.add_node(node_id)
+            else:
+                self.logger.warning(f"Node {node_id} has rebooted, initializing it again")
+                self.setup_node(node)
+            self.set_node_state(node, self.SWITCHED_ON)
+
+    def get_node(self, node_id: int):
+        for node in self.nodes_list:
+            if node.id == node_id:
+                return node
+        return None
+
+    def is_available(self, node: BaseNode402) -> bool:
+        """
+        :return: False if the node is silent or being initialized by
+                 the supervisor, True otherwise.
+        """
+        return self.supervisor.is_available(node.id)
+
+    def supervise(self) -> list:
+        """
+        Checks the heartbeats of the nodes. Nodes that boot up are
+        initialized in the background (see NodeSupervisor).
+
+        :return: the ids of the nodes that stopped sending heartbeats.
+        """
+        return self.supervisor.check_silent_nodes()
+
+    def get_supervision_statistics(self) -> dict:
+        return self.supervisor.statistics()
+
+    def read_pdo_maps(self, node: BaseNode402) -> None:
+        """
+        Configures the PDO maps of the node, using the cached ones if
+        the node is the same they were read from.
+        """
+        try:
+            identity = self.eds_cache.read_identity(node)
+        except (canopen.SdoAbortedError, canopen.SdoCommunicationError):
+            self.logger.warning(f"Could not read the identity of node {node.id}, PDO maps will not be cached")
+            identity = None
+        if identity is not None and self.eds_cache.load_pdo_maps(node, identity):
+            self.logger.info(f"PDO maps of node {node.id} loaded from cache")
+            return
+        node.rpdo.read()
+        node.tpdo.read()
+        if identity is not None:
+            self.eds_cache.save_pdo_maps(node, identity)
+
+    def write_output(self, node: BaseNode402, name: str, value, sdo_index=None, phys=False) -> bool:
+        """
+        Writes a setpoint to a node, unless the node already has it.
+
+        The value is written to RPDO1, which is transmitted cyclically,
+        and the PDO is also transmitted right away to minimize the
+        command-to-bus latency. Objects not mapped in RPDO1 are written
+        via SDO on sdo_index instead.
+
+        The output image holds the raw values: a physical value is
+        encoded first, so that setpoints which differ only below the
+        resolution of the object (like 1500.2 and 1500.4 rpm) are
+        recognized as unchanged.
+
+        :param name: the name of the object in the RPDO.
+        :param sdo_index: the index of the object for the SDO fallback.
+        :param phys: True if value is the physical value instead of the
+            raw one.
+        :return: True if the value was sent, False if it was unchanged.
+        """
+        try:
+            variable = node.rpdo[1][name]
+            mapped = True
+        except KeyError:
+            if sdo_index is None:
+                raise
+            variable = node.sdo[sdo_index]
+            mapped = False
+        raw = variable.od.encode_phys(value) if phys else value
+        if not self.output_image.is_changed(node.id, name, raw):
+            return False
+        requested = time.perf_counter()
+        variable.raw = raw
+        if mapped:
+            node.rpdo[1].transmit()
+        self.output_image.commit(node.id, name, raw, requested)
+        return True
 
     def set_network_state(self, state):
-        if self.state != state:
-            for node in self.nodes_list:
-                node.rpdo[1]['CiA: Controlword'].raw = state
-            self.state = state
+        for node in self.nodes_list:
+            # Its setup sets the state of a node being initialized, and
+            # waiting for its lock would stall the control loop
+            if self.supervisor.is_initializing(node.id):
+                continue
+            with self.node_pool.lock(node.id):
+                self.write_output(node, 'CiA: Controlword', state, sdo_index=0x6040)
+        self.state = state
+
+    def set_node_state(self, node: BaseNode402, state: int) -> None:
+        if self.write_output(node, 'CiA: Controlword', state, sdo_index=0x6040):
+            # The network is no longer in a uniform state
+            self.state = None
+
+    def get_fault_history(self) -> dict:
+        return self.fault_history.history()
 
     def get_faulty_nodes(self):
         faulty = []
@@ -200,8 +517,10 @@ class CanNetwork:
             time.sleep(0.1)
 
     def reset_faulty_nodes(self):
-        for node in self.nodes_list:
-            self.reset_faulty_node(node)
+        # Each reset takes 0.2s, so they are done in parallel
+        faulty = [node for node in self.nodes_list if self.is_faulty(node)]
+        if faulty:
+            self.for_each_node(self.reset_faulty_node, faulty)
 
     def get_state(self, node: BaseNode402) -> int:
         if self.is_faulty(node):
@@ -233,21 +552,120 @@ class CanNetwork:
         self.set_network_state(self.OPERATION_ENABLED)
 
     def stop_all_nodes(self):
+        self.enabling.clear()
         self.set_network_state(self.SWITCHED_ON)
 
     def set_speed_all_nodes(self, rpm):
-        for node in self.nodes_list:
-            node.sdo[0x6042].phys = rpm
+        self.for_each_node(self.set_node_speed, self.nodes_list, rpm)
         self.speed = rpm
 
+    def run_node(self, node: BaseNode402) -> None:
+        """
+        Starts the enable sequence of the node without waiting for it:
+        the first controlword is sent now, the others by
+        advance_enabling, ENABLE_STEP_DELAY seconds apart. Until then
+        the node is already considered running.
+        """
+        self.set_node_state(node, self.ENABLE_SEQUENCE[0])
+        self.enabling[node.id] = (1, self.monotonic() + self.ENABLE_STEP_DELAY)
+
+    def advance_enabling(self) -> None:
+        """
+        Sends the next controlword of the enable sequence of every node
+        whose step is due. Meant to be called at every control step.
+        """
+        now = self.monotonic()
+        for node_id, (step, due) in list(self.enabling.items()):
+            if now < due:
+                continue
+            node = self.get_node(node_id)
+            if node is None:
+                self.enabling.pop(node_id, None)
+                continue
+            if self.supervisor.is_initializing(node_id):
+                # The setup of the node cancels the sequence
+                continue
+            with self.node_pool.lock(node_id):
+                self.set_node_state(node, self.ENABLE_SEQUENCE[step])
+            if step + 1 < len(self.ENABLE_SEQUENCE):
+                self.enabling[node_id] = (step + 1, now + self.ENABLE_STEP_DELAY)
+            else:
+                self.enabling.pop(node_id, None)
+
+    def stop_node(self, node: BaseNode402) -> None:
+        self.enabling.pop(node.id, None)
+        self.set_node_state(node, self.SWITCHED_ON)
+
+    def halt_node(self, node: BaseNode402) -> None:
+        """
+        Sets the target velocity of the node to 0, then stops it.
+        """
+        self.set_node_speed(node, 0)
+        self.stop_node(node)
+
+    def run_nodes(self, nodes: list) -> None:
+        """
+        Like run_node, for several nodes at the same time.
+        """
+        self.for_each_node(self.run_node, nodes)
+
+    def halt_nodes(self, nodes: list) -> None:
+        """
+        Like halt_node, for several nodes at the same time. Nodes being
+        initialized are skipped, since their setup leaves them disabled.
+        """
+        self.for_each_node(self.halt_node, [node for node in nodes
+                                            if not self.supervisor.is_initializing(node.id)])
+
+    def is_running(self, node: BaseNode402) -> bool:
+        """
+        :return: True if the node is enabled or its enable sequence is
+                 in progress.
+        """
+        return (self.output_image.get(node.id, 'CiA: Controlword') == self.OPERATION_ENABLED
+                or node.id in self.enabling)
+
+    def set_node_speed(self, node: BaseNode402, rpm) -> None:
+        """
+        Sets the target velocity of a node. RPDO1 of the VLB3 maps the
+        target velocity next to the controlword, so the new value goes
+        out with the RPDO instead of requiring an SDO transfer. The
+        lock of the node is taken, as the SDO fallback must not overlap
+        with the transfers of the supervisor or of the node pool.
+        """
+        with self.node_pool.lock(node.id):
+            self.write_output(node, 'Target velocity', rpm, sdo_index=0x6042, phys=True)
+
+    def get_node_speed(self, node: BaseNode402):
+        """
+        :return: the target velocity last sent to the node, taken from
+                 the output image.
+        """
+        return node.object_dictionary[0x6042].decode_phys(self.output_image.get(node.id, 'Target velocity', 0))
+
+    def get_output_statistics(self) -> dict:
+        return self.output_image.statistics()
+
+    def get_node_pool_statistics(self) -> dict:
+        return self.node_pool.statistics()
+
+    # The sensors are wired to the first node, read via SDO under its
+    # lock like any other transfer
+
     def read_outlet_pressure(self):
-        return self.nodes_list[0].sdo[0x2DA4][1].raw
+        node = self.nodes_list[0]
+        with self.node_pool.lock(node.id):
+            return node.sdo[0x2DA4][1].raw
 
     def read_inlet_temperature(self):
-        return self.nodes_list[0].sdo[0x60FD].bits[16]
+        node = self.nodes_list[0]
+        with self.node_pool.lock(node.id):
+            return node.sdo[0x60FD].bits[16]
 
     def read_inlet_pressure(self):
-        return self.nodes_list[0].sdo[0x60FD].bits[17]
+        node = self.nodes_list[0]
+        with self.node_pool.lock(node.id):
+            return node.sdo[0x60FD].bits[17]
 
     # def read_inlet_pressure(self):
     # to be implemented if we get to test a pressure sensor
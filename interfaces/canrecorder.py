@@ -0,0 +1,161 @@
+# Classes to record the traffic of the CAN network on disk.
+import gzip
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+import can
+
+# Every log file starts with MAGIC. Then, for every frame: timestamp
+# (double), CAN id with the SocketCAN flags in the upper bits (uint32),
+# data length (uint8) and the data bytes.
+MAGIC = b"PICANLOG\x01"
+FRAME_FORMAT = "<dIB"
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+EXTENDED_FLAG = 0x80000000
+REMOTE_FLAG = 0x40000000
+ERROR_FLAG = 0x20000000
+ID_MASK = 0x1FFFFFFF
+
+
+def pack_frame(message: can.Message) -> bytes:
+    can_id = message.arbitration_id & ID_MASK
+    if message.is_extended_id:
+        can_id |= EXTENDED_FLAG
+    if message.is_remote_frame:
+        can_id |= REMOTE_FLAG
+    if message.is_error_frame:
+        can_id |= ERROR_FLAG
+    data = bytes(message.data)
+    return struct.pack(FRAME_FORMAT, message.timestamp, can_id, len(data)) + data
+
+
+def read_log(path: str):
+    """
+    Reads a log written by a CanRecorder. A log cut short, e.g. by a
+    power loss, is read up to its last complete frame.
+
+    :param path: the path of the log file.
+    :return: a generator of can.Message objects, in the recorded order.
+    """
+    with gzip.open(path, 'rb') as log_file:
+        if log_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a CAN log")
+        while True:
+            try:
+                header = log_file.read(FRAME_SIZE)
+                if len(header) < FRAME_SIZE:
+                    return
+                timestamp, can_id, length = struct.unpack(FRAME_FORMAT, header)
+                data = log_file.read(length)
+            except (EOFError, OSError):
+                return
+            if len(data) < length:
+                return
+            yield can.Message(timestamp=timestamp, arbitration_id=can_id & ID_MASK,
+                              is_extended_id=bool(can_id & EXTENDED_FLAG),
+                              is_remote_frame=bool(can_id & REMOTE_FLAG),
+                              is_error_frame=bool(can_id & ERROR_FLAG),
+                              dlc=length, data=data)
+
+
+class CanRecorder(can.Listener):
+    """
+    Records every frame of the CAN network in compressed, append-only
+    log files, to reproduce field incidents offline (see CanReplayer).
+
+    The recorder listens on the passive socket of the CanNetwork,
+    separate from the one used by canopen: SocketCAN delivers to it the
+    frames received from the nodes as well as the ones sent by the
+    canopen network, and the canopen notifier thread does no extra
+    work.
+
+    To bound the CPU overhead, frames are packed in a buffer which is
+    compressed (gzip, fastest level) and written at most once every
+    flush_interval seconds, or when it grows over FLUSH_BYTES. When a
+    file exceeds max_file_bytes a new one is started, and only the
+    newest max_files files are kept.
+    """
+    FLUSH_BYTES = 65536
+
+    def __init__(self, channel: str, directory='recordings', max_file_bytes=8 * 1024 * 1024, max_files=20,
+                 flush_interval=1.0):
+        """
+        :param channel: the CANbus interface recorded, used to name the
+            files.
+        :param directory: where the log files are written.
+        :param max_file_bytes: the uncompressed size after which a new
+            file is started.
+        :param max_files: the number of files kept on disk.
+        :param flush_interval: the maximum seconds between two writes.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.channel = channel
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.log_file = None
+        self.buffer = bytearray()
+        self.last_flush = time.monotonic()
+        self.file_bytes = 0
+        self.frames = 0
+        self.error_frames = 0
+        self.files = 0
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.open_file()
+        self.logger.info(f"Recording the {self.channel} traffic in {self.directory}")
+
+    def stop(self) -> None:
+        # Called by the notifier when it is stopped, as required by
+        # can.Listener
+        self.flush(rotate=False)
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    def open_file(self) -> None:
+        # The sequence number keeps apart files started in the same second
+        name = f"{self.channel}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{self.files:04d}.canlog.gz"
+        self.log_file = gzip.open(os.path.join(self.directory, name), 'wb', compresslevel=1)
+        self.log_file.write(MAGIC)
+        self.file_bytes = len(MAGIC)
+        self.files += 1
+        # Remove the oldest files (names sort by date)
+        logs = sorted(name for name in os.listdir(self.directory)
+                      if name.startswith(f"{self.channel}_") and name.endswith(".canlog.gz"))
+        for old_name in logs[:-self.max_files]:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except OSError:
+                self.logger.warning(f"Could not remove the old CAN log {old_name}")
+
+    def flush(self, rotate=True) -> None:
+        if self.buffer and self.log_file is not None:
+            try:
+                self.log_file.write(self.buffer)
+                self.log_file.flush()
+            except OSError as e:
+                self.logger.error(f"Could not write the CAN log: {e}")
+            self.file_bytes += len(self.buffer)
+            self.buffer.clear()
+        self.last_flush = time.monotonic()
+        if rotate and self.log_file is not None and self.file_bytes >= self.max_file_bytes:
+            self.log_file.close()
+            self.open_file()
+
+    def on_message_received(self, message: can.Message) -> None:
+        self.buffer += pack_frame(message)
+        self.frames += 1
+        if message.is_error_frame:
+            self.error_frames += 1
+        if len(self.buffer) >= self.FLUSH_BYTES or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def statistics(self) -> dict:
+        return {"frames": self.frames,
+                "error_frames": self.error_frames,
+                "files": self.files}
@@ -0,0 +1,89 @@
+# Class to play the traffic recorded by a CanRecorder back on a bus.
+import logging
+import time
+import can
+from interfaces.canrecorder import read_log
+
+
+class CanReplayer:
+    """
+    Sends the frames of one or more CAN logs on a bus (usually a vcan
+    interface or a python-can virtual bus), respecting the recorded
+    timing, so that a CanNetwork connected to that bus sees the same
+    traffic the plant produced in the field.
+
+    The timing can be scaled by speed (2 means twice as fast), or
+    ignored altogether with speed 0. With nodes_only, the frames sent
+    by the controller itself (NMT, SYNC, RPDOs, SDO requests) are
+    skipped, so that the controller under test produces its own.
+    """
+    # Function codes (COB-ID & 0x780) of the frames sent by the nodes:
+    # EMCY, TPDO1-4, SDO responses and heartbeats
+    NODE_FUNCTION_CODES = {0x080, 0x180, 0x280, 0x380, 0x480, 0x580, 0x700}
+
+    def __init__(self, paths: list, channel='vcan0', bustype='socketcan', speed=1.0, nodes_only=False):
+        """
+        :param paths: the log files, in chronological order.
+        :param channel: the bus the frames are sent on.
+        :param bustype: the python-can interface type of the bus.
+        :param speed: the replay speed factor. 0 means no waiting.
+        :param nodes_only: if True, only the frames sent by the nodes
+            are replayed.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.paths = paths
+        self.channel = channel
+        self.bustype = bustype
+        self.speed = speed
+        self.nodes_only = nodes_only
+        self.frames = 0
+        self.skipped = 0
+        self.max_lag = 0.0
+
+    def is_replayed(self, message: can.Message) -> bool:
+        if not self.nodes_only:
+            return True
+        # SYNC (0x080) and EMCY share the function code, EMCY has a node id
+        return (not message.is_extended_id and (message.arbitration_id & 0x780) in self.NODE_FUNCTION_CODES
+                and (message.arbitration_id & 0x7F) != 0)
+
+    def run(self, bus=None) -> dict:
+        """
+        Replays the logs.
+
+        :param bus: the bus to send the frames on. If None, a new one is
+            opened on channel.
+        :return: the replay statistics.
+        """
+        own_bus = bus is None
+        if own_bus:
+            bus = can.interface.Bus(channel=self.channel, bustype=self.bustype)
+        first_timestamp = None
+        start = time.perf_counter()
+        try:
+            for path in self.paths:
+                for message in read_log(path):
+                    if not self.is_replayed(message):
+                        self.skipped += 1
+                        continue
+                    if first_timestamp is None:
+                        first_timestamp = message.timestamp
+                    if self.speed > 0:
+                        due = start + (message.timestamp - first_timestamp) / self.speed
+                        delay = due - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                        else:
+                            self.max_lag = max(self.max_lag, -delay)
+                    bus.send(message)
+                    self.frames += 1
+        finally:
+            if own_bus:
+                bus.shutdown()
+        return self.statistics(time.perf_counter() - start)
+
+    def statistics(self, elapsed: float) -> dict:
+        return {"frames": self.frames,
+                "skipped": self.skipped,
+                "elapsed_s": round(elapsed, 3),
+                "max_lag_ms": round(self.max_lag * 1000, 1)}
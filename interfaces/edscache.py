@@ -0,0 +1,167 @@
+# Class to avoid parsing the EDS file and reading the PDO
+# configuration of the nodes more than once.
+import hashlib
+import json
+import logging
+import os
+import pickle
+import canopen
+from canopen.objectdictionary import ODVariable
+
+
+class EdsCache:
+    """
+    Caches what is needed to instantiate a node without parsing the
+    EDS file and without uploading the whole PDO configuration via SDO.
+
+    The EDS is parsed once, for TEMPLATE_NODE_ID, and the object
+    dictionary is pickled on disk, so that a restart does not parse it
+    again. The EDS contains $NODEID expressions (the default COB-IDs),
+    so the dictionary of every node is a copy of the template with
+    those values moved to its node id. The file on disk is named after
+    the hash of the EDS and the canopen version, so editing or
+    replacing the EDS, or upgrading canopen, automatically invalidates
+    the cache.
+
+    The PDO maps of every node are saved on disk too, together with the
+    identity object (0x1018) of the node they were read from. Reading
+    the identity costs four SDO uploads instead of the dozens needed by
+    rpdo.read() and tpdo.read(): if it matches, the cached maps are
+    used, otherwise they are read again from the node.
+    """
+    TEMPLATE_NODE_ID = 0
+    PDO_MAP_ATTRIBUTES = ["cob_id", "enabled", "rtr_allowed", "trans_type", "inhibit_time",
+                          "event_timer", "sync_start_value"]
+
+    def __init__(self, eds_path='LOVATO_VLB3.eds', cache_dir='cache', bus_name='can0'):
+        """
+        :param eds_path: the path of the EDS file.
+        :param cache_dir: the directory of the cache files.
+        :param bus_name: the name of the CANbus interface, since nodes
+            with the same id on different buses have different PDO maps.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.eds_path = eds_path
+        self.cache_dir = cache_dir
+        self.bus_name = bus_name
+        self.dictionaries = {}
+        # The template object dictionary, pickled
+        self.template = None
+        with open(eds_path, 'rb') as eds_file:
+            self.eds_hash = hashlib.sha256(eds_file.read()).hexdigest()[:16]
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __load_template(self) -> bytes:
+        """
+        :return: the pickled template object dictionary, taken from
+                 disk if possible, parsed from the EDS file otherwise.
+        """
+        path = os.path.join(self.cache_dir, f"od_{self.eds_hash}_{canopen.__version__}.pickle")
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as cache_file:
+                    template = cache_file.read()
+                # Checked now, instead of failing for every node later
+                pickle.loads(template)
+                return template
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                self.logger.warning(f"Corrupted object dictionary cache {path}, parsing the EDS again")
+        template = pickle.dumps(canopen.import_od(self.eds_path, self.TEMPLATE_NODE_ID))
+        # Written to a temporary file and then renamed, since in
+        # gateway mode several processes share the cache
+        temporary_path = f"{path}.{os.getpid()}"
+        try:
+            with open(temporary_path, 'wb') as cache_file:
+                cache_file.write(template)
+            os.replace(temporary_path, path)
+        except OSError:
+            self.logger.warning(f"Could not save the object dictionary cache {path}")
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return template
+
+    def get_object_dictionary(self, node_id: int) -> canopen.ObjectDictionary:
+        """
+        :return: the object dictionary of the given node, taken from
+                 memory if possible, copied from the template otherwise.
+        """
+        if node_id in self.dictionaries:
+            return self.dictionaries[node_id]
+        if self.template is None:
+            self.template = self.__load_template()
+        # Unpickling is the cheapest way to get a deep copy
+        od = pickle.loads(self.template)
+        od.node_id = node_id
+        offset = node_id - self.TEMPLATE_NODE_ID
+        for variable in self.__variables(od):
+            if variable.relative and variable.default is not None:
+                variable.default += offset
+            if '$NODEID' in str(getattr(variable, "value_raw", "")).upper() and variable.value is not None:
+                variable.value += offset
+        self.dictionaries[node_id] = od
+        return od
+
+    @staticmethod
+    def __variables(od: canopen.ObjectDictionary):
+        for entry in od.values():
+            if isinstance(entry, ODVariable):
+                yield entry
+            else:
+                yield from entry.values()
+
+    def read_identity(self, node) -> list:
+        """
+        :return: vendor id, product code, revision and serial number of
+                 the node
+        """
+        return [node.sdo[0x1018][subindex].raw for subindex in range(1, 5)]
+
+    def __pdo_path(self, node_id: int) -> str:
+        return os.path.join(self.cache_dir, f"pdo_{self.eds_hash}_{self.bus_name}_{node_id}.json")
+
+    def load_pdo_maps(self, node, identity: list) -> bool:
+        """
+        Configures the RPDOs and TPDOs of the node from the cache, if
+        the cache was saved for a node with the same identity.
+
+        :return: True if the cache was used, False otherwise.
+        """
+        path = self.__pdo_path(node.id)
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return False
+        if cached["identity"] != identity:
+            self.logger.info(f"Node {node.id} has been replaced, its PDO maps will be read again")
+            return False
+        for pdo, maps in ((node.rpdo, cached["rpdo"]), (node.tpdo, cached["tpdo"])):
+            for number, attributes in maps.items():
+                pdo_map = pdo.map[int(number)]
+                for attribute in self.PDO_MAP_ATTRIBUTES:
+                    setattr(pdo_map, attribute, attributes[attribute])
+                pdo_map.clear()
+                for index, subindex, length in attributes["variables"]:
+                    pdo_map.add_variable(index, subindex, length)
+                # Like pdo_map.read() does
+                pdo_map.subscribe()
+        return True
+
+    def save_pdo_maps(self, node, identity: list) -> None:
+        cached = {"identity": identity, "rpdo": {}, "tpdo": {}}
+        for name, pdo in (("rpdo", node.rpdo), ("tpdo", node.tpdo)):
+            for number, pdo_map in pdo.map.items():
+                attributes = {attribute: getattr(pdo_map, attribute) for attribute in self.PDO_MAP_ATTRIBUTES}
+                attributes["variables"] = [[variable.index, variable.subindex, variable.length]
+                                           for variable in pdo_map.map]
+                cached[name][number] = attributes
+        path = self.__pdo_path(node.id)
+        temporary_path = f"{path}.{os.getpid()}"
+        try:
+            with open(temporary_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(temporary_path, path)
+        except OSError:
+            self.logger.warning(f"Could not save the PDO maps cache of node {node.id}")
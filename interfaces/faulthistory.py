@@ -0,0 +1,87 @@
+# Class to keep the history of the faults of the nodes.
+from collections import deque
+from threading import Lock
+
+
+class FaultHistory:
+    """
+    Keeps the faults reported by the nodes with their CANopen EMCY
+    messages: for every node, the last faults with their error code,
+    error register and time, and the fault currently active if any.
+
+    A node reports a fault with an EMCY carrying its error code, and
+    the end of all its faults with an EMCY with error code 0 ("error
+    reset or no error"), which is recorded too.
+
+    Faults are recorded from the CAN notifier thread and read by the
+    CanProcess. Those not yet saved in the database are kept apart, so
+    that they can be saved in batches instead of one by one.
+    """
+    NO_ERROR = 0x0000
+
+    def __init__(self, capacity=32, max_unsaved=1000):
+        """
+        :param capacity: the number of faults kept for every node.
+        :param max_unsaved: the maximum number of faults waiting to be
+            saved. If the database can't keep up, the oldest are lost.
+        """
+        self.capacity = capacity
+        self.lock = Lock()
+        self.faults = {}
+        self.active = {}
+        self.unsaved = deque(maxlen=max_unsaved)
+        self.count = 0
+
+    def record(self, node_id: int, code: int, register: int, timestamp: float, description='') -> dict:
+        """
+        :param node_id: the node that sent the EMCY.
+        :param code: the EMCY error code.
+        :param register: the error register (object 0x1001).
+        :param timestamp: the time the EMCY was received, as time.time().
+        :param description: the description of the error code.
+        :return: the fault, as a dict.
+        """
+        fault = {"node": node_id, "code": code, "register": register, "timestamp": timestamp,
+                 "description": description}
+        with self.lock:
+            if node_id not in self.faults:
+                self.faults[node_id] = deque(maxlen=self.capacity)
+            self.faults[node_id].append(fault)
+            if code == self.NO_ERROR:
+                self.active.pop(node_id, None)
+            else:
+                self.active[node_id] = fault
+                self.count += 1
+            self.unsaved.append(fault)
+        return fault
+
+    def load(self, faults: list) -> None:
+        """
+        Restores the history saved in the database, oldest fault
+        first. Active faults are not restored: the nodes send their
+        EMCY again if the fault is still there after a restart.
+        """
+        with self.lock:
+            for fault in faults:
+                if fault["node"] not in self.faults:
+                    self.faults[fault["node"]] = deque(maxlen=self.capacity)
+                self.faults[fault["node"]].append(fault)
+
+    def take_unsaved(self) -> list:
+        """
+        :return: the faults recorded since the last call, oldest first.
+        """
+        with self.lock:
+            faults = list(self.unsaved)
+            self.unsaved.clear()
+        return faults
+
+    def history(self) -> dict:
+        """
+        :return: for every node id, its active fault (or None) and its
+                 last faults, oldest first.
+        """
+        with self.lock:
+            return {node_id: {"active": self.active.get(node_id), "faults": list(faults)}
+                    for node_id, faults in self.faults.items()}
+
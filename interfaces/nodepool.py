@@ -0,0 +1,105 @@
+# Class to talk to several nodes of the CAN network at once.
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock
+
+
+class NodePool:
+    """
+    Executes the same operation (SDO transfers, controlword sequences,
+    initialization...) on several nodes concurrently, and gathers the
+    results.
+
+    Every node has its own SDO channel, so transfers to different
+    nodes can be outstanding at the same time, while the transfers to
+    the same node must not overlap: a lock per node guarantees that
+    there is at most one operation in progress on each node. The time
+    of a multi-node operation is then the time of the slowest node
+    instead of the sum of all of them.
+
+    The sum of the single node times and the actual elapsed time are
+    collected, to measure the gain.
+    """
+
+    def __init__(self, max_workers=8):
+        """
+        :param max_workers: the maximum number of nodes handled at the
+            same time.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="node_pool")
+        self.locks = {}
+        self.locks_lock = Lock()
+        self.operations = 0
+        self.node_time = 0.0
+        self.elapsed_time = 0.0
+
+    def lock(self, node_id: int) -> RLock:
+        """
+        :return: the lock to be held while talking to the node.
+        """
+        with self.locks_lock:
+            if node_id not in self.locks:
+                self.locks[node_id] = RLock()
+            return self.locks[node_id]
+
+    def submit(self, node_id: int, function, *args):
+        """
+        Calls function(*args) in the background, holding the lock of
+        the node, for long operations on a single node that must not
+        block the caller.
+
+        :return: the concurrent.futures.Future of the call.
+        """
+        return self.executor.submit(self.__run_locked, node_id, function, args)
+
+    def __run_locked(self, node_id, function, args):
+        with self.lock(node_id):
+            return function(*args)
+
+    def __run(self, function, node, args):
+        start = time.perf_counter()
+        with self.lock(node.id):
+            result = function(node, *args)
+        return result, time.perf_counter() - start
+
+    def map(self, function, nodes: list, *args) -> dict:
+        """
+        Calls function(node, *args) for every node, concurrently, and
+        waits for all of them to complete.
+
+        :return: a dict with the result of every node id. If the
+                 function raised an exception, the exception is the
+                 result.
+        """
+        start = time.perf_counter()
+        results = {}
+        if len(nodes) == 1:
+            # Not worth a thread
+            futures = None
+            try:
+                results[nodes[0].id], node_time = self.__run(function, nodes[0], args)
+            except Exception as e:
+                results[nodes[0].id], node_time = e, 0.0
+        else:
+            futures = {node.id: self.executor.submit(self.__run, function, node, args) for node in nodes}
+            node_time = 0.0
+            for node_id, future in futures.items():
+                try:
+                    results[node_id], elapsed = future.result()
+                    node_time += elapsed
+                except Exception as e:
+                    results[node_id] = e
+        self.operations += 1
+        self.node_time += node_time
+        self.elapsed_time += time.perf_counter() - start
+        return results
+
+    def statistics(self) -> dict:
+        """
+        :return: the number of multi-node operations, and the ratio
+                 between the time they would have taken node by node
+                 and the time they actually took.
+        """
+        speedup = self.node_time / self.elapsed_time if self.elapsed_time > 0 else 1
+        return {"operations": self.operations,
+                "speedup": round(speedup, 2)}
@@ -0,0 +1,163 @@
+# Class to supervise the nodes of the CAN network while running.
+import logging
+import time
+from threading import Lock
+
+
+class NodeSupervisor:
+    """
+    Keeps the list of nodes of a CanNetwork up to date without
+    stopping the control loop, by listening to the NMT heartbeat and
+    boot-up messages (COB-ID 0x700 + node id).
+
+     - A boot-up message (state 0) means that the node has just been
+       powered up or has rebooted: it is attached if unknown, or
+       initialized again if already known.
+     - A heartbeat from a node that was never initialized (e.g. it was
+       powering up during the scan) attaches it too. If attaching it
+       fails, the heartbeats are ignored for a delay that doubles at
+       every failure, from RETRY_DELAY up to MAX_RETRY_DELAY, while a
+       boot-up message is always handled at once.
+     - A node that has been configured to produce heartbeats and does
+       not send any for more than heartbeat_timeout seconds is marked
+       as silent, until its heartbeats come back.
+
+    The heartbeats arrive on the CAN notifier thread, which only
+    starts the initialization: it takes several hundred milliseconds,
+    so it runs on the NodePool of the network, holding the lock of the
+    node, and neither the notifier nor the control loop wait for it.
+    Until it is completed the node is not available, and the control
+    loop leaves it out.
+
+    The time between the boot-up message and the node being available
+    is recorded as discovery latency.
+    """
+    ACTIVE = "active"
+    SILENT = "silent"
+    INITIALIZING = "initializing"
+    # Seconds before retrying a node that could not be attached
+    RETRY_DELAY = 5.0
+    MAX_RETRY_DELAY = 300.0
+
+    def __init__(self, can_network, heartbeat_timeout=2.0):
+        """
+        :param can_network: the CanNetwork whose nodes are supervised.
+        :param heartbeat_timeout: seconds without heartbeats after
+            which a node is considered silent.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.can_network = can_network
+        self.heartbeat_timeout = heartbeat_timeout
+        self.lock = Lock()
+        self.status = {}
+        self.last_seen = {}
+        self.heartbeat_nodes = set()
+        # Failed nodes: the time of the next attempt, and the delay
+        # after the next failure
+        self.retry_after = {}
+        self.retry_delay = {}
+        self.started = False
+        self.discoveries = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def start(self) -> None:
+        if self.started:
+            return
+        for node_id in range(1, 0x80):
+            self.can_network.network.subscribe(0x700 + node_id, self.on_heartbeat)
+        self.started = True
+
+    def expect_heartbeat(self, node_id: int) -> None:
+        with self.lock:
+            self.heartbeat_nodes.add(node_id)
+            self.last_seen[node_id] = time.monotonic()
+
+    def is_available(self, node_id: int) -> bool:
+        return self.status.get(node_id, self.ACTIVE) == self.ACTIVE
+
+    def is_initializing(self, node_id: int) -> bool:
+        return self.status.get(node_id) == self.INITIALIZING
+
+    def on_heartbeat(self, can_id: int, data: bytearray, timestamp: float) -> None:
+        """
+        Callback of the CAN notifier thread: it must return quickly, so
+        the initialization is only started here.
+        """
+        node_id = can_id - 0x700
+        now = time.monotonic()
+        with self.lock:
+            self.last_seen[node_id] = now
+            status = self.status.get(node_id)
+            if status == self.INITIALIZING:
+                return
+            boot_up = len(data) > 0 and data[0] & 0x7F == 0
+            known = self.can_network.get_node(node_id) is not None
+            if boot_up or not known:
+                if not boot_up and now < self.retry_after.get(node_id, 0):
+                    return
+                self.status[node_id] = self.INITIALIZING
+                self.can_network.node_pool.submit(node_id, self.initialize, node_id, now)
+            elif status == self.SILENT:
+                self.logger.info(f"Node {node_id} is sending heartbeats again")
+                self.status[node_id] = self.ACTIVE
+
+    def initialize(self, node_id: int, detected: float) -> None:
+        """
+        Initializes a node that has booted up, or attaches a new one.
+        Run on the NodePool, see on_heartbeat.
+
+        :param detected: the time.monotonic() value of the message that
+            triggered the initialization.
+        :return: None
+        """
+        try:
+            self.can_network.reinitialize_node(node_id)
+        except Exception as e:
+            with self.lock:
+                delay = self.retry_delay.get(node_id, self.RETRY_DELAY)
+                self.retry_after[node_id] = time.monotonic() + delay
+                self.retry_delay[node_id] = min(2 * delay, self.MAX_RETRY_DELAY)
+                self.status[node_id] = self.SILENT
+            self.logger.error(f"Could not initialize node {node_id}: {e}."
+                              f" Retrying in {delay:.0f}s or at its next boot-up")
+            return
+        latency = time.monotonic() - detected
+        with self.lock:
+            self.retry_after.pop(node_id, None)
+            self.retry_delay.pop(node_id, None)
+            self.status[node_id] = self.ACTIVE
+            self.last_seen[node_id] = time.monotonic()
+            self.discoveries += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+        self.logger.info(f"Node {node_id} available {latency:.3f}s after its boot-up")
+
+    def check_silent_nodes(self) -> list:
+        """
+        Marks as silent the nodes whose heartbeats stopped. Meant to be
+        called periodically by the control loop; it never blocks.
+
+        :return: the ids of the silent nodes.
+        """
+        now = time.monotonic()
+        silent = []
+        with self.lock:
+            for node_id in self.heartbeat_nodes:
+                status = self.status.get(node_id, self.ACTIVE)
+                if status == self.ACTIVE and now - self.last_seen.get(node_id, now) > self.heartbeat_timeout:
+                    self.logger.warning(f"Node {node_id} stopped sending heartbeats")
+                    self.status[node_id] = self.SILENT
+                    status = self.SILENT
+                if status == self.SILENT:
+                    silent.append(node_id)
+        return silent
+
+    def statistics(self) -> dict:
+        with self.lock:
+            average = self.latency_sum / self.discoveries if self.discoveries > 0 else 0
+            return {"discoveries": self.discoveries,
+                    "discovery_latency_avg_ms": round(average * 1000, 3),
+                    "discovery_latency_max_ms": round(self.latency_max * 1000, 3),
+                    "silent_nodes": sorted(node_id for node_id, status in self.status.items()
+                                           if status == self.SILENT)}
@@ -0,0 +1,78 @@
+# Class to keep track of the setpoints sent to the nodes.
+import time
+from threading import Lock
+
+
+class OutputImage:
+    """
+    The image of every setpoint (controlword, target velocity...)
+    last written to the nodes, keyed by node id and object name. The
+    values are raw, as encoded on the bus.
+
+    CanNetwork checks it before every write: a value identical to the
+    one already on the bus is suppressed, so that the control loop can
+    set its outputs at every step without generating any traffic. The
+    time between the request and the moment the new value is handed to
+    the bus is collected as the command-to-bus latency.
+
+    Nodes may be written from the threads of the NodePool, so the
+    counters are updated under a lock.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.lock = Lock()
+        self.writes = 0
+        self.suppressed = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def get(self, node_id: int, name: str, default=None):
+        return self.values.get((node_id, name), default)
+
+    def is_changed(self, node_id: int, name: str, value) -> bool:
+        """
+        :return: True if value differs from the one last written to
+                 the given object of the given node, False otherwise.
+        """
+        if (node_id, name) in self.values and self.values[(node_id, name)] == value:
+            with self.lock:
+                self.suppressed += 1
+            return False
+        return True
+
+    def commit(self, node_id: int, name: str, value, requested: float) -> None:
+        """
+        Records a value as written to the bus.
+
+        :param requested: the time.perf_counter() value taken when the
+            write was requested.
+        :return: None
+        """
+        latency = time.perf_counter() - requested
+        with self.lock:
+            self.values[(node_id, name)] = value
+            self.writes += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def forget(self, node_id: int) -> None:
+        """
+        Forgets every value of a node, so that the next writes are
+        sent regardless. Needed when the node state is unknown, for
+        example after its (re)initialization.
+        """
+        with self.lock:
+            for key in [key for key in self.values if key[0] == node_id]:
+                del self.values[key]
+
+    def statistics(self) -> dict:
+        """
+        :return: the number of writes sent and suppressed, and the
+                 average and maximum command-to-bus latency in ms.
+        """
+        average = self.latency_sum / self.writes if self.writes > 0 else 0
+        return {"writes": self.writes,
+                "suppressed": self.suppressed,
+                "latency_avg_ms": round(average * 1000, 3),
+                "latency_max_ms": round(self.latency_max * 1000, 3)}
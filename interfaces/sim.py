@@ -5,6 +5,7 @@ from sys import platform
 from threading import Thread
 from threading import Event
 import os
+import shutil
 import serial
 import logging
 import subprocess
@@ -40,7 +41,14 @@ class Sim:
         disconnected. The user should never modify this directly.
     """
 
-    def __init__(self, autoconnect=False, apn='ibox.tim.it', max_retries=5, interface='/dev/ttyUSB0'):
+    # Access technologies reported by AT+COPS?
+    TECHNOLOGIES = {0: "2G", 1: "2G", 2: "3G", 3: "2G", 4: "3G", 5: "3G", 6: "3G", 7: "4G"}
+    # Flags of /sys/class/net/<interface>/flags
+    IFF_UP = 0x1
+    IFF_RUNNING = 0x40
+
+    def __init__(self, autoconnect=False, apn='ibox.tim.it', max_retries=5, interface='/dev/ttyUSB0',
+                 status_interface='/dev/ttyUSB2', ppp_interface='ppp0', status_ttl=30):
         """
         The constructor checks that all the requirements are met
         and initializes class variables.
@@ -62,6 +70,13 @@ class Sim:
             thread will try to execute a command before giving up.
         :param interface: the interface to use for serial
             communication with the modem.
+        :param status_interface: the secondary AT port of the modem,
+            which stays available while the PPP link uses interface.
+            It is used to read the registration, the signal quality
+            and the access technology.
+        :param ppp_interface: the network interface created by pppd.
+        :param status_ttl: seconds for which the link status read from
+            the modem is considered valid.
         """
 
         self.logger = logging.getLogger(__name__)
@@ -73,6 +88,11 @@ class Sim:
         self.connection_t = Thread(target=self.connection_thread)
         self.connection_t.daemon = True
         self.interface = interface
+        self.status_interface = status_interface
+        self.ppp_interface = ppp_interface
+        self.status_ttl = status_ttl
+        self.link_status = None
+        self.link_status_time = None
 
         if platform != "linux":
             self.logger.error("This software is designed to run on a Raspberry Pi or a linux system with a 3G modem"
@@ -83,19 +103,11 @@ class Sim:
             self.logger.error("This software is designed to run as root in order to make use of the modem.")
             raise OSError("This software is designed to run as root in order to make use of the modem")
         else:
-            packages = ["ppp", "wvdial", "screen", "sakis3g"]
-            for package in packages:
-                data = subprocess.Popen("whereis {}".format(package), shell=True,
-                                        encoding="utf-8", stdout=subprocess.PIPE)
-                output = data.communicate()
-                # Output is in form "package: path/package \n" or
-                # "package: \n" if not found.
-                output = output[0].split('\n')
-                # now output is ("package: path/package", "")
-                output = output[0].split(':')
-                # now output is ("package", "path/package") or ("package", "")
-                output = output[1]
-                if len(output) > 0:
+            # The executable of every package is looked up in the PATH,
+            # without spawning a process for each one
+            packages = {"ppp": "pppd", "wvdial": "wvdial", "screen": "screen", "sakis3g": "sakis3g"}
+            for package, executable in packages.items():
+                if shutil.which(executable) is not None:
                     self.logger.info("{} is installed and working.".format(package))
                 else:
                     self.logger.error("Could not find package {0} in the system path. Please install {0} before"
@@ -144,8 +156,13 @@ class Sim:
 
     def get_imei(self, reboot_on_fail=False) -> str:
         """
-        Returns the imei of the 2G/3G modem connected on the interface
-        /dev/ttyUSB0
+        Returns the imei of the 2G/3G modem.
+
+        The imei is first asked on the secondary AT port, which stays
+        available while the PPP link is up, so that the modem does not
+        have to be disconnected. If that fails, it is read from the
+        main interface as below, which requires the modem to be
+        disconnected.
 
         The function opens a serial communication, then sends the
         AT+GSN command to the modem. After a brief time.sleep() to let
@@ -165,7 +182,15 @@ class Sim:
         """
         if self.imei is not None:
             return self.imei
-        elif self.wants_connection.is_set():
+        try:
+            with serial.Serial(self.status_interface, 115200, timeout=0.5) as modem:
+                lines = self.__at_command(modem, "AT+GSN")
+            if lines and len(lines[0]) >= 10:
+                self.imei = lines[0]
+                return self.imei
+        except (serial.SerialException, OSError) as e:
+            self.logger.warning(f"Could not read the IMEI from {self.status_interface}: {e}")
+        if self.wants_connection.is_set():
             # Cannot provide an Imei if the modem is connected and no
             # imei was previously found
             self.logger.error("Cannot get the modem's IMEI while the user"
@@ -188,6 +213,59 @@ class Sim:
                 raise IOError("Could not get the IMEI.")
             return self.imei
 
+    def read_imei(self, stored_imei=None, stored_identity=None) -> str:
+        """
+        Reads the IMEI at startup without tearing down a PPP link left
+        up by a previous run: the IMEI is read on the secondary AT port
+        (see get_imei) or, if the port does not answer, the stored IMEI
+        is used as long as the USB identity of the modem is the stored
+        one. Only as a last resort the modem is disconnected to read
+        the IMEI on its main port.
+
+        :param stored_imei: the IMEI saved in the database, or None if
+            there is none yet.
+        :param stored_identity: the USB identity of the modem saved in
+            the database (see get_usb_identity).
+        :return: the IMEI of the modem.
+        """
+        identity = self.get_usb_identity()
+        try:
+            return self.get_imei()
+        except OSError:
+            if self.__connected.is_set() and stored_imei is not None \
+                    and identity is not None and identity == stored_identity:
+                self.logger.info("Modem already connected, using the stored IMEI")
+                self.imei = stored_imei
+                return self.imei
+            if self.__connected.is_set():
+                self.disconnect()
+            return self.get_imei()
+
+    def get_usb_identity(self):
+        """
+        Reads the vendor id, the product id and, if any, the serial
+        number of the USB modem from sysfs. It is a cheap check that the
+        modem is the same as last time, but not a proof: modems without
+        a serial number all have the same identity.
+
+        :return: a "vendor:product:serial" string, or None if the
+                 interface is not an USB device.
+        """
+        path = os.path.realpath(f"/sys/class/tty/{os.path.basename(self.interface)}/device")
+        # Walk up from the tty to the USB device it belongs to
+        for _ in range(4):
+            if os.path.exists(os.path.join(path, "idVendor")):
+                fields = []
+                for name in ("idVendor", "idProduct", "serial"):
+                    try:
+                        with open(os.path.join(path, name), 'r') as field_file:
+                            fields.append(field_file.read().strip())
+                    except OSError:
+                        fields.append("")
+                return ":".join(fields)
+            path = os.path.dirname(path)
+        return None
+
     def __disconnect_command(self) -> bool:
         """
         Disconnects the 2G/3G modem using the sakis3g script
@@ -232,26 +310,96 @@ class Sim:
 
     def __is_connected(self) -> bool:
         """
-        Gets the connection state using the sakis3g script.
-        WARNING: This is blocking and may take several seconds.
-
-        This method is intended to be used solely in the
-        connection_thread as it may block the execution for a long
-        time. It determines the state of the connection by reading
-        the exit value of the "sakis3g connected" command.
+        Gets the connection state from the flags of the PPP network
+        interface in sysfs: the link is connected if the interface
+        exists and is both up and running. Reading a file in sysfs
+        takes microseconds, so unlike the "sakis3g connected" command
+        this can be called as often as needed.
 
         :return: True if connected, False otherwise
         """
-        completed_process = subprocess.run(["sakis3g", "connected"], stdout=subprocess.DEVNULL,
-                                           stderr=subprocess.DEVNULL)
-        return_value = completed_process.returncode
-        if return_value == 0:
+        try:
+            with open(f"/sys/class/net/{self.ppp_interface}/flags", 'r') as flags_file:
+                flags = int(flags_file.read().strip(), 16)
+        except (OSError, ValueError):
+            flags = 0
+        if flags & self.IFF_UP and flags & self.IFF_RUNNING:
             self.__connected.set()
             return True
         else:
             self.__connected.clear()
             return False
 
+    @staticmethod
+    def __at_command(modem: serial.Serial, command: str) -> list:
+        """
+        Sends an AT command and reads the reply until OK or ERROR, or
+        until a read hits the serial timeout. The modem separates the
+        lines of a reply with blank lines, which are skipped.
+
+        :return: the lines of the reply, without the echo of the
+                 command, the blank lines and the final OK.
+        """
+        modem.reset_input_buffer()
+        modem.write(f"{command}\r".encode())
+        lines = []
+        while True:
+            raw = modem.readline()
+            if not raw:
+                # Nothing was received before the timeout expired
+                break
+            line = raw.decode(errors="ignore").strip()
+            if line == "OK" or "ERROR" in line:
+                break
+            if line != "" and line != command:
+                lines.append(line)
+        return lines
+
+    def get_link_status(self) -> dict:
+        """
+        Returns the state of the radio link, read from the secondary
+        AT port of the modem. The result is cached for status_ttl
+        seconds, so that this method can be called frequently.
+
+        The dictionary contains:
+         - connected: True if the PPP link is up
+         - registered: True if the modem is registered to the network
+         - signal: the RSSI reported by AT+CSQ (0-31, 99 if unknown)
+         - signal_dbm: the RSSI in dBm, or None if unknown
+         - technology: "2G", "3G", "4G" or None if unknown
+         - available: False if the modem could not be queried, in
+           which case only "connected" is reliable
+
+        :return: the link status dictionary
+        """
+        now = time.monotonic()
+        if self.link_status is not None and now - self.link_status_time < self.status_ttl:
+            self.link_status["connected"] = self.__is_connected()
+            return self.link_status
+        status = {"connected": self.__is_connected(), "registered": False, "signal": 99, "signal_dbm": None,
+                  "technology": None, "available": True}
+        try:
+            with serial.Serial(self.status_interface, 115200, timeout=0.5) as modem:
+                for line in self.__at_command(modem, "AT+CSQ"):
+                    if line.startswith("+CSQ:"):
+                        status["signal"] = int(line.split(':')[1].split(',')[0])
+                for line in self.__at_command(modem, "AT+CREG?"):
+                    if line.startswith("+CREG:"):
+                        # 1: registered, home network. 5: registered, roaming
+                        status["registered"] = int(line.split(',')[1]) in (1, 5)
+                for line in self.__at_command(modem, "AT+COPS?"):
+                    fields = line.split(',')
+                    if line.startswith("+COPS:") and len(fields) >= 4:
+                        status["technology"] = self.TECHNOLOGIES.get(int(fields[3]))
+        except (serial.SerialException, OSError, ValueError, IndexError) as e:
+            self.logger.warning(f"Could not read the link status from {self.status_interface}: {e}")
+            status["available"] = False
+        if status["signal"] != 99:
+            status["signal_dbm"] = -113 + 2 * status["signal"]
+        self.link_status = status
+        self.link_status_time = now
+        return status
+
     def connection_thread(self) -> None:
         """
         The heart of this class, meant to be used as a separate
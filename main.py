@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 from multiprocessing import Queue
 import logging
+import time
 from datetime import datetime
 from pathlib import Path
 from processes.canprocess import CanProcess
 from processes.socketprocess import SocketProcess
-from interfaces.sim import Sim
+from processes.transport import create_transport
 import os
+import re
 import configparser
 from picandb.settingsmanager import SettingsManager
 
@@ -16,7 +18,12 @@ def create_config(cfg: configparser.ConfigParser):
     cfg['Dati impianto'] = {
         'codice_impianto': 'default',
         'indirizzo_server': 'ggh.zapto.org',
-        'porta_server': '37863'}
+        'porta_server': '37863',
+        '# Default usa_tls': 'False. Scrivere True per cifrare la connessione con il server',
+        'usa_tls': 'False',
+        '# Default certificato_server': ". Percorso del certificato con cui verificare quello del server."
+                                        " Se vuoto, si usano i certificati di sistema",
+        'certificato_server': ''}
     cfg['Impostazioni chiavetta'] = {
         '# Default usa_chiavetta': 'True. Scrivere False (con la maiuscola!) per usare il Wi-Fi',
         'usa_chiavetta': 'True',
@@ -60,22 +67,94 @@ def create_config(cfg: configparser.ConfigParser):
         'interface_name': 'can0',
         '# Default bustype': 'socketcan. Socket type for the connection.'
                              ' On linux-based systems, it should be socketcan',
-        'bustype': 'socketcan'
+        'bustype': 'socketcan',
+        '# Default registrazione': '. Cartella in cui registrare tutto il traffico CANBus, per analizzare i guasti.'
+                                   ' Se vuoto, il traffico non viene registrato',
+        'registrazione': ''
+    }
+    cfg['Gateway'] = {
+        '# Default impianti': '. Per gestire piu impianti, ognuno sul proprio bus CAN, elencarli come'
+                              ' codice:interfaccia separati da virgole (es. skid1:can0, skid2:can1).'
+                              ' Se vuoto, si usa solo interface_name',
+        'impianti': ''
+    }
+    cfg['Processi'] = {
+        '# Default trasporto': 'pipe. Canale di comunicazione tra i processi: pipe (piu veloce) oppure queue',
+        'trasporto': 'pipe'
     }
     with open('settings.cfg', 'w', encoding='utf-8') as configfile:
         cfg.write(configfile)
 
 
+class StartupPhases:
+    """
+    Measures the duration of the startup phases of the main process.
+    The later phases are reported by the processes that complete them:
+    the CANbus bring-up by each CanProcess, the modem and the first
+    server response by the SocketProcess.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.started = {}
+        self.durations = {}
+
+    def start(self, name):
+        self.started[name] = time.monotonic()
+
+    def end(self, name):
+        self.durations[name] = time.monotonic() - self.started[name]
+
+    def report(self):
+        for name, duration in self.durations.items():
+            self.logger.info(f"Startup phase {name}: {duration:.3f}s")
+
+
+def parse_installations(value: str) -> list:
+    """
+    Parses the installations of the gateway mode.
+
+    :param value: a comma separated list of code:interface entries.
+        The codes may only contain letters, digits, "_" and "-", as
+        they prefix the commands of the server and name the tables of
+        the database.
+    :return: a list of (code, interface name) tuples, empty if value is
+             empty.
+    :raises ValueError: if an entry is malformed or a code is invalid
+            or duplicated.
+    """
+    installations = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if ':' not in entry:
+            raise ValueError(f"Invalid installation {entry} in [Gateway] impianti: expected code:interface")
+        code, interface_name = (part.strip() for part in entry.split(':', 1))
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", code):
+            raise ValueError(f"Invalid installation code {code} in [Gateway] impianti: only letters, digits,"
+                             f" _ and - are allowed")
+        if not interface_name:
+            raise ValueError(f"Missing CAN interface for installation {code} in [Gateway] impianti")
+        if any(code == other for other, _ in installations):
+            raise ValueError(f"Duplicated installation code {code} in [Gateway] impianti")
+        installations.append((code, interface_name))
+    return installations
+
+
 def main():
-    # Two separate queues will allow IPC
-    # The can_interface_process will put on can_to_socket_queue
-    # results and information. It will get from socket_to_can_queue
+    # A read and a write queue for each process will allow IPC
+    # (see processes.transport: by default both are the two ends of
+    # a single Pipe)
+    # The can_interface_process will put on its write queue
+    # results and information. It will get from its read queue
     # commands to be executed.
-    # The socket_interface_process will put on socket_to_can_queue
-    # commands received from the socket. It will read from
-    # can_to_socket_queue the results and the information and
+    # The socket_interface_process will put on its write queue
+    # commands received from the socket. It will read from its
+    # read queue the results and the information and
     # send them to the server via the socket
     # WARNING: database exceptions are not catched, as there should be none!
+    start_time = time.monotonic()
     now = datetime.now()
     directory = Path("logs/")
     filename = now.strftime("%Y-%m-%d_%H-%M-%S")
@@ -84,13 +163,10 @@ def main():
     logging.basicConfig(level=logging.INFO, filename=filename, format="[%(asctime)s][%(levelname)s] %(message)s")
     logger = logging.getLogger(__name__)
     logger.info("Logger ready")
-
-    # Prepare the database
-    logger.info("Checking database state")
-    settings = SettingsManager("piCANclient.db")
-    old_imei = settings.get_setting("IMEI_impianto")
+    phases = StartupPhases()
 
     # Create/Load the settings
+    phases.start("config")
     c = configparser.ConfigParser()
     if not os.path.exists('settings.cfg'):
         create_config(c)
@@ -98,6 +174,9 @@ def main():
     installation_code = c['Dati impianto']['codice_impianto']
     server_address = c['Dati impianto']['indirizzo_server']
     port = int(c['Dati impianto']['porta_server'])
+    # Older settings.cfg files may not have the TLS options
+    use_tls = c['Dati impianto'].get('usa_tls', 'False') == 'True'
+    ca_file = c['Dati impianto'].get('certificato_server', '') or None
     use_modem = c['Impostazioni chiavetta']['usa_chiavetta']
     if use_modem == 'True':
         use_modem = True
@@ -117,54 +196,75 @@ def main():
     can_bitrate = int(c['CANBus']['bitrate'])
     can_interface_name = c['CANBus']['interface_name']
     can_bustype = c['CANBus']['bustype']
-    settings.update_setting('Codice_Impianto', installation_code)
-    settings.update_setting('impianto_TL_Counter_SetCounter', tl_limit)
-    settings.update_setting('impianto_RB_Counter_SetCounter', rb_limit)
-    settings.update_setting('impianto_BK_Counter_SetCounter', bk_limit)
-    settings.update_setting('Pressione_Uscita_Max', max_outlet_pressure)
-    settings.update_setting('Pressione_Ingresso_Min', min_inlet_pressure)
-    settings.update_setting('Pressione_Ingresso_Max', max_inlet_pressure)
-    settings.update_setting('AntisgoccPeriodoControllo', anti_drip_time_limit)
-    settings.update_setting('AntisgoccNpartenze', anti_drip_start_count_limit)
-    settings.update_setting('AntisgoccDurataPartenze', anti_drip_min_period)
-
-    can_to_socket_queue = Queue()
-    socket_to_can_queue = Queue()
-    can_process = CanProcess(socket_to_can_queue, can_to_socket_queue,
-                             bitrate=can_bitrate, interface_name=can_interface_name,
-                             bustype=can_bustype)
-    can_process.start()
+    # Older settings.cfg files may not have the recording option
+    record_directory = c['CANBus'].get('registrazione', '') or None
+    # In gateway mode there is an installation for every CANbus. Otherwise
+    # the only installation has no code, so that its settings are stored
+    # in the usual database
+    installations = []
+    if c.has_section('Gateway'):
+        installations = parse_installations(c['Gateway'].get('impianti', ''))
+    if not installations:
+        installations = [(None, can_interface_name)]
+    # Older settings.cfg files may not have the Processi section
+    ipc_transport = c['Processi'].get('trasporto', 'pipe') if c.has_section('Processi') else 'pipe'
+    phases.end("config")
+
+    # Prepare the database
+    phases.start("database")
+    logger.info("Checking database state")
+    for code, _ in installations:
+        installation_settings = SettingsManager("piCANclient.db", code)
+        installation_settings.update_setting('Codice_Impianto', installation_code if code is None else code)
+        installation_settings.update_setting('impianto_TL_Counter_SetCounter', tl_limit)
+        installation_settings.update_setting('impianto_RB_Counter_SetCounter', rb_limit)
+        installation_settings.update_setting('impianto_BK_Counter_SetCounter', bk_limit)
+        installation_settings.update_setting('Pressione_Uscita_Max', max_outlet_pressure)
+        installation_settings.update_setting('Pressione_Ingresso_Min', min_inlet_pressure)
+        installation_settings.update_setting('Pressione_Ingresso_Max', max_inlet_pressure)
+        installation_settings.update_setting('AntisgoccPeriodoControllo', anti_drip_time_limit)
+        installation_settings.update_setting('AntisgoccNpartenze', anti_drip_start_count_limit)
+        installation_settings.update_setting('AntisgoccDurataPartenze', anti_drip_min_period)
+    phases.end("database")
+    phases.report()
+
+    # The CANbus bring-up happens in the CanProcesses, in parallel. Each
+    # bus has its own process, so that they run on different cores
+    can_processes = []
+    queues = []
+    # The faults of all the installations are pushed to the server
+    alarm_queue = Queue()
+    for code, interface_name in installations:
+        can_read_queue, can_write_queue, socket_read_queue, socket_write_queue = create_transport(ipc_transport)
+        can_process = CanProcess(can_read_queue, can_write_queue,
+                                 bitrate=can_bitrate, interface_name=interface_name,
+                                 bustype=can_bustype, namespace=code, record_directory=record_directory,
+                                 alarm_queue=alarm_queue, start_time=start_time)
+        can_process.start()
+        can_processes.append(can_process)
+        queues.append((code, socket_read_queue, socket_write_queue))
 
+    # The modem is brought up by the SocketProcess, which uses it. No
+    # thread is started in this process, so that the processes are
+    # never forked while another thread may hold a lock
     if use_modem:
-        logger.info("Preparing GSM modem")
-        sim = Sim(apn=apn, max_retries=max_retries)
-        if sim.is_connected():
-            sim.disconnect()
-        new_imei = sim.get_imei()
-        sim.connect()
-
-        # If the old imei is the default, then replace it.
-        # If the old imei is not the default and the new is different,
-        # the modem has been replaced, so an exception is raised
-        if old_imei == settings.DEFAULT_IMEI:
-            settings.update_setting("IMEI_impianto", new_imei)
-        elif new_imei != old_imei:
-            settings.update_setting("IMEI_impianto_OK", 0)
-            logger.error("Modem IMEI has changed unexpectedly. Reset the database or plug in the old modem")
-            raise IOError("Modem IMEI has changed unexpectedly. Reset the database or plug in the old modem")
-        settings.update_setting("IMEI_impianto_OK", 1)
-        imei = new_imei
+        modem = {"apn": apn, "max_retries": max_retries}
+        imei = None
     else:
-        sim = None
+        modem = None
         imei = '111222333444555'
 
-    socket_process = SocketProcess(can_to_socket_queue, socket_to_can_queue,
-                                   imei, sim=sim, server_address=server_address, port=port)
+    _, socket_read_queue, socket_write_queue = queues[0]
+    socket_process = SocketProcess(socket_read_queue, socket_write_queue,
+                                   imei, modem=modem, server_address=server_address, port=port,
+                                   use_tls=use_tls, ca_file=ca_file, start_time=start_time,
+                                   installations=queues, alarm_queue=alarm_queue)
     socket_process.start()
 
     # Nothing else needs to be done
     socket_process.join()
-    can_process.join()
+    for can_process in can_processes:
+        can_process.join()
 
 
 if __name__ == "__main__":
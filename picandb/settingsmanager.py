@@ -1,3 +1,4 @@
+import os
 import time
 from picandb.dblink import DBLink
 import logging
@@ -81,10 +82,48 @@ class SettingsManager(DBLink):
                      "START_pompa_3",
                      "START_pompa_4",
                      "START_pompa_5",
-                     "START_pompa_6"]
+                     "START_pompa_6",
+                     "PID_Kp",
+                     "PID_Ki",
+                     "PID_Kd",
+                     "PID_Periodo",
+                     "PID_Rampa",
+                     "PID_Isteresi",
+                     "Staging_Soglia_Aggiunta",
+                     "Staging_Soglia_Rimozione",
+                     "Antisgocc_Partenze",
+                     "Modem_Identita"]
+    # Runtime counters of the single pumps, updated like the TL/BK/RB ones
+    SETTINGS_LIST += [f"impianto_Pompa_{n}_Counter_{unit}" for n in range(1, 7) for unit in ("sec", "min", "hour")]
+    # Settings whose initial value is not "0"
+    DEFAULT_SETTINGS = {"PID_Kp": "30",
+                        "PID_Ki": "5",
+                        "PID_Kd": "0",
+                        "PID_Periodo": "0.2",
+                        "PID_Rampa": "600",
+                        "PID_Isteresi": "2",
+                        "Staging_Soglia_Aggiunta": "90",
+                        "Staging_Soglia_Rimozione": "60",
+                        "Antisgocc_Partenze": "[]"}
+    FAULT_FIELDS = ["node", "code", "register", "timestamp", "description"]
+    # Faults kept in the database, the oldest ones are deleted
+    MAX_FAULT_ROWS = 1000
 
-    def __init__(self,  dbname):
+    def __init__(self,  dbname, namespace=None):
+        """
+        :param dbname: the path of the sqlite database.
+        :param namespace: in gateway mode, the code of the installation
+            whose settings are managed. Every installation has its own
+            database, named after dbname with the namespace appended
+            (e.g. piCANclient_skid2.db), so that the processes of
+            different installations never share settings, data or
+            database locks. None means the dbname database itself.
+        """
+        if namespace is not None:
+            root, extension = os.path.splitext(dbname)
+            dbname = f"{root}_{namespace}{extension}"
         super().__init__(dbname)
+        self.namespace = namespace
         self.settings = {}
         self.initialize()
 
@@ -104,6 +143,12 @@ class SettingsManager(DBLink):
         # A long function that initializes the database and every setting requested
         if self.is_initialized():
             logging.info("Database already initialized.")
+            # Databases created by older versions may lack the most
+            # recent settings: add them without touching the others
+            self.connect()
+            insert_query = "INSERT OR IGNORE INTO settings(key, value) VALUES (?, ?)"
+            self.execute_many(insert_query, self.default_records())
+            self.close()
         else:
             # If they do not exist already, create the data and
             # settings table. The settings table will have records
@@ -140,13 +185,32 @@ class SettingsManager(DBLink):
 
             # Prepare all settings as 0 and imei as DEFAULT_IMEI
             records = [("IMEI_impianto", self.DEFAULT_IMEI)]
-            for element in self.SETTINGS_LIST:
-                t = (element, "0")
-                records.append(t)
+            records.extend(self.default_records())
             self.execute_many(insert_query, records)
             self.close()
+        # Databases created by older versions lack the faults table
+        self.connect()
+        self.execute("CREATE TABLE IF NOT EXISTS faults("
+                     "id integer primary key autoincrement,"
+                     "node integer not null,"
+                     "code integer not null,"
+                     "register integer not null default 0,"
+                     "timestamp real not null,"
+                     "description varchar(255) not null default '')")
+        self.close()
         logging.info("Initialization completed.")
 
+    def default_records(self):
+        """
+        :return: a list of (key, value) tuples with the default value
+                 of every setting in SETTINGS_LIST
+        """
+        records = []
+        for element in self.SETTINGS_LIST:
+            t = (element, self.DEFAULT_SETTINGS.get(element, "0"))
+            records.append(t)
+        return records
+
     def load_settings(self):
         query = "SELECT * FROM settings"
         self.connect()
@@ -164,6 +228,34 @@ class SettingsManager(DBLink):
         self.close()
         return result
 
+    def get_settings(self, keys):
+        """
+        Reads several settings with a single query.
+
+        :param keys: the keys of the settings.
+        :return: a dictionary with the value of every key found.
+        """
+        query = f"SELECT key, value FROM settings WHERE key IN ({', '.join('?' * len(keys))})"
+        self.connect()
+        self.execute(query, tuple(keys))
+        result = dict(self.cursor.fetchall())
+        self.close()
+        return result
+
+    def update_settings(self, values):
+        """
+        Updates several settings in a single transaction.
+
+        :param values: a dictionary with the new value of every key.
+        :return: None
+        """
+        for key, value in values.items():
+            self.settings[key] = [value]
+        query = "UPDATE settings SET value = ? WHERE key = ?"
+        self.connect()
+        self.execute_many(query, [("{}".format(value), key) for key, value in values.items()])
+        self.close()
+
     def update_setting(self, key, value):
         self.settings[key] = [value]
         query = "UPDATE settings SET value = ? WHERE key = ?"
@@ -214,6 +306,36 @@ class SettingsManager(DBLink):
         self.execute(query, data_tuple)
         self.close()
 
+    def insert_fault_rows(self, faults):
+        """
+        Inserts the given faults in a single transaction, then deletes
+        the oldest ones beyond MAX_FAULT_ROWS.
+
+        :param faults: a list of fault dictionaries, with the
+                       FAULT_FIELDS keys (see FaultHistory.record).
+        :return: None
+        """
+        query = "INSERT INTO faults(node, code, register, timestamp, description) VALUES (?, ?, ?, ?, ?)"
+        records = [tuple(fault[field] for field in self.FAULT_FIELDS) for fault in faults]
+        self.connect()
+        self.execute_many(query, records)
+        self.execute("DELETE FROM faults WHERE id <= (SELECT max(id) FROM faults) - ?", (self.MAX_FAULT_ROWS,))
+        self.close()
+
+    def get_last_fault_rows(self, limit):
+        """
+        :param limit: the maximum number of faults returned.
+        :return: the last faults saved, as a list of dictionaries,
+                 oldest first.
+        """
+        query = "SELECT node, code, register, timestamp, description FROM faults ORDER BY id DESC LIMIT ?"
+        self.connect()
+        self.execute(query, (limit,))
+        faults = [dict(zip(self.FAULT_FIELDS, row)) for row in self.cursor.fetchall()]
+        self.close()
+        faults.reverse()
+        return faults
+
     def get_last_data_row(self):
         """
         :return: The last row from the data table as an array, or None
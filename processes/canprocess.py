@@ -1,24 +1,62 @@
 import logging
-from datetime import datetime
+import time
 from queue import Empty
 from multiprocessing import Process
 from interfaces.cannetwork import CanNetwork
+from processes.pidcontroller import PidController
+from processes.pumpstaging import PumpStaging
+from processes.telemetrybuffer import TelemetryBuffer
+from processes.starttracker import StartTracker
+from processes.summarystatistics import SummaryStatistics
+from processes.clock import SystemClock
 from picandb.settingsmanager import SettingsManager
 
 
 # TODO proper class conversion
 
 class CanProcess(Process):
+    MAX_RPM = 3000
+    # Pumps with a runtime counter in the database (node ids 1 to 6)
+    PUMPS_NUMBER = 6
+    # Signals sampled at every control step, and how many samples are
+    # kept (one hour at the default control period of 0.2s)
+    TELEMETRY_COLUMNS = {"outlet_pressure": 'd', "inlet_pressure": 'B', "inlet_temperature": 'B',
+                         "demand": 'd', "speed": 'd', "running": 'B', "running_pumps": 'B', "faulty_pumps": 'B'}
+    TELEMETRY_CAPACITY = 18000
+    # Maximum number of points of an answer to GET_TREND
+    TREND_MAX_POINTS = 300
+    # Seconds between two saves of the new faults in the database, and
+    # number of faults restored from it at startup
+    FAULT_SAVE_PERIOD = 10
+    FAULT_RESTORE_COUNT = 200
+    # Length in seconds of the periods of the summary statistics
+    SUMMARY_PERIOD = 3600
 
-    def __init__(self, read_queue, write_queue, interface_name="can0", bitrate=500000, bustype='socketcan'):
+    def __init__(self, read_queue, write_queue, interface_name="can0", bitrate=500000, bustype='socketcan',
+                 namespace=None, record_directory=None, clock=None, alarm_queue=None, start_time=None):
         super(CanProcess, self).__init__()
         self.read_queue = read_queue
         self.write_queue = write_queue
         self.interface_name = interface_name
         self.bitrate = bitrate
         self.bustype = bustype
-        self.logger = logging.getLogger(__name__ + '.can_process')
-        self.settings = SettingsManager("piCANclient.db")
+        self.record_directory = record_directory
+        # The faults of the nodes are put on the alarm queue as soon as
+        # they are reported, as (namespace, fault) tuples
+        self.alarm_queue = alarm_queue
+        # time.monotonic() at the start of the program, to report when
+        # the CANbus bring-up completes
+        self.start_time = start_time
+        # Every time reading and wait goes through the clock, so that
+        # simulations can run in virtual time
+        self.clock = SystemClock() if clock is None else clock
+        # A command taken from the queue before a control step or the
+        # housekeeping, and executed after it (see execute_stop)
+        self.held_command = None
+        self.logger = logging.getLogger(__name__ + '.can_process' + ('' if namespace is None else f'.{namespace}'))
+        # In gateway mode, every installation has its own settings
+        self.namespace = namespace
+        self.settings = SettingsManager("piCANclient.db", namespace)
         self.can_network = None
 
         # Variables declaration
@@ -32,6 +70,24 @@ class CanProcess(Process):
         self.operator_pump_start = self.load_boolean("Operator_Pump_start")
         self.running = False
 
+        # Control variables
+        self.pid_controller = None
+        self.staging = None
+        self.runtimes = {}
+        self.housekeeping_count = 0
+        self.control_period = None
+        self.hysteresis = None
+        self.outlet_pressure = None
+        self.inlet_pressure = None
+        self.inlet_temperature = None
+        self.demand = 0
+        self.telemetry = TelemetryBuffer(self.TELEMETRY_COLUMNS, self.TELEMETRY_CAPACITY)
+        self.summary = SummaryStatistics(self.SUMMARY_PERIOD)
+        self.tl_service = 0
+        self.bk_service = 0
+        self.rb_service = 0
+        self.start_tracker = None
+
     def load_boolean(self, field_name: str, invert=False):
         setting_string = self.settings.get_setting("Antisgocc_OK")
         if (setting_string == "1" and not invert) or (setting_string == "0" and invert):
@@ -40,9 +96,12 @@ class CanProcess(Process):
             return False
 
     def __build_data__(self):
-        d = {"inlet_pressure": self.can_network.read_inlet_pressure(),
-             "inlet_temperature": self.can_network.read_inlet_temperature(),
-             "outlet_pressure": self.can_network.read_outlet_pressure(),
+        # The signals come from the last sample of the control loop, so
+        # that no SDO transfer is needed to answer
+        sample = self.telemetry.latest()
+        d = {"inlet_pressure": sample["inlet_pressure"],
+             "inlet_temperature": sample["inlet_temperature"],
+             "outlet_pressure": round(sample["outlet_pressure"] * 10),
              "outlet_pressure_target": self.settings.get_setting("Pressione_Uscita_Target"),
              "working_hours_counter": self.settings.get_setting("impianto_BK_Counter_hour"),
              "working_minutes_counter": self.settings.get_setting("impianto_BK_Counter_min"),
@@ -55,6 +114,45 @@ class CanProcess(Process):
              "running": self.running}
         return d
 
+    def __build_metrics__(self):
+        m = {"output": self.can_network.get_output_statistics(),
+             "supervision": self.can_network.get_supervision_statistics(),
+             "node_pool": self.can_network.get_node_pool_statistics(),
+             "bus": self.can_network.get_bus_statistics()}
+        recording = self.can_network.get_recording_statistics()
+        if recording is not None:
+            m["recording"] = recording
+        return m
+
+    def __build_trend__(self, command):
+        """
+        :param command: "GET_TREND: signal seconds".
+        :return: the ages (in seconds, relative to the last sample) and
+                 the values of the signal in the last seconds, or
+                 "INVALID".
+        """
+        try:
+            name, seconds = command.split(' ')[1:3]
+            ages, values = self.telemetry.window(name, float(seconds), self.TREND_MAX_POINTS)
+        except (ValueError, KeyError):
+            return "INVALID"
+        return {"age": ages, name: values}
+
+    def __build_summary__(self, command):
+        """
+        :param command: "GET_SUMMARY", or "GET_SUMMARY: since" to only
+            get the periods starting after since.
+        :return: the summary statistics (see SummaryStatistics.summary),
+                 or "INVALID".
+        """
+        since = None
+        if command.startswith("GET_SUMMARY: "):
+            try:
+                since = float(command.split(' ')[1])
+            except (ValueError, IndexError):
+                return "INVALID"
+        return self.summary.summary(since)
+
     def initialize_settings(self):
         self.anti_drip_min_period = int(self.settings.get_setting("AntisgoccDurataPartenze"))
         self.target_pressure = int(self.settings.get_setting("Pressione_Uscita_Target"))
@@ -62,116 +160,350 @@ class CanProcess(Process):
         self.min_inlet_pressure = int(self.settings.get_setting("Pressione_Ingresso_Min"))
         self.max_inlet_pressure = int(self.settings.get_setting("Pressione_Ingresso_Max"))
         self.anti_drip_time_limit = int(self.settings.get_setting("AntisgoccPeriodoControllo"))
+        self.start_tracker = StartTracker(self.anti_drip_time_limit, self.anti_drip_min_period,
+                                          self.anti_drip_start_count_limit)
+        # The starts counted before a restart are still in the window
+        self.start_tracker.load_json(self.settings.get_setting("Antisgocc_Partenze"), self.clock.time())
         self.anti_drip = self.load_boolean("Antisgocc_OK")
         self.operator_pump_start = self.load_boolean("Operator_Pump_start")
 
+    def initialize_pid(self):
+        kp = float(self.settings.get_setting("PID_Kp"))
+        ki = float(self.settings.get_setting("PID_Ki"))
+        kd = float(self.settings.get_setting("PID_Kd"))
+        if self.pid_controller is None:
+            # The PID output is the speed demand of the whole plant,
+            # then split among the pumps by the staging
+            self.control_period = float(self.settings.get_setting("PID_Periodo"))
+            output_max = self.MAX_RPM * max(len(self.can_network.nodes_list), 1)
+            self.pid_controller = PidController(kp, ki, kd, self.control_period, output_min=0,
+                                                output_max=output_max,
+                                                rate_limit=float(self.settings.get_setting("PID_Rampa")))
+        else:
+            self.pid_controller.set_gains(kp, ki, kd)
+        self.hysteresis = float(self.settings.get_setting("PID_Isteresi"))
+        self.staging = PumpStaging(self.MAX_RPM,
+                                   stage_up=float(self.settings.get_setting("Staging_Soglia_Aggiunta")),
+                                   stage_down=float(self.settings.get_setting("Staging_Soglia_Rimozione")))
+
+    def execute_command(self, command):
+        result = "INVALID"
+        logging.info("Executing {}".format(command))
+        if command == "RUN":
+            self.operator_pump_start = True
+            self.can_network.reset_faulty_nodes()
+            self.settings.update_setting("Operator_Pump_start", 1)
+            result = "OK"
+        elif command == "STOP":
+            self.operator_pump_start = False
+            self.settings.update_setting("Operator_Pump_start", 0)
+            # A stop may be very important, so it's sent immediately.
+            self.stop_pumps()
+            result = "OK"
+        elif command == "GET_INFO":
+            result = self.__build_data__()
+        elif command == "RESET_PRESSURE_TARGET":
+            self.target_pressure = int(self.settings.get_setting("Pressione_Uscita_Target"))
+            result = "OK"
+        elif command == "RESET_PID":
+            self.initialize_pid()
+            result = "OK"
+        elif command == "GET_METRICS":
+            result = self.__build_metrics__()
+        elif command.startswith("GET_TREND: "):
+            result = self.__build_trend__(command)
+        elif command == "GET_BUS_STATUS":
+            result = self.can_network.get_bus_statistics()
+        elif command == "GET_FAULTS":
+            result = self.can_network.get_fault_history()
+        elif command == "GET_SUMMARY" or command.startswith("GET_SUMMARY: "):
+            result = self.__build_summary__(command)
+        return result
+
+    def load_runtimes(self):
+        for node in self.can_network.nodes_list:
+            if node.id <= self.PUMPS_NUMBER:
+                hours = int(self.settings.get_setting(f"impianto_Pompa_{node.id}_Counter_hour"))
+                minutes = int(self.settings.get_setting(f"impianto_Pompa_{node.id}_Counter_min"))
+                seconds = int(self.settings.get_setting(f"impianto_Pompa_{node.id}_Counter_sec"))
+                self.runtimes[node.id] = hours * 3600 + minutes * 60 + seconds
+
+    def set_pumps_running(self, nodes, running: bool):
+        # The nodes are started or stopped all at the same time.
+        # START_pompa_N tells the time updater which runtime counters
+        # have to be increased
+        if running:
+            self.can_network.run_nodes(nodes)
+        else:
+            self.can_network.halt_nodes(nodes)
+        for node in nodes:
+            self.settings.update_setting(f"START_pompa_{node.id}", int(running))
+            # The anti-drip counts the same starts as the summary
+            if running:
+                self.summary.pump_started(self.clock.time(), node.id)
+                self.start_tracker.started(self.clock.time(), node.id)
+            elif self.start_tracker.stopped(self.clock.time(), node.id):
+                self.save_starts()
+
+    def start_pumps(self):
+        # Bumpless transfer: the controller starts from the speed the
+        # pumps are actually running at
+        self.pid_controller.reset(0)
+        self.load_runtimes()
+        self.running = True
+
+    def stop_pumps(self):
+        running = [node for node in self.can_network.nodes_list if self.can_network.is_running(node)]
+        if running:
+            self.set_pumps_running(running, False)
+        self.can_network.stop_all_nodes()
+        self.running = False
+        self.pid_controller.reset(0)
+
+    def push_alarm(self, fault):
+        # Called from the CAN notifier thread
+        if self.alarm_queue is not None:
+            self.alarm_queue.put((self.namespace, fault))
+
+    def save_faults(self):
+        faults = self.can_network.fault_history.take_unsaved()
+        if faults:
+            self.settings.insert_fault_rows(faults)
+
+    def save_starts(self):
+        self.settings.update_setting("Antisgocc_Partenze", self.start_tracker.to_json())
+
+    def apply_staging(self, demand):
+        """
+        Starts, stops and sets the speed of every pump so that the
+        total speed matches the demand of the PID. Faulty pumps are
+        left out, as well as the ones silent or being initialized.
+
+        :param demand: the total speed demand in rpm.
+        :return: None
+        """
+        nodes = {node.id: node for node in self.can_network.nodes_list}
+        running = [node_id for node_id, node in nodes.items() if self.can_network.is_running(node)]
+        available = [node_id for node_id, node in nodes.items()
+                     if self.can_network.is_available(node) and not self.can_network.is_faulty(node)]
+        speeds = self.staging.distribute(demand, running, available, self.runtimes)
+        to_stop = [nodes[node_id] for node_id in running if speeds.get(node_id, 0) == 0]
+        to_start = [nodes[node_id] for node_id, rpm in speeds.items() if rpm > 0 and node_id not in running]
+        if to_stop:
+            self.set_pumps_running(to_stop, False)
+        if to_start:
+            self.set_pumps_running(to_start, True)
+        for node_id, rpm in speeds.items():
+            if rpm > 0:
+                self.can_network.set_node_speed(nodes[node_id], rpm)
+
+    def read_inputs(self):
+        self.outlet_pressure = self.can_network.read_outlet_pressure()/10
+        self.inlet_pressure = self.can_network.read_inlet_pressure()
+
+    def record_sample(self):
+        nodes = self.can_network.nodes_list
+        running = [node for node in nodes if self.can_network.is_running(node)]
+        faulty = [node.id for node in nodes if self.can_network.is_faulty(node)]
+        self.telemetry.append(self.clock.monotonic(),
+                              {"outlet_pressure": self.outlet_pressure,
+                               "inlet_pressure": self.inlet_pressure,
+                               "inlet_temperature": self.inlet_temperature,
+                               "demand": self.demand,
+                               "speed": sum(self.can_network.get_node_speed(node) for node in running),
+                               "running": self.running,
+                               "running_pumps": len(running),
+                               "faulty_pumps": len(faulty)})
+        self.summary.sample(self.clock.time(), self.outlet_pressure, [node.id for node in running], faulty)
+
+    def control_step(self):
+        """
+        Executed every self.control_period seconds. Reads the pressures
+        and starts, stops or regulates the pumps as necessary. The pumps
+        are started when the outlet pressure falls below the target
+        minus the hysteresis, and stopped when it rises above the target
+        plus the hysteresis. In between, the speed is set by the PID.
+        The signals are then recorded in the telemetry buffer.
+
+        :return: None
+        """
+        # The drives being started receive the next controlword
+        self.can_network.advance_enabling()
+        self.read_inputs()
+        if (self.inlet_pressure != 1 or self.tl_service != 0 or self.bk_service != 0 or self.rb_service != 0
+           or self.anti_drip or not self.operator_pump_start):
+            if self.running:
+                self.stop_pumps()
+        elif not self.running:
+            if self.outlet_pressure < self.target_pressure - self.hysteresis:
+                self.start_pumps()
+        elif self.outlet_pressure > self.target_pressure + self.hysteresis:
+            # Target pressure reached and exceeded even at low speed
+            self.stop_pumps()
+        if self.running:
+            self.demand = self.pid_controller.update(self.target_pressure, self.outlet_pressure)
+            self.apply_staging(self.demand)
+        else:
+            self.demand = 0
+        self.record_sample()
+
+    def housekeeping(self):
+        """
+        Executed once per second. Takes care of the anti drip, of the
+        time limits and of saving the pressures in the database.
+
+        :return: None
+        """
+        # 1. Count the start of the pumps if they have been running for
+        #    at least anti_drip_min_period, then activate the anti-drip if
+        #    there have been too many starts in the last
+        #    anti_drip_time_limit seconds
+        now = self.clock.time()
+        if self.start_tracker.promote(now):
+            self.save_starts()
+        if not self.anti_drip and self.start_tracker.is_exceeded(now):
+            self.logger.warning(f"{self.start_tracker.count(now)} starts in the last {self.anti_drip_time_limit}s,"
+                                f" anti-drip activated")
+            self.settings.update_setting("Antisgocc_OK", 0)
+            self.anti_drip = True
+            self.summary.anti_drip_activated(now)
+
+        # 2. Update all relevant variables
+        services = self.settings.get_settings(["impianto_TL_SERVICE", "impianto_BK_SERVICE", "impianto_RB_SERVICE"])
+        self.tl_service = int(services["impianto_TL_SERVICE"])
+        self.bk_service = int(services["impianto_BK_SERVICE"])
+        self.rb_service = int(services["impianto_RB_SERVICE"])
+        # Slow signal, read once per second instead of at every step
+        self.inlet_temperature = self.can_network.read_inlet_temperature()
+
+        self.can_network.print_all_states()
+        self.can_network.supervise()
+        # Nodes may have been attached by the supervisor
+        self.pid_controller.output_max = self.MAX_RPM * max(len(self.can_network.nodes_list), 1)
+        if self.running and self.housekeeping_count % 60 == 0:
+            self.load_runtimes()
+        if self.housekeeping_count % self.FAULT_SAVE_PERIOD == 0:
+            self.save_faults()
+        self.housekeeping_count += 1
+
+        # 3. Report why the pumps can not be started. The settings are
+        #    saved in a single transaction
+        values = {}
+        if self.inlet_pressure == 1:
+            values["Pressione_Ingresso_OK"] = 1
+            if self.tl_service != 0 or self.bk_service != 0 or self.rb_service != 0:
+                self.logger.warning(f"System stopped for a time limit:"
+                                    f" TL:{self.tl_service}, BK:{self.bk_service}, RB:{self.rb_service}")
+        elif self.inlet_pressure is not None:
+            values["Pressione_Ingresso_OK"] = 0
+            self.logger.warning(f"Inlet pressure of {self.inlet_pressure}bar, is outside limits. Pumps not started.")
+
+        if self.outlet_pressure is not None:
+            values["Pressione_Uscita"] = self.outlet_pressure
+            values["Pressione_Ingresso"] = self.inlet_pressure
+        if values:
+            self.settings.update_settings(values)
+
+    def receive_command(self, timeout):
+        """
+        Returns the held command if there is one, or waits up to timeout
+        seconds for a new one.
+
+        :return: the command.
+        :raises Empty: if no command arrives within timeout seconds.
+        """
+        if self.held_command is not None:
+            command, self.held_command = self.held_command, None
+            return command
+        return self.clock.get(self.read_queue, timeout)
+
+    def execute_stop(self):
+        """
+        Called before the control step and the housekeeping: a STOP
+        already waiting in the queue is executed before them instead of
+        after. Any other command is held, and executed after them.
+
+        :return: None
+        """
+        if self.held_command is None:
+            try:
+                self.held_command = self.read_queue.get_nowait()
+            except Empty:
+                return
+        if self.held_command == "STOP":
+            self.held_command = None
+            self.write_queue.put(self.execute_command("STOP"))
+
     def run(self):
         self.logger.info("CANBus Interface Process started")
         # TODO at process start all settings should be loaded and
         # TODO communicated via CAN Bus
-        last_started = None
-        anti_drip_start_count = 0
-        anti_drip_current_time_frame = datetime.now()
         self.initialize_settings()
+        start = self.clock.monotonic()
         self.can_network = CanNetwork(bitrate=self.bitrate, bustype=self.bustype,
-                                      interface_name=self.interface_name, autoconnect=True)
+                                      interface_name=self.interface_name, autoconnect=True,
+                                      record_directory=self.record_directory, on_fault=self.push_alarm,
+                                      clock=self.clock)
+        self.bring_up()
+        self.logger.info(f"CANbus bring-up completed in {self.clock.monotonic() - start:.3f}s")
+        if self.start_time is not None:
+            self.logger.info(f"Startup phase can: completed {time.monotonic() - self.start_time:.3f}s"
+                             f" after the program start")
+        self.loop()
+
+    def bring_up(self):
+        """
+        Initializes the nodes of self.can_network and the controller,
+        and takes the first sample. The network can be replaced by a
+        model of the plant, as the simulations do.
+
+        :return: None
+        """
+        self.can_network.fault_history.load(self.settings.get_last_fault_rows(self.FAULT_RESTORE_COUNT))
         self.can_network.connect()
         self.can_network.initialize_nodes()
-        while True:
+        self.initialize_pid()
+        for node in self.can_network.nodes_list:
+            self.settings.update_setting(f"START_pompa_{node.id}", 0)
+        # The telemetry buffer is never empty
+        self.inlet_temperature = self.can_network.read_inlet_temperature()
+        self.read_inputs()
+        self.record_sample()
+        self.housekeeping()
+
+    def loop(self, duration=None):
+        """
+        The main loop: executes the commands, the control steps and the
+        housekeeping.
+
+        :param duration: the seconds after which the loop returns, None
+            means forever.
+        :return: None
+        """
+        next_control = self.clock.monotonic()
+        next_housekeeping = next_control + 1
+        end = None if duration is None else next_control + duration
+        while end is None or self.clock.monotonic() < end:
+            # Commands are executed as soon as they arrive, but the
+            # wait never extends past the next control step, so that
+            # the PID always runs at a fixed rate.
             try:
-                command = self.read_queue.get(timeout=1)
-                result = "INVALID"
-                logging.info("Executing {}".format(command))
-                if command == "RUN":
-                    self.operator_pump_start = True
-                    self.can_network.reset_faulty_nodes()
-                    self.settings.update_setting("Operator_Pump_start", 1)
-                    result = "OK"
-                elif command == "STOP":
-                    self.operator_pump_start = False
-                    self.settings.update_setting("Operator_Pump_start", 0)
-                    # A stop may be very important, so it's sent immediately.
-                    self.can_network.stop_all_nodes()
-                    self.running = False
-                    result = "OK"
-                elif command == "GET_INFO":
-                    result = self.__build_data__()
-                elif command == "RESET_PRESSURE_TARGET":
-                    self.target_pressure = int(self.settings.get_setting("Pressione_Uscita_Target"))
-                    result = "OK"
-                self.write_queue.put(result)
+                command = self.receive_command(max(0, next_control - self.clock.monotonic()))
+                self.write_queue.put(self.execute_command(command))
             except Empty:
-                # Phase b). No commands were found. Then read data from
-                # pressure sensors, read settings from the database and
-                # execute
-
-                # 1. If pumps have been running for more than anti_drip_time_limit
-                #    then increase the anti_drip_start_count. If last started is None
-                #    then it means that everything has already been calculated (or
-                #    it has yet to start)
-                if last_started is not None:
-                    print(f"seconds {(datetime.now() - last_started).total_seconds()}")
-                    print(f"min per {self.anti_drip_min_period}")
-                    print(f"count {anti_drip_start_count}")
-                if (last_started is not None and
-                   (datetime.now() - last_started).total_seconds() >= self.anti_drip_min_period):
-                    anti_drip_start_count += 1
-                    last_started = None
-
-                # 2. If the time window has expired, reset it. Otherwise, check the counter.
-                #    If necessary, stop everything and set the anti_drip.
-                if (datetime.now() - anti_drip_current_time_frame).total_seconds() > self.anti_drip_time_limit:
-                    anti_drip_current_time_frame = datetime.now()
-                    anti_drip_start_count = 0
-                elif anti_drip_start_count == self.anti_drip_start_count_limit:
-                    self.settings.update_setting("Antisgocc_OK", 0)
-                    self.anti_drip = True
-
-                # 3. Update all relevant variables
-                tl_service = int(self.settings.get_setting("impianto_TL_SERVICE"))
-                bk_service = int(self.settings.get_setting("impianto_BK_SERVICE"))
-                rb_service = int(self.settings.get_setting("impianto_RB_SERVICE"))
-
-                # 4. Read pressure values and start or stop the pumps as necessary
-                outlet_pressure = self.can_network.read_outlet_pressure()/10
-                inlet_pressure = self.can_network.read_inlet_pressure()
-
-                self.can_network.print_all_states()
-
-                if inlet_pressure == 1:
-                    self.settings.update_setting("Pressione_Ingresso_OK", 1)
-                    if tl_service == 0 and bk_service == 0 and rb_service == 0:
-                        if (outlet_pressure < self.target_pressure and
-                           not self.anti_drip and self.operator_pump_start == 1):
-                            # TODO Use inverter's PID
-                            difference = self.target_pressure - outlet_pressure
-                            if not self.running:
-                                self.can_network.run_all_nodes()
-                                self.running = True
-                                if last_started is None:
-                                    last_started = datetime.now()
-                            if difference > 0:
-                                # *30 to convert rpm in hertz. 1500 is max rpm
-                                self.can_network.set_speed_all_nodes(min(difference * 30, 3000))
-                            else:
-                                # Target pressure reached
-                                self.can_network.set_speed_all_nodes(0)
-                                self.can_network.stop_all_nodes()
-                                self.running = False
-                        else:
-                            self.can_network.stop_all_nodes()
-                            self.running = False
-                    else:
-                        self.can_network.stop_all_nodes()
-                        self.running = False
-                        self.logger.warning(f"System stopped for a time limit:"
-                                            f" TL:{tl_service}, BK:{bk_service}, RB:{rb_service}")
-                else:
-                    self.can_network.stop_all_nodes()
-                    self.running = False
-                    self.settings.update_setting("Pressione_Ingresso_OK", 0)
-                    self.logger.warning(f"Inlet pressure of {inlet_pressure}bar, is outside limits. Pumps not started.")
-
-                self.settings.update_setting("Pressione_Uscita", outlet_pressure)
-                self.settings.update_setting("Pressione_Ingresso", inlet_pressure)
-
+                pass
+            now = self.clock.monotonic()
+            if now >= next_control:
+                self.execute_stop()
+                self.control_step()
+                next_control += self.control_period
+                if next_control < now:
+                    # Too late: skip the missed steps instead of
+                    # executing them in a burst
+                    next_control = now + self.control_period
+            if now >= next_housekeeping:
+                self.execute_stop()
+                self.housekeeping()
+                next_housekeeping += 1
+                if next_housekeeping < now:
+                    next_housekeeping = now + 1
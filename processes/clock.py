@@ -0,0 +1,67 @@
+import time
+from queue import Empty
+
+
+class SystemClock:
+    """
+    The clock used by the processes: every time reading, every wait
+    and every blocking queue read goes through it, so that a
+    VirtualClock can replace it in simulations.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def get(self, queue, timeout: float):
+        """
+        Like queue.get(timeout=timeout): raises queue.Empty if nothing
+        arrives within timeout seconds.
+        """
+        return queue.get(timeout=timeout)
+
+
+class VirtualClock(SystemClock):
+    """
+    A clock that only moves when the program waits: sleep() returns
+    immediately after moving the clock forward. A simulation runs as
+    fast as the code it executes, so days of operation of the plant
+    take seconds.
+
+    Not meant to be shared between processes: each one would have its
+    own copy.
+    """
+
+    def __init__(self, start=0.0, epoch=None):
+        """
+        :param start: the initial value of monotonic().
+        :param epoch: the value of time() when monotonic() is 0. If
+            None, the current time is used.
+        """
+        self.now = start
+        self.epoch = time.time() if epoch is None else epoch
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.epoch + self.now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.now += seconds
+
+    def get(self, queue, timeout: float):
+        # What is already in the queue is returned, otherwise the whole
+        # timeout elapses at once
+        try:
+            return queue.get_nowait()
+        except Empty:
+            self.sleep(timeout)
+            raise
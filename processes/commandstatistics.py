@@ -0,0 +1,55 @@
+class CommandStatistics:
+    """
+    Collects the latency of the commands sent to a CanProcess, from the
+    moment they are queued to the moment their result is received, by
+    class:
+
+     - safety: STOP
+     - control: RUN, RESET_PRESSURE_TARGET, RESET_PID and any command
+       not listed here
+     - telemetry: GET_INFO, GET_TREND, GET_METRICS, GET_BUS_STATUS,
+       GET_FAULTS, GET_SUMMARY
+
+    The latency includes the time the command waits for the control
+    step or the housekeeping of the CanProcess to end.
+    """
+    SAFETY = "safety"
+    CONTROL = "control"
+    TELEMETRY = "telemetry"
+    CLASSES = {"STOP": SAFETY,
+               "GET_INFO": TELEMETRY,
+               "GET_METRICS": TELEMETRY,
+               "GET_TREND": TELEMETRY,
+               "GET_BUS_STATUS": TELEMETRY,
+               "GET_FAULTS": TELEMETRY,
+               "GET_SUMMARY": TELEMETRY}
+
+    def __init__(self):
+        kinds = (self.SAFETY, self.CONTROL, self.TELEMETRY)
+        self.count = {kind: 0 for kind in kinds}
+        self.latency_sum = {kind: 0.0 for kind in kinds}
+        self.latency_max = {kind: 0.0 for kind in kinds}
+
+    def classify(self, command: str) -> str:
+        # Commands with arguments, e.g. "GET_TREND: outlet_pressure 60"
+        return self.CLASSES.get(command.split(':')[0], self.CONTROL)
+
+    def record(self, command: str, latency: float) -> None:
+        """
+        :param command: the command executed.
+        :param latency: the seconds between sending the command and
+            receiving its result.
+        """
+        kind = self.classify(command)
+        self.count[kind] += 1
+        self.latency_sum[kind] += latency
+        self.latency_max[kind] = max(self.latency_max[kind], latency)
+
+    def statistics(self) -> dict:
+        statistics = {}
+        for kind, count in self.count.items():
+            average = self.latency_sum[kind] / count if count > 0 else 0
+            statistics[kind] = {"count": count,
+                                "latency_avg_ms": round(average * 1000, 2),
+                                "latency_max_ms": round(self.latency_max[kind] * 1000, 2)}
+        return statistics
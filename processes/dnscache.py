@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import socket as sk
+import time
+from threading import Thread, Lock
+
+
+class DnsCache:
+    """
+    A resolver cache for the server address, which is a dynamic DNS
+    name: over 2G a lookup may take seconds or fail, and it would be
+    repeated at every reconnection.
+
+     - A fresh address (younger than ttl seconds) is returned directly.
+     - A stale address is returned immediately as well, while a
+       background thread resolves the name again
+       (stale-while-revalidate).
+     - An address is only resolved synchronously if it is not known at
+       all, or if the caller asks for it explicitly because the known
+       one did not work. Even then, if the lookup fails the last known
+       address is returned instead of raising an error.
+
+    The known addresses are saved on disk, so that they survive a
+    restart of the process.
+    """
+
+    def __init__(self, path='cache/dns.json', ttl=300):
+        """
+        :param path: the json file where the addresses are saved.
+        :param ttl: seconds after which an address is considered stale.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = {}
+        self.refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.lookups = 0
+        self.failed_lookups = 0
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_file:
+                self.entries = json.load(cache_file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self) -> None:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as cache_file:
+                json.dump(self.entries, cache_file)
+        except OSError:
+            self.logger.warning(f"Could not save the DNS cache in {self.path}")
+
+    def lookup(self, hostname: str, port: int) -> str:
+        """
+        Resolves the hostname and stores the result.
+
+        :return: the IPv4 address of hostname.
+        """
+        self.lookups += 1
+        try:
+            address = sk.getaddrinfo(hostname, port, sk.AF_INET, sk.SOCK_STREAM)[0][4][0]
+        except OSError:
+            self.failed_lookups += 1
+            raise
+        with self.lock:
+            self.entries[hostname] = {"address": address, "time": time.time()}
+            self.save()
+        return address
+
+    def refresh_thread(self, hostname: str, port: int) -> None:
+        try:
+            self.lookup(hostname, port)
+        except OSError as e:
+            self.logger.warning(f"Could not refresh the address of {hostname}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(hostname)
+
+    def resolve(self, hostname: str, port: int, refresh=False) -> str:
+        """
+        :param hostname: the name to resolve.
+        :param port: the port, needed by getaddrinfo.
+        :param refresh: True if the cached address did not work and the
+            name must be resolved again before returning.
+        :return: the IPv4 address of hostname.
+        """
+        with self.lock:
+            entry = self.entries.get(hostname)
+        if entry is None:
+            return self.lookup(hostname, port)
+        if refresh:
+            try:
+                return self.lookup(hostname, port)
+            except OSError:
+                self.logger.warning(f"Could not resolve {hostname}, using the last known address")
+                return entry["address"]
+        if time.time() - entry["time"] < self.ttl:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+            with self.lock:
+                if hostname not in self.refreshing:
+                    self.refreshing.add(hostname)
+                    refresh_t = Thread(target=self.refresh_thread, args=(hostname, port))
+                    refresh_t.daemon = True
+                    refresh_t.start()
+        return entry["address"]
+
+    def statistics(self) -> dict:
+        return {"hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "lookups": self.lookups,
+                "failed_lookups": self.failed_lookups}
@@ -0,0 +1,43 @@
+import time
+from multiprocessing import Queue
+from picandb.settingsmanager import SettingsManager
+from processes.commandstatistics import CommandStatistics
+
+
+class Installation:
+    """
+    What the SocketProcess needs to serve one installation (a pump skid
+    on its own CANbus): the queues shared with its CanProcess, its
+    settings and the state of the telemetry sent to the server.
+
+    In gateway mode a single SocketProcess serves several
+    installations over the same server connection, and the commands
+    are routed to them by code.
+    """
+
+    def __init__(self, code, read_queue: Queue, write_queue: Queue, database_path='piCANclient.db'):
+        """
+        :param code: the installation code used in the protocol, or None
+            if this is the only installation.
+        :param read_queue: the queue the CanProcess writes results on.
+        :param write_queue: the queue the CanProcess reads commands from.
+        :param database_path: the path of the sqlite database. The code
+            is used as the SettingsManager namespace.
+        """
+        self.code = code
+        self.read_queue = read_queue
+        self.write_queue = write_queue
+        self.settings = SettingsManager(database_path, code)
+        self.last_row = {}
+        self.last_info_time = None
+        self.command_statistics = CommandStatistics()
+
+    def execute(self, command: str):
+        """
+        Sends the command to the CanProcess and waits for its result.
+        """
+        start = time.monotonic()
+        self.write_queue.put(command)
+        result = self.read_queue.get()
+        self.command_statistics.record(command, time.monotonic() - start)
+        return result
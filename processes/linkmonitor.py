@@ -0,0 +1,181 @@
+import logging
+import socket as sk
+import struct
+import time
+from threading import Thread
+
+
+class LinkProfile:
+    """
+    The transmission parameters used by the SocketProcess for a given
+    link quality.
+    """
+
+    def __init__(self, name, receive_timeout, compression_level, telemetry_interval):
+        """
+        :param name: the name of the profile, for logging.
+        :param receive_timeout: seconds to wait for a command from the
+            server before considering the connection dead.
+        :param compression_level: zlib level for the answers, 0 means
+            no compression.
+        :param telemetry_interval: minimum seconds between two GET_INFO
+            answers carrying data. Requests arriving earlier are
+            answered with "NU".
+        """
+        self.name = name
+        self.receive_timeout = receive_timeout
+        self.compression_level = compression_level
+        self.telemetry_interval = telemetry_interval
+
+
+class LinkMonitor:
+    """
+    Continuously estimates the quality of the link with the server and
+    chooses the LinkProfile to be used.
+
+    The round trip time and the throughput are measured by the kernel
+    itself, and read from the socket with getsockopt(TCP_INFO), which
+    costs no traffic at all. If a Sim object is available, the access
+    technology and the signal quality reported by the modem are taken
+    into account too, so that the profile changes as soon as the modem
+    falls back to 2G instead of after the first timeouts. Reading the
+    radio status takes a few AT commands, so it is refreshed every
+    RADIO_INTERVAL seconds on a background thread and update() only
+    uses the last result.
+
+    Separate thresholds are used to enter and to leave the slow profile,
+    so that it does not flap when the RTT is borderline.
+    """
+    FAST = LinkProfile("fast", receive_timeout=10, compression_level=0, telemetry_interval=0)
+    SLOW = LinkProfile("slow", receive_timeout=30, compression_level=9, telemetry_interval=5)
+    # RTT thresholds in seconds
+    SLOW_RTT = 0.8
+    FAST_RTT = 0.4
+    # RSSI (AT+CSQ) below which the link is considered slow
+    MIN_SIGNAL = 8
+    # Seconds between two reads of the radio status from the modem
+    RADIO_INTERVAL = 30
+    # Weight of the new sample in the RTT moving average
+    ALPHA = 0.2
+    # struct tcp_info: 8 u8 fields, 24 u32 fields, then u64 fields
+    TCP_INFO_FORMAT = "8B24I4Q"
+    TCP_INFO_SIZE = struct.calcsize(TCP_INFO_FORMAT)
+    # tcpi_state of an established connection
+    TCP_ESTABLISHED = 1
+
+    def __init__(self, sim=None):
+        """
+        :param sim: a Sim object to read the radio link status from,
+            or None.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.sim = sim
+        self.rtt = None
+        self.throughput = None
+        self.technology = None
+        self.signal = None
+        self.profile = self.FAST
+        self.last_bytes = None
+        self.last_time = None
+        self.radio_time = None
+        self.radio_thread = None
+
+    def read_tcp_info(self, socket: sk.socket):
+        """
+        :return: the tcp_info fields as a tuple, or None if they are
+                 not available on this platform.
+        """
+        if not hasattr(sk, "TCP_INFO"):
+            return None
+        try:
+            raw = socket.getsockopt(sk.IPPROTO_TCP, sk.TCP_INFO, self.TCP_INFO_SIZE)
+        except OSError:
+            return None
+        if len(raw) < self.TCP_INFO_SIZE:
+            # Older kernels: the missing fields are left to zero
+            raw = raw + bytes(self.TCP_INFO_SIZE - len(raw))
+        return struct.unpack(self.TCP_INFO_FORMAT, raw)
+
+    def update(self, socket: sk.socket) -> LinkProfile:
+        """
+        Takes a new measurement and updates the profile. Meant to be
+        called after every exchange with the server.
+
+        :return: the profile to be used from now on.
+        """
+        info = self.read_tcp_info(socket)
+        if info is not None:
+            # tcpi_rtt, in microseconds
+            rtt = info[8 + 15] / 1000000
+            if rtt > 0:
+                self.rtt = rtt if self.rtt is None else self.ALPHA * rtt + (1 - self.ALPHA) * self.rtt
+            # tcpi_bytes_acked + tcpi_bytes_received
+            total_bytes = info[8 + 24 + 2] + info[8 + 24 + 3]
+            now = time.monotonic()
+            if self.last_bytes is not None and total_bytes > self.last_bytes and now > self.last_time:
+                self.throughput = (total_bytes - self.last_bytes) / (now - self.last_time)
+            self.last_bytes = total_bytes
+            self.last_time = now
+        self.refresh_radio()
+        self.choose_profile()
+        return self.profile
+
+    def refresh_radio(self) -> None:
+        """
+        Starts a read of the radio status on a background thread if the
+        last one is older than RADIO_INTERVAL and none is running.
+        """
+        if self.sim is None or (self.radio_thread is not None and self.radio_thread.is_alive()):
+            return
+        now = time.monotonic()
+        if self.radio_time is not None and now - self.radio_time < self.RADIO_INTERVAL:
+            return
+        self.radio_time = now
+        self.radio_thread = Thread(target=self.read_radio, daemon=True)
+        self.radio_thread.start()
+
+    def read_radio(self) -> None:
+        status = self.sim.get_link_status()
+        if status["available"]:
+            self.technology = status["technology"]
+            self.signal = status["signal"]
+
+    def is_established(self, socket: sk.socket) -> bool:
+        """
+        :return: True if the kernel sees the connection as established.
+                 If this can't be known, False is returned.
+        """
+        info = self.read_tcp_info(socket)
+        return info is not None and info[0] == self.TCP_ESTABLISHED
+
+    def reset(self) -> None:
+        """
+        Called when a new socket is created, as byte counters restart.
+        """
+        self.last_bytes = None
+        self.last_time = None
+
+    def is_slow(self) -> bool:
+        if self.technology == "2G":
+            return True
+        if self.signal is not None and self.signal != 99 and self.signal < self.MIN_SIGNAL:
+            return True
+        if self.rtt is None:
+            return self.profile is self.SLOW
+        if self.profile is self.SLOW:
+            return self.rtt > self.FAST_RTT
+        return self.rtt > self.SLOW_RTT
+
+    def choose_profile(self) -> None:
+        profile = self.SLOW if self.is_slow() else self.FAST
+        if profile is not self.profile:
+            self.logger.warning(f"Link quality changed (technology: {self.technology}, signal: {self.signal},"
+                                f" rtt: {self.rtt}), using the {profile.name} profile")
+            self.profile = profile
+
+    def statistics(self) -> dict:
+        return {"profile": self.profile.name,
+                "rtt_ms": None if self.rtt is None else round(self.rtt * 1000, 1),
+                "throughput_bps": None if self.throughput is None else round(self.throughput * 8),
+                "technology": self.technology,
+                "signal": self.signal}
@@ -0,0 +1,104 @@
+class PidController:
+    """
+    A discrete PID controller meant to be executed at a fixed rate.
+
+    The controller computes the pumps speed (in rpm) needed to reach
+    the target outlet pressure. A few features make it suitable to
+    drive the inverters directly:
+     - The derivative is computed on the measurement instead of the
+       error, so that a change of the target does not cause a kick.
+     - The output is clamped between output_min and output_max, and
+       its variation is limited to rate_limit rpm per second.
+     - Whenever the output is clamped (either by the limits or by the
+       rate limiter) the integral term is recalculated so that it
+       matches the actual output (back-calculation). This prevents
+       the integral from winding up while the pumps are saturated.
+     - reset() and set_gains() are bumpless: the output does not jump
+       when the pumps are started or stopped, or when the gains are
+       changed while running.
+    """
+
+    def __init__(self, kp, ki, kd, period, output_min=0, output_max=3000, rate_limit=None):
+        """
+        :param kp: the proportional gain, in rpm/bar.
+        :param ki: the integral gain, in rpm/(bar*s).
+        :param kd: the derivative gain, in (rpm*s)/bar.
+        :param period: the time in seconds between two update() calls.
+        :param output_min: the minimum output in rpm.
+        :param output_max: the maximum output in rpm.
+        :param rate_limit: the maximum output variation in rpm per
+            second. None means no limit.
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.period = period
+        self.output_min = output_min
+        self.output_max = output_max
+        self.rate_limit = rate_limit
+        self.integral = 0
+        self.output = 0
+        self.last_error = 0
+        self.last_measurement = None
+        # Rate of change of the measurement at the last update, in bar/s
+        self.last_rate = 0
+
+    def set_gains(self, kp, ki, kd) -> None:
+        """
+        Changes the gains without changing the current output. The
+        integral term absorbs the difference of the proportional and of
+        the derivative terms, computed with the last error and the last
+        rate of change of the measurement.
+
+        :return: None
+        """
+        self.integral += (self.kp - kp) * self.last_error
+        self.integral += (kd - self.kd) * self.last_rate
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+
+    def reset(self, output=0) -> None:
+        """
+        Prepares the controller to start from the given output, usually
+        the speed the pumps are currently running at.
+
+        :param output: the output the controller should start from.
+        :return: None
+        """
+        self.output = min(max(output, self.output_min), self.output_max)
+        self.integral = self.output
+        self.last_error = 0
+        self.last_measurement = None
+        self.last_rate = 0
+
+    def update(self, setpoint, measurement):
+        """
+        Executes a step of the controller. It must be called every
+        self.period seconds.
+
+        :param setpoint: the target pressure.
+        :param measurement: the measured pressure.
+        :return: the new output in rpm.
+        """
+        error = setpoint - measurement
+        proportional = self.kp * error
+        if self.last_measurement is None:
+            rate = 0
+        else:
+            rate = (measurement - self.last_measurement) / self.period
+        derivative = -self.kd * rate
+        self.integral += self.ki * error * self.period
+        output = proportional + self.integral + derivative
+        output = min(max(output, self.output_min), self.output_max)
+        if self.rate_limit is not None:
+            max_step = self.rate_limit * self.period
+            output = min(max(output, self.output - max_step), self.output + max_step)
+        # Back-calculation: the integral is the only state of the
+        # controller, so it has to agree with what is actually applied
+        self.integral = output - proportional - derivative
+        self.output = output
+        self.last_error = error
+        self.last_measurement = measurement
+        self.last_rate = rate
+        return output
@@ -0,0 +1,69 @@
+import math
+
+
+class PumpStaging:
+    """
+    Distributes the total speed demanded by the pressure controller
+    among the pumps, so that only the pumps actually needed are
+    running, each one at an efficient speed.
+
+    The demand is expressed in rpm summed over all pumps (the PID
+    output). A pump is added when the running pumps would have to
+    exceed stage_up percent of max_rpm, and removed when the remaining
+    pumps could take over the demand staying below stage_down percent
+    of max_rpm. The gap between the two thresholds keeps the pumps
+    from being added and removed continuously.
+
+    Pumps are rotated by accumulated runtime: the pump with the least
+    runtime is the first to be started, and the one with the most
+    runtime is the first to be stopped.
+    """
+
+    def __init__(self, max_rpm=3000, stage_up=90, stage_down=60):
+        """
+        :param max_rpm: the maximum speed of a single pump.
+        :param stage_up: percentage of max_rpm above which a pump is
+            added.
+        :param stage_down: percentage of max_rpm below which a pump is
+            removed, if the others can take over the demand.
+        """
+        self.max_rpm = max_rpm
+        self.stage_up = stage_up
+        self.stage_down = stage_down
+
+    def pumps_needed(self, demand, running_count, available_count) -> int:
+        """
+        :param demand: the total speed demand in rpm.
+        :param running_count: the number of pumps currently running.
+        :param available_count: the number of pumps that can be used.
+        :return: how many pumps should be running.
+        """
+        if demand <= 0 or available_count == 0:
+            return 0
+        count = max(running_count, 1)
+        while count < available_count and demand > count * self.max_rpm * self.stage_up / 100:
+            count += 1
+        while count > 1 and demand < (count - 1) * self.max_rpm * self.stage_down / 100:
+            count -= 1
+        # Never ask the pumps for more than they can deliver
+        return min(max(count, math.ceil(demand / self.max_rpm)), available_count)
+
+    def distribute(self, demand, running, available, runtimes) -> dict:
+        """
+        :param demand: the total speed demand in rpm.
+        :param running: the ids of the pumps currently running.
+        :param available: the ids of the pumps that can be used.
+        :param runtimes: a dictionary id -> accumulated runtime in
+            seconds. Missing ids count as zero.
+        :return: a dictionary id -> speed in rpm for every available
+            pump. A speed of 0 means that the pump must be stopped.
+        """
+        running = [pump for pump in running if pump in available]
+        count = self.pumps_needed(demand, len(running), len(available))
+        # Stop the pumps with the most runtime, start the ones with the least
+        by_runtime = sorted(running, key=lambda pump: runtimes.get(pump, 0))
+        selected = by_runtime[:count]
+        idle = sorted((pump for pump in available if pump not in running), key=lambda pump: runtimes.get(pump, 0))
+        selected += idle[:count - len(selected)]
+        speed = min(demand / count, self.max_rpm) if count > 0 else 0
+        return {pump: (speed if pump in selected else 0) for pump in available}
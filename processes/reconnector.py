@@ -0,0 +1,117 @@
+import random
+import time
+
+
+class Reconnector:
+    """
+    The state machine deciding what to do when the connection with the
+    server is lost, escalating through increasingly expensive tiers:
+     - TCP: connect again to the last known address. This is enough
+       for most of the short outages of the 2G/3G link.
+     - DNS: resolve the server address again before connecting, in
+       case its dynamic DNS record has changed.
+     - PPP: disconnect and reconnect the modem. This takes tens of
+       seconds, so it is only done after the other tiers failed.
+    After the PPP tier the cycle starts again from the TCP tier.
+
+    Between two attempts the process waits for an exponentially
+    increasing delay, with jitter, so that a long outage is not spent
+    hammering the link (and many clients do not reconnect in sync when
+    the server comes back).
+
+    The time needed to recover from every outage and the tier that
+    solved it are collected as metrics.
+    """
+    TCP = "tcp"
+    DNS = "dns"
+    PPP = "ppp"
+    RANK = {TCP: 0, DNS: 1, PPP: 2}
+
+    def __init__(self, tcp_attempts=3, dns_attempts=2, base_delay=1, max_delay=60, has_modem=True):
+        """
+        :param tcp_attempts: attempts at the TCP tier before escalating.
+        :param dns_attempts: attempts at the DNS tier before escalating.
+        :param base_delay: delay in seconds after the first failure.
+        :param max_delay: maximum delay in seconds between attempts.
+        :param has_modem: False if there's no modem to reconnect, in
+            which case the PPP tier is skipped.
+        """
+        self.tcp_attempts = tcp_attempts
+        self.dns_attempts = dns_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.has_modem = has_modem
+        self.tier = self.TCP
+        self.tier_failures = 0
+        self.failures = 0
+        self.highest_tier = self.TCP
+        self.outage_start = None
+        # Metrics
+        self.recoveries = {self.TCP: 0, self.DNS: 0, self.PPP: 0}
+        self.recovery_time_sum = 0.0
+        self.recovery_time_max = 0.0
+        self.recovery_time_last = None
+
+    def start_outage(self) -> None:
+        """
+        Called when the connection is found to be lost. Does nothing if
+        an outage is already in progress.
+        """
+        if self.outage_start is None:
+            self.outage_start = time.monotonic()
+            self.tier = self.TCP
+            self.tier_failures = 0
+            self.failures = 0
+            self.highest_tier = self.TCP
+
+    def failed(self) -> str:
+        """
+        Called after every failed attempt.
+
+        :return: the tier of the next attempt.
+        """
+        self.failures += 1
+        self.tier_failures += 1
+        if self.tier == self.TCP and self.tier_failures >= self.tcp_attempts:
+            self.__escalate(self.DNS)
+        elif self.tier == self.DNS and self.tier_failures >= self.dns_attempts:
+            self.__escalate(self.PPP if self.has_modem else self.TCP)
+        elif self.tier == self.PPP:
+            # The modem has been reconnected: start again from the bottom
+            self.__escalate(self.TCP)
+        return self.tier
+
+    def __escalate(self, tier: str) -> None:
+        self.tier = tier
+        self.tier_failures = 0
+        if self.RANK[tier] > self.RANK[self.highest_tier]:
+            self.highest_tier = tier
+
+    def next_delay(self) -> float:
+        """
+        :return: the seconds to wait before the next attempt.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** min(self.failures - 1, 16))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def recovered(self) -> None:
+        """
+        Called when the connection has been established again.
+        """
+        if self.outage_start is None:
+            return
+        elapsed = time.monotonic() - self.outage_start
+        self.recoveries[self.highest_tier] += 1
+        self.recovery_time_sum += elapsed
+        self.recovery_time_max = max(self.recovery_time_max, elapsed)
+        self.recovery_time_last = elapsed
+        self.outage_start = None
+
+    def statistics(self) -> dict:
+        count = sum(self.recoveries.values())
+        average = self.recovery_time_sum / count if count > 0 else 0
+        return {"recoveries": dict(self.recoveries),
+                "recovery_time_avg_s": round(average, 3),
+                "recovery_time_max_s": round(self.recovery_time_max, 3),
+                "recovery_time_last_s": (None if self.recovery_time_last is None
+                                         else round(self.recovery_time_last, 3))}
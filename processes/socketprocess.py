@@ -2,11 +2,21 @@ import logging
 import time
 import socket as sk
 import json
+import zlib
+import base64
+import math
+import select
+from collections import deque
+from queue import Empty
 from multiprocessing import Process, Queue
-from threading import Thread
 from interfaces.sim import Sim
 from picandb.settingsmanager import SettingsManager
 from processes.timeprocess import time_updater
+from processes.linkmonitor import LinkMonitor
+from processes.reconnector import Reconnector
+from processes.dnscache import DnsCache
+from processes.tlsconnector import TlsConnector
+from processes.installation import Installation
 
 
 class SocketProcess(Process):
@@ -26,13 +36,35 @@ class SocketProcess(Process):
     the SocketProcess' activity while running, check the documentation
     of the run method.
 
+    In gateway mode, a single SocketProcess serves several
+    installations, each one with its own CanProcess and queues, over the
+    same server connection. The installation a command is meant for is
+    given as a prefix of the command itself (see the run method).
+
     The intended use is like every other process: instantiate the
     class and call .start() to let the process run. A few parameters
     have to be passed, however, as seen in the __init__ method.
     """
 
+    # Messages shorter than this are never compressed
+    COMPRESSION_THRESHOLD = 128
+    # Consecutive receive timeouts tolerated on a healthy connection
+    MAX_IDLE_TIMEOUTS = 3
+    CONNECT_TIMEOUT = 30
+    # TCP keepalive (s) and TCP_USER_TIMEOUT (ms) settings
+    KEEPALIVE_IDLE = 30
+    KEEPALIVE_INTERVAL = 10
+    KEEPALIVE_COUNT = 3
+    USER_TIMEOUT = 60000
+    # Alarms kept while they can't be pushed to the server, and seconds
+    # between two checks for new alarms while waiting for a command
+    MAX_PENDING_ALARMS = 100
+    ALARM_POLL_PERIOD = 1
+
     def __init__(self, read_queue: Queue, write_queue: Queue, imei: str, sim=None,
-                 server_address='ggh.zapto.org', port=37863, database_path='piCANclient.db'):
+                 server_address='ggh.zapto.org', port=37863, database_path='piCANclient.db',
+                 use_tls=False, ca_file=None, start_time=None, installations=None, alarm_queue=None,
+                 modem=None):
         """
         This constructor just initializes the variables needed by the
         process, like the logger, the SettingsManager and so on.
@@ -45,15 +77,38 @@ class SocketProcess(Process):
             commands to CanProcess using this queue.
         :param imei: a string containing the IMEI of the 2G/3G modem
             used to connect to the internet. This is needed to
-            identify when connecting to the server.
+            identify when connecting to the server. None if it is read
+            from the modem (see modem).
         :param sim: a Sim object used to manage the 2G/3G modem in the
             event of connection problems.
+        :param modem: the "apn" and the "max_retries" of the 2G/3G
+            modem, if the process has to bring it up itself (see
+            prepare_modem) instead of receiving a Sim. The Sim is then
+            created in the process, so that its thread runs in the
+            process that uses it.
         :param server_address: the hostname or the IP address of the
             app's webserver.
         :param port: the port on the app's webserver, on which the
             connection will happen.
         :param database_path: the path of the sqlite database to be
             used for a SettingsManager object.
+        :param use_tls: if True, the connection with the server is
+            encrypted with TLS, resuming the session at every
+            reconnection when possible.
+        :param ca_file: the certificate used to verify the server's
+            one. If None, the system CAs are used.
+        :param start_time: the time.monotonic() value at the start of
+            the program, used to measure the time to the first server
+            response.
+        :param installations: in gateway mode, a list of
+            (installation code, read_queue, write_queue) tuples, one for
+            every CanProcess. The first one is the default installation.
+            If None, read_queue and write_queue are used for the only
+            installation.
+        :param alarm_queue: a multiprocessing.Queue shared with all the
+            CanProcesses, on which they put the faults of the nodes as
+            soon as they are reported. The faults are pushed to the
+            server once it enables them (see the run method).
         """
         super(SocketProcess, self).__init__()
         self.read_queue = read_queue
@@ -66,92 +121,110 @@ class SocketProcess(Process):
         self.socket = None
         self.logger = logging.getLogger(__name__ + '.socket_process')
         self.time_updater_reset = 0
-        self.time_updater_process = None
-        self.settings = SettingsManager(database_path)
+        self.time_updater_processes = []
+        if installations is None:
+            installations = [(None, read_queue, write_queue)]
+        self.installations = {code: Installation(code, installation_read_queue, installation_write_queue,
+                                                 database_path)
+                              for code, installation_read_queue, installation_write_queue in installations}
+        self.default_installation = self.installations[installations[0][0]]
+        self.database_path = database_path
+        self.modem = modem
+        self.link_monitor = LinkMonitor(sim)
+        self.reconnector = Reconnector(has_modem=sim is not None or modem is not None)
+        self.dns_cache = DnsCache()
+        self.tls = TlsConnector(server_address, ca_file) if use_tls else None
+        self.start_time = start_time
+        self.startup = {}
+        self.first_response = False
+        self.compression_enabled = False
+        self.alarm_queue = alarm_queue
+        self.alarms_enabled = False
+        self.pending_alarms = deque(maxlen=self.MAX_PENDING_ALARMS)
+        self.received = b""
 
     def send(self, message: str) -> bool:
         """
-        Encodes the message and sends it on the object socket.
+        Encodes the message and sends it on the object socket. If the
+        server enabled compression and the current link profile
+        requires it, long messages are sent zlib-compressed and base64
+        encoded, prefixed by "Z:". Once the server enabled the alarms,
+        every message ends with a newline, so that the server can tell
+        the pushed alarms from the answers (see push_alarms).
 
         :param message: The message to encode and send.
         :return: True if message was successfully sent,
             False otherwise.
         """
         data = message.encode()
+        level = self.link_monitor.profile.compression_level
+        if self.compression_enabled and level > 0 and len(data) > self.COMPRESSION_THRESHOLD:
+            data = b"Z:" + base64.b64encode(zlib.compress(data, level))
+        if self.alarms_enabled:
+            data += b"\n"
         try:
             self.logger.info(f"Sending {message}")
             self.socket.send(data)
-        except ConnectionError:
+        except OSError:
             logging.error("Could not send data to the server")
             return False
+        self.link_monitor.update(self.socket)
         return True
 
-    def receive_thread(self, buffer_size: int, data: list):
-        """
-        This function is meant to be used as a separate thread, to
-        implement a reliable timeout for socket.recv. It just calls
-        socket.recv with the specified buffer_size and puts it
-        in to the first position of the given list.
-
-        :param buffer_size: The buffer size for the recv call. Usually
-            it's 1024 bytes.
-        :param data: A list. This needs to be a mutable object so
-            that it's synchronized with the parent thread, and it
-            can receive information.
-        :return: None
-        """
-        try:
-            data[0] = self.socket.recv(buffer_size)
-        except ConnectionError or ConnectionAbortedError:
-            pass
-
     def receive(self, timeout=0, buffer_size=1024) -> str:
         """
         Listens for data on the connection and decodes it. Optional
         parameters are timeout and buffer_size, which may be
-        customized to make the function behave as necessary. In
-        order to implement a reliable timeout for socket.recv, the
-        call is wrapped in a thread. If it doesn't return before the
-        timeout mark, then the thread is terminated by closing the
-        connection and the function returns.
-
-        :param timeout: Time in seconds to wait before closing the
-                        connection if no data is sent. Timeout = 0
-                        is default and means no timeout.
+        customized to make the function behave as necessary. The
+        timeout is implemented by the socket itself: when it expires,
+        socket.timeout is raised but the connection is left open, so
+        that the caller can decide whether it is still usable.
+
+        Once the server enabled the alarms, its commands end with a
+        newline too: the data is read until the newline, so that a
+        batch longer than buffer_size is received whole, and what
+        follows it is kept for the next call.
+
+        :param timeout: Time in seconds to wait for data before
+                        raising socket.timeout. Timeout = 0 is default
+                        and means no timeout.
         :param buffer_size: The buffer size in bytes. Default is 1024
                             and should not be changed unless
                             necessary.
         :return: the message received by the app's webserver.
         :rtype: str
         """
-        data = [None]
-        rec_thread = Thread(target=self.receive_thread, args=(buffer_size, data))
-        rec_thread.daemon = True
-        rec_thread.start()
-
-        timer = 0
-        if timeout > 0:
-            while timer <= timeout:
-                if not (data[0] is None):
-                    break
-                time.sleep(1)
-                timer += 1
-            if timer > timeout:
-                self.socket.close()
-                raise ConnectionAbortedError()
+        if self.alarms_enabled:
+            while b"\n" not in self.received:
+                self.received += self.receive_data(timeout, buffer_size)
+            data, self.received = self.received.split(b"\n", 1)
+            data = data.rstrip(b"\r")
         else:
-            rec_thread.join()
+            data = self.receive_data(timeout, buffer_size)
+        # Data should be an array of bytes!
+        message = data.decode("UTF-8")
+        self.link_monitor.update(self.socket)
+        print(f"{self.server_address} sent {message}")
+        self.logger.info(f"{self.server_address} sent {message}")
+        return message
+
+    def receive_data(self, timeout, buffer_size) -> bytes:
+        """
+        Reads the data available on the socket, up to buffer_size bytes
+        (see receive).
 
-        data = data[0]
-        if not data or data is None:
-            self.logger.error(f"{self.server_address} closed the connection or did not send anything before timeout")
+        :raises socket.timeout: if nothing arrives within timeout.
+        :raises ConnectionAbortedError: if the server closed the
+                connection.
+        """
+        if self.alarm_queue is not None:
+            self.wait_for_data(timeout)
+        self.socket.settimeout(timeout if timeout > 0 else None)
+        data = self.socket.recv(buffer_size)
+        if not data:
+            self.logger.error(f"{self.server_address} closed the connection")
             raise ConnectionAbortedError()
-        else:
-            # Data should be an array of bytes!
-            message = data.decode("UTF-8")
-            print(f"{self.server_address} sent {message}")
-            self.logger.info(f"{self.server_address} sent {message}")
-            return message
+        return data
 
     def receive_or_reconnect(self, timeout=0, buffer_size=1024):
         """
@@ -162,79 +235,161 @@ class SocketProcess(Process):
         socket connection for no apparent reason and we can't afford
         to go offline randomly.
 
+        If the timeout expires but the kernel still sees the TCP
+        connection as established (dead links are detected by the
+        keepalive and TCP_USER_TIMEOUT settings of create_socket), the
+        socket is kept, up to MAX_IDLE_TIMEOUTS times in a row.
+
         :param timeout: the maximum timeout to wait before considering
-            the connection "dead" and trying to reconnect. This
-            mechanism is implemented using the SocketProcess.receive
-            method and its thread.
+            the connection "dead" and trying to reconnect.
         :param buffer_size: The buffer size in bytes for the message.
         :return: the message sent by the app's webserver.
         :rtype: str
         """
-        # Should dig deeper on the true reason of the 2G/3G modem
-        # dropping the connection
+        idle_timeouts = 0
         while True:
             try:
                 return self.receive(timeout, buffer_size)
-            except ConnectionAbortedError or OSError:
-                self.create_socket()
-                self.connect_to_server()
+            except sk.timeout:
+                idle_timeouts += 1
+                if idle_timeouts < self.MAX_IDLE_TIMEOUTS and self.link_monitor.is_established(self.socket):
+                    self.logger.info("No command received, but the connection is still alive")
+                    continue
+                self.logger.error(f"{self.server_address} did not send anything before timeout")
+            except OSError:
+                # ConnectionAbortedError, ConnectionResetError...
+                pass
+            idle_timeouts = 0
+            self.reconnect()
 
     def create_socket(self):
+        # Nothing must be pushed before the handshake, and the server
+        # enables the alarms and the compression again on every
+        # connection
+        self.alarms_enabled = False
+        self.compression_enabled = False
+        # Data received after the last complete command (see receive)
+        self.received = b""
+        self.link_monitor.reset()
         self.socket = sk.socket(sk.AF_INET, sk.SOCK_STREAM)
         self.socket.settimeout(None)
+        # Let the kernel detect dead connections, instead of waiting
+        # for the application timeouts
+        self.socket.setsockopt(sk.SOL_SOCKET, sk.SO_KEEPALIVE, 1)
+        if hasattr(sk, "TCP_KEEPIDLE"):
+            self.socket.setsockopt(sk.IPPROTO_TCP, sk.TCP_KEEPIDLE, self.KEEPALIVE_IDLE)
+            self.socket.setsockopt(sk.IPPROTO_TCP, sk.TCP_KEEPINTVL, self.KEEPALIVE_INTERVAL)
+            self.socket.setsockopt(sk.IPPROTO_TCP, sk.TCP_KEEPCNT, self.KEEPALIVE_COUNT)
+        if hasattr(sk, "TCP_USER_TIMEOUT"):
+            self.socket.setsockopt(sk.IPPROTO_TCP, sk.TCP_USER_TIMEOUT, self.USER_TIMEOUT)
+
+    def close_socket(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+
+    def reconnect(self) -> None:
+        """
+        Throws away the current socket and connects again.
+
+        :return: None
+        """
+        self.reconnector.start_outage()
+        self.close_socket()
+        self.create_socket()
+        self.connect_to_server()
+
+    def resolve_server_address(self, refresh=False) -> str:
+        """
+        :param refresh: if True, the address is resolved again even if
+            it was already known (see DnsCache.resolve).
+        :return: the IP address of the server
+        """
+        return self.dns_cache.resolve(self.server_address, self.port, refresh=refresh)
 
     def connect_to_server(self) -> None:
         """
         An error resilient method to connect to the app's webserver.
         It first tries to connect using socket.connect. If it
         succeeds, then it identifies to complete the handshake and
-        then returns. If the connection fails for known reasons,
-        however, like ConnectionError and ConnectionResetError,
-        the method will retry as many time as needed by disconnecting
-        and reconnecting the 2G/3G modem.
+        then returns. If the connection fails, the Reconnector
+        decides what to do before the next attempt: just retry,
+        resolve the server address again, or disconnect and reconnect
+        the 2G/3G modem. Attempts are spaced by an exponential backoff.
 
         The idea of testing the connection with something like a ping
         command is tempting, but ultimately useless, since there's
         nothing that can be done except waiting if the 2G/3G modem
         is properly connected but the server still isn't reachable
         (as it would be the server's fault). So in the end it is
-        better to just keep disconnecting and reconnecting until
-        something changes.
+        better to just keep retrying until something changes, without
+        bouncing the modem more often than needed.
 
         :return: None
         """
+        tier = self.reconnector.tier
         while True:
             try:
-                self.socket.connect((self.server_address, self.port))
-                self.identify()
-                break
-            except ConnectionError or ConnectionResetError or OSError:
-                self.logger.error("The connection has been closed unexpectedly. Trying to reconnect...")
-                if self.sim is not None:
+                if tier == Reconnector.PPP:
+                    self.logger.warning("Reconnecting the modem")
                     self.sim.disconnect(blocking=True)
                     self.sim.connect(blocking=True)
-                else:
-                    time.sleep(1)
-                # Call a method that pings google, if not works tries to disconnect and
-                # then reconnect with the modem. If ping works, then it must be server's fault
-                # But what should we do, even if so? We could only wait and retry...
+                address = self.resolve_server_address(refresh=(tier != Reconnector.TCP))
+                self.socket.settimeout(self.CONNECT_TIMEOUT)
+                self.socket.connect((address, self.port))
+                if self.tls is not None:
+                    self.socket = self.tls.wrap(self.socket)
+                self.identify()
+                if self.tls is not None:
+                    self.tls.save_session(self.socket)
+                self.reconnector.recovered()
+                break
+            except OSError:
+                # Includes ConnectionError, socket.timeout and socket.gaierror
+                self.reconnector.start_outage()
+                tier = self.reconnector.failed()
+                delay = self.reconnector.next_delay()
+                self.logger.error(f"The connection has been closed unexpectedly. Trying to reconnect"
+                                  f" in {delay:.1f}s ({tier})")
+                self.close_socket()
+                self.create_socket()
+                time.sleep(delay)
 
-    def reset_time_limit(self, limit_name: str) -> None:
+    def reset_time_limit(self, settings: SettingsManager, limit_name: str) -> None:
         """
         Resets all time variables related to the index provided as a
         parameter.
 
+        :param settings: the SettingsManager of the installation.
         :param limit_name: the name of the time limit index. It can be
             either TL, BK or RB.
         :return: None
         """
         self.time_updater_reset = 1
-        self.settings.update_setting(f"impianto_{limit_name}_Counter_hour", 0)
-        self.settings.update_setting(f"impianto_{limit_name}_Counter_min", 0)
-        self.settings.update_setting(f"impianto_{limit_name}_Counter_sec", 0)
-        self.settings.update_setting(f"impianto_{limit_name}_SERVICE", 0)
+        settings.update_setting(f"impianto_{limit_name}_Counter_hour", 0)
+        settings.update_setting(f"impianto_{limit_name}_Counter_min", 0)
+        settings.update_setting(f"impianto_{limit_name}_Counter_sec", 0)
+        settings.update_setting(f"impianto_{limit_name}_SERVICE", 0)
         self.time_updater_reset = 0
 
+    def record_startup(self) -> None:
+        """
+        Records how long it took to get the first message from the
+        server, both since the program started and since the boot.
+
+        :return: None
+        """
+        if self.start_time is not None:
+            self.startup["first_response_s"] = round(time.monotonic() - self.start_time, 3)
+        try:
+            with open("/proc/uptime", 'r') as uptime_file:
+                self.startup["uptime_at_first_response_s"] = float(uptime_file.read().split()[0])
+        except (OSError, ValueError, IndexError):
+            pass
+        self.logger.info(f"Startup completed, first server response: {self.startup}")
+
     def identify(self) -> None:
         """
         Implements the server's handshake protocol, and identifies
@@ -244,13 +399,263 @@ class SocketProcess(Process):
 
         :return: None
         """
-        message = self.receive_or_reconnect(10)
+        # Errors are handled by connect_to_server
+        message = self.receive(self.link_monitor.profile.receive_timeout)
+        if not self.first_response:
+            self.first_response = True
+            self.record_startup()
         if message == "ID_SUPPLICANT":
             self.send(self.imei)
         else:
             self.logger.error("The server did not ask for identification")
             raise ConnectionRefusedError("The server did not ask for identification")
 
+    def route(self, command: str):
+        """
+        Finds the installation a command is meant for.
+
+        :param command: the command as received from the server,
+            possibly prefixed by "<installation code>@".
+        :return: the Installation (None if the code is unknown) and the
+                 command without the prefix.
+        """
+        if '@' not in command:
+            return self.default_installation, command
+        code, command = command.split('@', 1)
+        installation = self.installations.get(code)
+        if installation is None:
+            self.logger.error(f"Command {command} for unknown installation {code}")
+        return installation, command
+
+    def prepare_modem(self) -> None:
+        """
+        Brings up the modem and reads its IMEI (see Sim.read_imei). The
+        IMEI is saved in the database the first time: if it changes
+        later, the modem has been replaced, and an IOError is raised.
+
+        :return: None
+        """
+        start = time.monotonic()
+        self.logger.info("Preparing GSM modem")
+        settings = SettingsManager(self.database_path)
+        stored_imei = settings.get_setting("IMEI_impianto")
+        self.sim = Sim(apn=self.modem["apn"], max_retries=self.modem["max_retries"])
+        imei = self.sim.read_imei(None if stored_imei == settings.DEFAULT_IMEI else stored_imei,
+                                  settings.get_setting("Modem_Identita"))
+        if stored_imei == settings.DEFAULT_IMEI:
+            settings.update_setting("IMEI_impianto", imei)
+        elif imei != stored_imei:
+            settings.update_setting("IMEI_impianto_OK", 0)
+            self.logger.error("Modem IMEI has changed unexpectedly. Reset the database or plug in the old modem")
+            raise IOError("Modem IMEI has changed unexpectedly. Reset the database or plug in the old modem")
+        settings.update_setting("IMEI_impianto_OK", 1)
+        identity = self.sim.get_usb_identity()
+        if identity is not None:
+            settings.update_setting("Modem_Identita", identity)
+        # Returns right away if the modem is already connected
+        self.sim.connect()
+        self.imei = imei
+        self.link_monitor.sim = self.sim
+        self.startup["modem_s"] = round(time.monotonic() - start, 3)
+        self.logger.info(f"Startup phase modem: {self.startup['modem_s']:.3f}s")
+
+    def execute(self, command: str):
+        """
+        Executes a command received from the server (see the run
+        method for the list).
+
+        :param command: the command, possibly with an installation
+            prefix.
+        :return: the answer to be sent to the server, either a string
+                 or a dict or list to be sent as json (see
+                 encode_answer), or None if the command failed and no
+                 answer must be sent.
+        """
+        if command == "LIST_INSTALLATIONS":
+            return [code for code in self.installations if code is not None]
+        installation, command = self.route(command)
+        if installation is None:
+            return "INVALID"
+        if command.startswith("BATCH: "):
+            # "code@BATCH: [...]", the prefix applies to every command
+            return self.execute_batch(command, installation.code)
+        if command == "GET_INFO":
+            interval = self.link_monitor.profile.telemetry_interval
+            if installation.last_info_time is not None and \
+                    time.monotonic() - installation.last_info_time < interval:
+                return "NU"
+            installation.last_info_time = time.monotonic()
+            new_row = installation.execute(command)
+            if "timestamp" in new_row:
+                del new_row["timestamp"]
+            last_row = installation.last_row
+            if last_row == new_row:
+                # answer = "NO_UPDATE" let's save data
+                return "NU"
+            installation.settings.insert_new_data_row(new_row)
+            # Only send the data that needs to be updated
+            to_update = {}
+            for key, value in new_row.items():
+                if last_row is None or key not in last_row or last_row[key] != value:
+                    to_update[key] = value
+            installation.last_row = new_row
+            return to_update
+        elif command == "STOP" or command == "RUN":
+            result = installation.execute(command)
+            if result == "OK":
+                return "OK"
+        elif command == "GET_METRICS":
+            metrics = installation.execute(command)
+            metrics["commands"] = installation.command_statistics.statistics()
+            metrics["link"] = self.link_monitor.statistics()
+            metrics["reconnection"] = self.reconnector.statistics()
+            metrics["dns"] = self.dns_cache.statistics()
+            metrics["startup"] = self.startup
+            if self.tls is not None:
+                metrics["tls"] = self.tls.statistics()
+            return metrics
+        elif command.startswith("GET_TREND: "):
+            return installation.execute(command)
+        elif command == "GET_BUS_STATUS" or command == "GET_FAULTS":
+            return installation.execute(command)
+        elif command == "GET_SUMMARY" or command.startswith("GET_SUMMARY: "):
+            return installation.execute(command)
+        elif command == "ENABLE_COMPRESSION":
+            self.compression_enabled = True
+            return "OK"
+        elif command == "ENABLE_ALARMS":
+            self.alarms_enabled = True
+            return "OK"
+        elif command in ("RESET_TL", "RESET_BK", "RESET_RB"):
+            self.reset_time_limit(installation.settings, command[len("RESET_"):])
+            return "OK"
+        elif 'SET_PRESSURE_TARGET: ' in command:
+            pressure_target = command.split(' ')[1]
+            installation.settings.update_setting("Pressione_Uscita_Target", pressure_target)
+            result = installation.execute('RESET_PRESSURE_TARGET')
+            if result == "OK":
+                return result
+        elif 'SET_PID: ' in command:
+            try:
+                kp, ki, kd = (float(gain) for gain in command.split(' ')[1:4])
+            except ValueError:
+                self.logger.error(f"Invalid PID gains in {command}")
+                return "INVALID"
+            # nan, inf or negative gains would drive the pumps wildly
+            if not all(math.isfinite(gain) and gain >= 0 for gain in (kp, ki, kd)):
+                self.logger.error(f"Invalid PID gains in {command}")
+                return "INVALID"
+            installation.settings.update_setting("PID_Kp", kp)
+            installation.settings.update_setting("PID_Ki", ki)
+            installation.settings.update_setting("PID_Kd", kd)
+            result = installation.execute('RESET_PID')
+            if result == "OK":
+                return result
+        else:
+            # Unknown commands have never been answered
+            return None
+        self.logger.error("ISSUE!")
+        return None
+
+    @staticmethod
+    def encode_answer(answer) -> str:
+        """
+        :param answer: an answer returned by execute.
+        :return: the answer as sent to the server: strings as they are,
+                 anything else as json.
+        """
+        return answer if isinstance(answer, str) else json.dumps(answer)
+
+    def execute_batch(self, batch: str, code=None):
+        """
+        Executes, in order, the commands of a batch, so that a sequence
+        like "set target, run, report" costs a single round trip.
+
+        :param batch: "BATCH: " followed by a json list of commands.
+        :param code: the installation the batch was prefixed with, if
+            any: its commands without a prefix are meant for it.
+        :return: the list of the answers to the commands, sent as a json
+                 list whose items are the answers themselves (json
+                 answers are not encoded twice). Commands that failed
+                 are answered with "ERROR", and nested batches with
+                 "INVALID". If the batch is malformed, "INVALID" is
+                 returned instead of the list.
+        """
+        try:
+            commands = json.loads(batch[len("BATCH: "):])
+        except ValueError:
+            commands = None
+        if not isinstance(commands, list) or not all(isinstance(command, str) for command in commands):
+            self.logger.error(f"Invalid batch {batch}")
+            return "INVALID"
+        answers = []
+        for command in commands:
+            if command.split('@', 1)[-1].startswith("BATCH: "):
+                answer = "INVALID"
+            else:
+                if code is not None and '@' not in command and command != "LIST_INSTALLATIONS":
+                    command = f"{code}@{command}"
+                answer = self.execute(command)
+            answers.append("ERROR" if answer is None else answer)
+        return answers
+
+    def wait_for_data(self, timeout=0) -> None:
+        """
+        Waits until a command can be read from the socket, pushing the
+        alarms that arrive meanwhile, at most ALARM_POLL_PERIOD seconds
+        after they were reported.
+
+        :param timeout: Time in seconds to wait for data before raising
+                        socket.timeout. Timeout = 0 means no timeout.
+        :return: None
+        """
+        end = time.monotonic() + timeout if timeout > 0 else None
+        while True:
+            self.push_alarms()
+            # With TLS, a record may already be decrypted and buffered
+            if hasattr(self.socket, "pending") and self.socket.pending() > 0:
+                return
+            wait = self.ALARM_POLL_PERIOD
+            if end is not None:
+                wait = min(wait, end - time.monotonic())
+                if wait <= 0:
+                    raise sk.timeout()
+            readable, _, _ = select.select([self.socket], [], [], wait)
+            if readable:
+                return
+
+    def push_alarms(self) -> None:
+        """
+        Takes the faults reported by the CanProcesses and pushes them to
+        the server, as "ALARM: " followed by the fault as json (see
+        FaultHistory.record). In gateway mode, the fault also has the
+        code of its installation.
+
+        Alarms are only pushed by the main thread, while it waits for a
+        command (see wait_for_data): they never interleave with an
+        answer, and a TLS socket is never written while it is read.
+        Like every message sent after ENABLE_ALARMS, they end with a
+        newline, which is the frame the server splits the messages on.
+
+        Faults that can't be sent, because the server has not enabled
+        the alarms yet or the connection is down, are kept and sent
+        later, up to MAX_PENDING_ALARMS.
+
+        :return: None
+        """
+        while True:
+            try:
+                code, fault = self.alarm_queue.get_nowait()
+            except Empty:
+                break
+            if code is not None:
+                fault = dict(fault, installation=code)
+            self.pending_alarms.append(fault)
+        while self.alarms_enabled and self.pending_alarms:
+            if not self.send("ALARM: " + json.dumps(self.pending_alarms[0])):
+                break
+            self.pending_alarms.popleft()
+
     def run(self) -> None:
         """
         This function is meant to be run as a concurrent process, like the
@@ -262,7 +667,9 @@ class SocketProcess(Process):
             - "GET_INFO"
               The command is sent to the can_interface, which replies with
               the new data. Then only the changed data is sent to the
-              server
+              server. On slow links, requests arriving less than
+              telemetry_interval seconds after the last update are
+              answered with "NU" without querying the can_interface
             - "RUN"
               The command is sent to the can_interface, executed and then
               an "OK" is sent to the server.
@@ -282,68 +689,90 @@ class SocketProcess(Process):
                 The pressure_target setting is updated and the
                 CAN process is prompted to update to the new pressure
                 target
+            - "GET_METRICS"
+                The command is sent to the can_interface, which replies
+                with its performance metrics (e.g. the command-to-bus
+                latency). They are sent to the server as json, together
+                with the link quality metrics
+            - "GET_TREND: signal seconds"
+                The command is sent to the can_interface, which replies
+                with the values of the signal (e.g. outlet_pressure)
+                sampled in the last seconds, taken from its telemetry
+                buffer. They are sent to the server as json
+            - "GET_BUS_STATUS"
+                The command is sent to the can_interface, which replies
+                with the bus utilization, the frame rate of every COB-ID
+                and the error counters (see BusMonitor). They are sent
+                to the server as json
+            - "GET_FAULTS"
+                The command is sent to the can_interface, which replies
+                with the active fault and the last faults of every node,
+                with their EMCY error code, error register and time.
+                They are sent to the server as json
+            - "GET_SUMMARY" or "GET_SUMMARY: since"
+                The command is sent to the can_interface, which replies
+                with the hourly statistics computed on the device (min,
+                max and mean outlet pressure, starts, running time and
+                time in fault of every pump, anti-drip activations) for
+                the last periods, or only for those starting after the
+                since timestamp. They are sent to the server as json, so
+                that GET_INFO can be polled much less often
+            - "ENABLE_COMPRESSION"
+                From now on, and until the connection is closed, long
+                answers may be sent compressed if the link is slow (see
+                SocketProcess.send)
+            - "ENABLE_ALARMS"
+                From now on, and until the connection is closed, every
+                message sent to the server ends with a newline, starting
+                with the "OK" answer to this command, and the faults of
+                the nodes are pushed as "ALARM: {json}" messages between
+                the answers, as soon as they are reported (see
+                SocketProcess.push_alarms). The server must split what
+                it receives on the newlines, and end its own commands
+                with a newline from then on
+            - "SET_PID: kp ki kd"
+                The PID gains are updated and the CAN process is
+                prompted to load them without stopping the pumps. Gains
+                that are not finite and non-negative are answered with
+                "INVALID"
+            - "BATCH: [command, command, ...]"
+                The commands in the json list are executed in order, and
+                their answers are sent back together as a json list (see
+                SocketProcess.execute_batch)
+            - "LIST_INSTALLATIONS"
+                The codes of the installations served by this gateway
+                are sent to the server as a json list (empty if not in
+                gateway mode)
+
+        In gateway mode, every command but LIST_INSTALLATIONS may be
+        prefixed by the code of an installation, as in
+        "skid2@SET_PRESSURE_TARGET: 40". Commands without a prefix go to
+        the default installation, and commands for an unknown
+        installation are answered with "INVALID". A prefixed batch, as in
+        "skid2@BATCH: [...]", sends to that installation the commands of
+        the list that have no prefix of their own.
 
         :return: None
         """
         self.logger.info("Socket Interface Process started")
-        self.time_updater_process = Process(target=time_updater, args=(self.time_updater_reset,))
-        self.time_updater_process.daemon = True
-        self.time_updater_process.start()
-        last_row = {}
+        # One time updater for every installation, since each one has
+        # its own counters
+        self.time_updater_processes = []
+        for code in self.installations:
+            time_updater_process = Process(target=time_updater, args=(self.time_updater_reset, code))
+            time_updater_process.daemon = True
+            time_updater_process.start()
+            self.time_updater_processes.append(time_updater_process)
+        # Threads are only started once the processes are forked
+        if self.modem is not None:
+            self.prepare_modem()
         while True:
             self.create_socket()
             self.connect_to_server()
             while True:
                 # Receive, execute, reply
-                command = self.receive_or_reconnect(10)
-                if command == "GET_INFO":
-                    self.write_queue.put(command)
-                    new_row = self.read_queue.get()
-                    if "timestamp" in new_row:
-                        del new_row["timestamp"]
-                    if last_row == new_row:
-                        # answer = "NO_UPDATE" let's save data
-                        answer = "NU"
-                    else:
-                        self.settings.insert_new_data_row(new_row)
-                        # Only send the data that needs to be updated
-                        to_update = {}
-                        for key, value in new_row.items():
-                            if last_row is None or key not in last_row or last_row[key] != value:
-                                to_update[key] = value
-                        last_row = new_row
-                        answer = json.dumps(to_update)
-                    self.send(answer)
-                elif command == "STOP":
-                    self.write_queue.put(command)
-                    result = self.read_queue.get()
-                    if result == "OK":
-                        self.send("OK")
-                    else:
-                        self.logger.error("ISSUE!")
-                elif command == "RUN":
-                    self.write_queue.put(command)
-                    result = self.read_queue.get()
-                    if result == "OK":
-                        self.send("OK")
-                    else:
-                        self.logger.error("ISSUE!")
-                elif command == "RESET_TL":
-                    self.reset_time_limit("TL")
-                    self.send("OK")
-                elif command == "RESET_BK":
-                    self.reset_time_limit("BK")
-                    self.send("OK")
-                elif command == "RESET_RB":
-                    self.reset_time_limit("RB")
-                    self.send("OK")
-                elif 'SET_PRESSURE_TARGET: ' in command:
-                    pressure_target = command.split(' ')[1]
-                    self.settings.update_setting("Pressione_Uscita_Target", pressure_target)
-                    self.write_queue.put('RESET_PRESSURE_TARGET')
-                    result = self.read_queue.get()
-                    if result == "OK":
-                        self.send(result)
-                    else:
-                        self.logger.error("ISSUE!")
+                command = self.receive_or_reconnect(self.link_monitor.profile.receive_timeout)
+                answer = self.execute(command)
+                if answer is not None:
+                    self.send(self.encode_answer(answer))
             time.sleep(1)
@@ -0,0 +1,94 @@
+import json
+from collections import deque
+
+
+class StartTracker:
+    """
+    Counts the starts of the pumps in a sliding time window, for the
+    anti-drip: too many starts in a short time mean that the plant is
+    leaking, and the pumps must not be started again.
+
+    The tracker is driven by the transitions of the running state of
+    every pump (started/stopped), not by polling. A start counts once
+    the pump has been running for at least min_duration seconds: a
+    pending start is promoted when the pump stops, or when the tracker
+    is queried while it is still running.
+
+    The times of the counted starts are kept in a deque, oldest first,
+    and dropped from the left as they leave the window, so every event
+    costs O(1) amortized. Times are wall clock seconds, so that they can
+    be saved and reloaded across restarts (see to_json and load_json).
+    """
+
+    def __init__(self, window: float, min_duration: float, limit: int):
+        """
+        :param window: the length of the sliding window in seconds.
+        :param min_duration: the minimum seconds the pumps must be
+            running for the start to be counted.
+        :param limit: the number of starts in the window that triggers
+            the anti-drip.
+        """
+        self.window = window
+        self.min_duration = min_duration
+        self.limit = limit
+        self.starts = deque()
+        # Start time of the pumps running and not yet counted, by pump
+        self.pending = {}
+
+    def started(self, now: float, pump) -> None:
+        self.pending.setdefault(pump, now)
+
+    def stopped(self, now: float, pump) -> bool:
+        """
+        :return: True if the start has been counted.
+        """
+        counted = self.promote(now, pump)
+        self.pending.pop(pump, None)
+        return counted
+
+    def promote(self, now: float, pump=None) -> bool:
+        """
+        Counts the pending starts of the pumps that have been running
+        long enough.
+
+        :param pump: if not None, only the start of this pump is
+            considered.
+        :return: True if a start has been counted.
+        """
+        pumps = list(self.pending) if pump is None else [pump]
+        promoted = sorted(self.pending.pop(pump) for pump in pumps
+                          if pump in self.pending and now - self.pending[pump] >= self.min_duration)
+        self.starts.extend(promoted)
+        return bool(promoted)
+
+    def expire(self, now: float) -> None:
+        while self.starts and now - self.starts[0] > self.window:
+            self.starts.popleft()
+
+    def count(self, now: float) -> int:
+        """
+        :return: the number of starts counted in the window ending at
+                 now.
+        """
+        self.promote(now)
+        self.expire(now)
+        return len(self.starts)
+
+    def is_exceeded(self, now: float) -> bool:
+        return self.count(now) >= self.limit
+
+    def to_json(self) -> str:
+        return json.dumps(list(self.starts))
+
+    def load_json(self, value: str, now: float) -> None:
+        """
+        Restores the starts saved with to_json. Corrupted values are
+        ignored.
+        """
+        try:
+            starts = sorted(float(start) for start in json.loads(value))
+        except (ValueError, TypeError):
+            starts = []
+        # A clock set back after a restart must not keep old starts forever
+        self.starts = deque(start for start in starts if start <= now)
+        self.expire(now)
@@ -0,0 +1,106 @@
+from collections import deque
+
+
+class SummaryStatistics:
+    """
+    Aggregates the signals of the control loop into fixed periods (one
+    hour by default), aligned to the wall clock, so that the server can
+    get the behaviour of the plant without downloading the raw samples:
+
+     - the min, max and mean outlet pressure;
+     - the starts, the running time and the time in fault of every
+       pump;
+     - the anti-drip activations.
+
+    Every aggregate is updated in place at every sample, so the memory
+    used does not depend on the number of samples. When a period ends
+    its summary is closed and kept, up to history periods.
+    """
+    MAX_SAMPLE_INTERVAL = 10
+
+    def __init__(self, period=3600, history=48):
+        """
+        :param period: the length of the periods in seconds.
+        :param history: the number of completed periods kept.
+        """
+        self.period = period
+        self.completed = deque(maxlen=history)
+        self.current = None
+        self.last_sample = None
+
+    def __open(self, now: float) -> None:
+        self.current = {"start": now - now % self.period,
+                        "samples": 0,
+                        "outlet_pressure": {"min": None, "max": None, "sum": 0.0},
+                        "starts": {},
+                        "runtime_s": {},
+                        "fault_s": {},
+                        "anti_drip": 0}
+
+    def __roll(self, now: float) -> None:
+        # Opens the period now belongs to, closing the current one
+        if self.current is not None and now < self.current["start"] + self.period:
+            return
+        if self.current is not None:
+            self.completed.append(self.__close(self.current))
+        self.__open(now)
+
+    def __close(self, period: dict) -> dict:
+        pressure = period["outlet_pressure"]
+        samples = period["samples"]
+        return {"start": period["start"],
+                "samples": samples,
+                "outlet_pressure": {"min": pressure["min"], "max": pressure["max"],
+                                    "mean": round(pressure["sum"] / samples, 2) if samples > 0 else None},
+                "starts": dict(period["starts"]),
+                "runtime_s": {node_id: round(seconds) for node_id, seconds in period["runtime_s"].items()},
+                "fault_s": {node_id: round(seconds) for node_id, seconds in period["fault_s"].items()},
+                "anti_drip": period["anti_drip"]}
+
+    def sample(self, now: float, outlet_pressure: float, running: list, faulty: list) -> None:
+        """
+        :param now: the time of the sample, as time.time().
+        :param outlet_pressure: the outlet pressure in bar.
+        :param running: the ids of the running pumps.
+        :param faulty: the ids of the pumps in fault.
+        """
+        self.__roll(now)
+        # The state of the pumps is held since the previous sample. Long
+        # gaps (e.g. a clock adjustment) are not counted
+        elapsed = 0 if self.last_sample is None else min(max(now - self.last_sample, 0), self.MAX_SAMPLE_INTERVAL)
+        self.last_sample = now
+        period = self.current
+        period["samples"] += 1
+        pressure = period["outlet_pressure"]
+        if pressure["min"] is None or outlet_pressure < pressure["min"]:
+            pressure["min"] = outlet_pressure
+        if pressure["max"] is None or outlet_pressure > pressure["max"]:
+            pressure["max"] = outlet_pressure
+        pressure["sum"] += outlet_pressure
+        for node_id in running:
+            period["runtime_s"][node_id] = period["runtime_s"].get(node_id, 0) + elapsed
+        for node_id in faulty:
+            period["fault_s"][node_id] = period["fault_s"].get(node_id, 0) + elapsed
+
+    def pump_started(self, now: float, node_id: int) -> None:
+        self.__roll(now)
+        self.current["starts"][node_id] = self.current["starts"].get(node_id, 0) + 1
+
+    def anti_drip_activated(self, now: float) -> None:
+        self.__roll(now)
+        self.current["anti_drip"] += 1
+
+    def summary(self, since=None) -> dict:
+        """
+        :param since: if not None, only the periods starting after this
+            time are returned, so that the server gets every period once.
+        :return: the length of the periods and the summaries of the
+                 completed periods, oldest first, followed by the one in
+                 progress.
+        """
+        periods = list(self.completed)
+        if self.current is not None:
+            periods.append(self.__close(self.current))
+        if since is not None:
+            periods = [period for period in periods if period["start"] > since]
+        return {"period": self.period, "periods": periods}
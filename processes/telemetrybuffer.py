@@ -0,0 +1,88 @@
+from array import array
+
+
+class TelemetryBuffer:
+    """
+    A fixed-size ring buffer of the signals sampled by the control loop,
+    stored by column: every signal is an array.array of the given type
+    code, plus one column of timestamps.
+
+    The memory used is allocated once and does not depend on the
+    uptime: when the buffer is full, the oldest sample is overwritten.
+    GET_INFO and the trend queries read the samples from here instead
+    of reading the bus again.
+    """
+
+    def __init__(self, columns: dict, capacity: int):
+        """
+        :param columns: the name and the array type code of every
+            signal, e.g. {"outlet_pressure": 'd', "running": 'B'}.
+        :param capacity: the maximum number of samples kept.
+        """
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(capacity * array('d').itemsize))
+        self.columns = {name: array(typecode, bytes(capacity * array(typecode).itemsize))
+                        for name, typecode in columns.items()}
+        # Index of the next sample to be written
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp: float, values: dict) -> None:
+        """
+        Adds a sample, overwriting the oldest one if the buffer is full.
+
+        :param timestamp: the time.monotonic() value of the sample.
+        :param values: the value of every column.
+        """
+        self.timestamps[self.head] = timestamp
+        for name, column in self.columns.items():
+            column[self.head] = values[name]
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __newest_first(self):
+        # Indices of the samples, from the newest to the oldest
+        for offset in range(1, self.count + 1):
+            yield (self.head - offset) % self.capacity
+
+    def latest(self):
+        """
+        :return: the newest sample as a dict, with its timestamp, or
+                 None if the buffer is empty.
+        """
+        if self.count == 0:
+            return None
+        index = (self.head - 1) % self.capacity
+        sample = {name: column[index] for name, column in self.columns.items()}
+        sample["timestamp"] = self.timestamps[index]
+        return sample
+
+    def window(self, name: str, seconds: float, max_points=None) -> tuple:
+        """
+        :param name: the column to read.
+        :param seconds: how far back to go from the newest sample.
+        :param max_points: if not None, the samples are decimated so
+            that at most max_points are returned.
+        :return: the ages in seconds (relative to the newest sample) and
+                 the values of the column, from the oldest to the newest.
+        """
+        column = self.columns[name]
+        indices = []
+        newest = None
+        for index in self.__newest_first():
+            if newest is None:
+                newest = self.timestamps[index]
+            elif newest - self.timestamps[index] > seconds:
+                break
+            indices.append(index)
+        indices.reverse()
+        if max_points is not None and len(indices) > max_points:
+            step = -(-len(indices) // max_points)
+            # The newest sample is always kept
+            indices = indices[::-1][::step][::-1]
+        ages = [round(self.timestamps[index] - newest, 3) for index in indices]
+        return ages, [column[index] for index in indices]
+
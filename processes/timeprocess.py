@@ -1,88 +1,124 @@
-from time import perf_counter, sleep
 from picandb.settingsmanager import SettingsManager
+from processes.clock import SystemClock
 
 
-# TODO proper class conversion
-def time_increase(seconds, minutes, hours):
+def time_increase(seconds, minutes, hours, increment=1):
     """
-    Takes hours, minutes and seconds and increases them by one second.
+    Takes hours, minutes and seconds and increases them by increment
+    seconds (one by default).
     :param seconds: the second
     :param minutes: the minute
     :param hours: the hour count (can be over 24)
+    :param increment: the seconds to add
     :return: the increased time as seconds, minutes and hours
     """
-    seconds += 1
-    if seconds == 60:
-        minutes += 1
-        seconds = 0
-    if minutes == 60:
-        hours += 1
-        minutes = 0
-    return seconds, minutes, hours
+    total = hours * 3600 + minutes * 60 + seconds + increment
+    return total % 60, total // 60 % 60, total // 3600
 
 
-def time_updater(reset=0):
-    # This process will take care of updating the many time
-    # variables in the database. Since database access time
-    # may be significant, and an high-precision clock is needed
-    # in order to avoid time drifts, perf_counter() will be used
-    # sleep() will be considered "not precise"
-    settings = SettingsManager("piCANclient.db")
-    tl_limit = int(settings.get_setting("impianto_TL_Counter_SetCounter"))
-    bk_limit = int(settings.get_setting("impianto_BK_Counter_SetCounter"))
-    rb_limit = int(settings.get_setting("impianto_RB_Counter_SetCounter"))
-    run = int(settings.get_setting("Operator_Pump_start"))
-    start_time = perf_counter()
-    while True:
-        if reset == 1:
-            # TODO wait until reset is 0
-            end_time = perf_counter()
-            remaining_time = 1 - (end_time - start_time)
-            sleep(remaining_time)
-            start_time = perf_counter()
-
-        if run == 1 and reset == 0:
+class TimeUpdater:
+    """
+    Updates the time counters in the database: the RB, BK and TL
+    counters while the operator wants the pumps running, and the
+    runtime of every pump started by the CanProcess (START_pompa_N),
+    used to rotate them. When the RB, BK or TL counter reaches its
+    limit, it stops and the corresponding SERVICE setting is set.
 
-            rb_hour = int(settings.get_setting("impianto_RB_Counter_hour"))
-            rb_min = int(settings.get_setting("impianto_RB_Counter_min"))
-            rb_seconds = int(settings.get_setting("impianto_RB_Counter_sec"))
-            if rb_hour < rb_limit:
-                rb_seconds, rb_min, rb_hour = time_increase(rb_seconds, rb_min, rb_hour)
-                if rb_hour >= rb_limit:
-                    settings.update_setting("impianto_RB_SERVICE", 1)
+    The seconds counted are written every flush_period seconds, all in
+    one transaction. The time_updater process writes them at every
+    second, so that no counting is lost at a power cut and a reset of a
+    counter is never undone by seconds counted before it. Simulations
+    can write them once per simulated minute, so that the cost of a
+    simulated day does not grow with shorter ticks.
+    """
+    LIMITED_COUNTERS = ("RB", "BK", "TL")
+    PUMPS = range(1, 7)
+    UNITS = ("sec", "min", "hour")
 
-            bk_hour = int(settings.get_setting("impianto_BK_Counter_hour"))
-            bk_min = int(settings.get_setting("impianto_BK_Counter_min"))
-            bk_seconds = int(settings.get_setting("impianto_BK_Counter_sec"))
-            if bk_hour < bk_limit:
-                bk_seconds, bk_min, bk_hour = time_increase(bk_seconds, bk_min, bk_hour)
-                if bk_hour >= bk_limit:
-                    settings.update_setting("impianto_BK_SERVICE", 1)
+    def __init__(self, settings: SettingsManager, flush_period=1):
+        """
+        :param settings: the SettingsManager of the installation.
+        :param flush_period: the seconds counted between two writes to
+            the database.
+        """
+        self.settings = settings
+        self.flush_period = flush_period
+        self.limits = {name: int(settings.get_setting(f"impianto_{name}_Counter_SetCounter"))
+                       for name in self.LIMITED_COUNTERS}
+        self.flags = ["Operator_Pump_start"] + [f"START_pompa_{pump}" for pump in self.PUMPS]
+        # Seconds counted and not written yet, by counter name
+        self.pending = {}
+        self.unflushed = 0
 
-            tl_hour = int(settings.get_setting("impianto_TL_Counter_hour"))
-            tl_min = int(settings.get_setting("impianto_TL_Counter_min"))
-            tl_seconds = int(settings.get_setting("impianto_TL_Counter_sec"))
-            if tl_hour < tl_limit:
-                tl_seconds, tl_min, tl_hour = time_increase(tl_seconds, tl_min, tl_hour)
-                if tl_hour >= tl_limit:
-                    settings.update_setting("impianto_TL_SERVICE", 1)
+    def tick(self, seconds, flags=None) -> None:
+        """
+        Counts seconds of time for the counters that are running now.
 
-            settings.update_setting("impianto_RB_Counter_hour", rb_hour)
-            settings.update_setting("impianto_RB_Counter_min", rb_min)
-            settings.update_setting("impianto_RB_Counter_sec", rb_seconds)
+        :param seconds: the seconds elapsed since the last tick.
+        :param flags: the Operator_Pump_start and START_pompa_N values,
+            if the caller knows them (missing pumps are stopped). None
+            reads them from the database.
+        """
+        if flags is None:
+            flags = self.settings.get_settings(self.flags)
+        if int(flags.get("Operator_Pump_start", 0)) == 1:
+            counters = list(self.LIMITED_COUNTERS)
+            counters += [f"Pompa_{pump}" for pump in self.PUMPS if int(flags.get(f"START_pompa_{pump}", 0)) == 1]
+            for name in counters:
+                self.pending[name] = self.pending.get(name, 0) + seconds
+        self.unflushed += seconds
+        if self.unflushed >= self.flush_period:
+            self.flush()
 
-            settings.update_setting("impianto_BK_Counter_hour", bk_hour)
-            settings.update_setting("impianto_BK_Counter_min", bk_min)
-            settings.update_setting("impianto_BK_Counter_sec", bk_seconds)
+    def flush(self) -> None:
+        """
+        Adds the seconds counted to the counters in the database.
+        """
+        if self.pending:
+            keys = [f"impianto_{name}_Counter_{unit}" for name in self.pending for unit in self.UNITS]
+            current = self.settings.get_settings(keys)
+            values = {}
+            for name, increment in self.pending.items():
+                seconds, minutes, hours = (int(current[f"impianto_{name}_Counter_{unit}"]) for unit in self.UNITS)
+                limit = self.limits.get(name)
+                if limit is not None and hours >= limit:
+                    continue
+                seconds, minutes, hours = time_increase(seconds, minutes, hours, increment)
+                values[f"impianto_{name}_Counter_sec"] = seconds
+                values[f"impianto_{name}_Counter_min"] = minutes
+                values[f"impianto_{name}_Counter_hour"] = hours
+                if limit is not None and hours >= limit:
+                    values[f"impianto_{name}_SERVICE"] = 1
+            if values:
+                self.settings.update_settings(values)
+        self.pending = {}
+        self.unflushed = 0
 
-            settings.update_setting("impianto_TL_Counter_hour", tl_hour)
-            settings.update_setting("impianto_TL_Counter_min", tl_min)
-            settings.update_setting("impianto_TL_Counter_sec", tl_seconds)
 
-        run = int(settings.get_setting("Operator_Pump_start"))
+def time_updater(reset=0, namespace=None, clock=None, tick=1, duration=None, database_path="piCANclient.db"):
+    # This process will take care of updating the many time
+    # variables in the database (see TimeUpdater). An high-precision
+    # clock is needed in order to avoid time drifts, so the time spent
+    # is measured and subtracted from the wait, as sleep() will be
+    # considered "not precise"
+    # In gateway mode there's a time_updater for every installation
+    # In simulations, clock is a VirtualClock, tick can be raised to
+    # update the counters once every tick seconds and duration limits
+    # the seconds to be simulated (None means forever)
+    if clock is None:
+        clock = SystemClock()
+    updater = TimeUpdater(SettingsManager(database_path, namespace))
+    start_time = clock.monotonic()
+    elapsed = 0
+    while duration is None or elapsed < duration:
+        # TODO wait until reset is 0
+        if reset == 0:
+            updater.tick(tick)
 
         # Higher precision delay implementation
-        end_time = perf_counter()
-        remaining_time = 1-(end_time-start_time)
-        sleep(remaining_time)
-        start_time = perf_counter()
+        end_time = clock.monotonic()
+        remaining_time = tick-(end_time-start_time)
+        clock.sleep(remaining_time)
+        start_time = clock.monotonic()
+        elapsed += tick
+    updater.flush()
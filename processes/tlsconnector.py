@@ -0,0 +1,69 @@
+import logging
+import socket as sk
+import ssl
+import time
+
+
+class TlsConnector:
+    """
+    Wraps the connections to the server in TLS, resuming the previous
+    TLS session whenever possible.
+
+    A full handshake needs two round trips and the certificate
+    exchange, which is expensive over 2G/3G and would be repeated at
+    every reconnection. The session obtained from the last successful
+    connection is offered to the server at the next handshake: if the
+    server accepts it (session ID or ticket resumption), the handshake
+    is abbreviated and no certificate is sent.
+
+    The same SSLContext must be used for every connection, which is
+    why the connector lives as long as the SocketProcess.
+
+    The duration of full and resumed handshakes is collected as
+    metrics.
+    """
+
+    def __init__(self, server_hostname: str, ca_file=None):
+        """
+        :param server_hostname: the name the server certificate must be
+            valid for.
+        :param ca_file: the certificate (or CA) the server certificate
+            is verified against. If None, the system CAs are used.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.server_hostname = server_hostname
+        self.context = ssl.create_default_context(cafile=ca_file)
+        self.session = None
+        self.handshakes = {"full": 0, "resumed": 0}
+        self.handshake_time = {"full": 0.0, "resumed": 0.0}
+
+    def wrap(self, socket: sk.socket) -> ssl.SSLSocket:
+        """
+        Performs the TLS handshake on a connected socket.
+
+        :return: the TLS socket to be used instead of socket.
+        """
+        start = time.perf_counter()
+        tls_socket = self.context.wrap_socket(socket, server_hostname=self.server_hostname, session=self.session)
+        elapsed = time.perf_counter() - start
+        kind = "resumed" if tls_socket.session_reused else "full"
+        self.handshakes[kind] += 1
+        self.handshake_time[kind] += elapsed
+        self.logger.info(f"TLS handshake ({kind}) completed in {elapsed * 1000:.1f}ms")
+        return tls_socket
+
+    def save_session(self, tls_socket: ssl.SSLSocket) -> None:
+        """
+        Keeps the session for the next connection. With TLS 1.3 the
+        session ticket is sent by the server after the handshake, so
+        this must be called after some data has been received.
+        """
+        if tls_socket.session is not None:
+            self.session = tls_socket.session
+
+    def statistics(self) -> dict:
+        averages = {}
+        for kind, count in self.handshakes.items():
+            average = self.handshake_time[kind] / count if count > 0 else 0
+            averages[f"{kind}_handshake_avg_ms"] = round(average * 1000, 1)
+        return {"handshakes": dict(self.handshakes), **averages}
@@ -0,0 +1 @@
+__all__ = ['plant', 'pid_benchmark', 'tls_benchmark', 'anti_drip_scenarios', 'can_replay', 'clock_benchmark', 'ipc_benchmark']
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Replays deterministic sequences of pump starts and stops through the
+# StartTracker and checks when the anti-drip is triggered.
+# Run from the repository root with: python -m simulation.anti_drip_scenarios
+import sys
+from processes.starttracker import StartTracker
+
+WINDOW = 3600
+MIN_DURATION = 30
+LIMIT = 20
+
+
+def run_scenario(events, queries, restart_at=None):
+    """
+    :param events: (time, "start" or "stop") tuples, in time order.
+    :param queries: the times at which the starts are counted.
+    :param restart_at: if not None, the tracker is saved and reloaded
+        at this time, like at a restart of the CanProcess.
+    :return: the number of starts in the window at every query time.
+    """
+    tracker = StartTracker(WINDOW, MIN_DURATION, LIMIT)
+    timeline = [(t, 0, kind) for t, kind in events] + [(t, 1, "query") for t in queries]
+    if restart_at is not None:
+        timeline.append((restart_at, 2, "restart"))
+    counts = []
+    for t, _, kind in sorted(timeline):
+        if kind == "start":
+            tracker.started(t, 1)
+        elif kind == "stop":
+            tracker.stopped(t, 1)
+        elif kind == "restart":
+            saved = tracker.to_json()
+            tracker = StartTracker(WINDOW, MIN_DURATION, LIMIT)
+            tracker.load_json(saved, t)
+        else:
+            counts.append(tracker.count(t))
+    return counts
+
+
+def cycles(first, count, period, duration):
+    events = []
+    for n in range(count):
+        events += [(first + n * period, "start"), (first + n * period + duration, "stop")]
+    return events
+
+
+SCENARIOS = [
+    # name, events, queries, restart time, expected counts
+    ("short runs are not counted", cycles(0, 50, 60, 10), [3000], None, [0]),
+    ("long runs are counted", cycles(0, 10, 60, 40), [600], None, [10]),
+    ("exactly min duration counts", [(0, "start"), (30, "stop")], [31], None, [1]),
+    ("counted while still running", [(0, "start")], [29, 30, 4000], None, [0, 1, 0]),
+    ("repeated start while running", [(0, "start"), (10, "start"), (35, "stop")], [40], None, [1]),
+    ("sliding, not tumbling, window", cycles(3000, 20, 60, 40), [3000 + 19 * 60 + 40, 7080, 7560], None,
+     [20, 12, 4]),
+    ("limit exceeded, not only reached", cycles(0, 25, 60, 40), [1600], None, [25]),
+    ("survives a restart", cycles(0, 10, 60, 40), [900, 4200], 700, [10, 0]),
+]
+
+
+def main():
+    failures = 0
+    for name, events, queries, restart_at, expected in SCENARIOS:
+        counts = run_scenario(events, queries, restart_at)
+        outcome = "ok" if counts == expected else "FAILED"
+        failures += counts != expected
+        print(f"{name}: {counts} (expected {expected}) {outcome}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# Plays CAN logs recorded in the field back on a bus, to reproduce an
+# incident or to benchmark a controller change against real traffic.
+# Run from the repository root with:
+#   python -m simulation.can_replay recordings/can0_*.canlog.gz --channel vcan0 --speed 10
+# A vcan interface can be created with:
+#   ip link add dev vcan0 type vcan && ip link set vcan0 up
+import argparse
+from interfaces.canreplayer import CanReplayer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", nargs='+', help="the log files, in chronological order")
+    parser.add_argument("--channel", default="vcan0")
+    parser.add_argument("--bustype", default="socketcan")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 0 for no waiting")
+    parser.add_argument("--nodes-only", action="store_true", help="skip the frames sent by the controller")
+    args = parser.parse_args()
+    replayer = CanReplayer(sorted(args.logs), channel=args.channel, bustype=args.bustype, speed=args.speed,
+                           nodes_only=args.nodes_only)
+    print(replayer.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Counts a simulated day of operation with the TimeUpdater on a
+# VirtualClock, with the pumps always running, and reports the
+# wall-clock time taken for different tick lengths. Like the simulations,
+# the counters are written at most once per simulated minute, so a 1s
+# tick costs about as much as a 60s one when the flags are known. The
+# time_updater process reads the flags and writes the counters at every
+# tick, which is measured too.
+# Run from the repository root with: python -m simulation.clock_benchmark
+# The databases are created in a temporary directory.
+import argparse
+import os
+import tempfile
+import time
+from picandb.settingsmanager import SettingsManager
+from processes.clock import VirtualClock
+from processes.timeprocess import TimeUpdater, time_updater
+
+
+def benchmark(directory, tick, hours, rb_limit, read_flags):
+    database_path = os.path.join(directory, f"benchmark_{tick}_{read_flags}.db")
+    settings = SettingsManager(database_path)
+    settings.update_settings({"Operator_Pump_start": 1,
+                              "START_pompa_1": 1,
+                              "impianto_RB_Counter_SetCounter": rb_limit,
+                              "impianto_BK_Counter_SetCounter": 1080,
+                              "impianto_TL_Counter_SetCounter": 4})
+    clock = VirtualClock()
+    start = time.perf_counter()
+    if read_flags:
+        # The time_updater process, reading the flags at every tick
+        time_updater(clock=clock, tick=tick, duration=hours * 3600, database_path=database_path)
+    else:
+        # Like the simulations, which know the flags
+        updater = TimeUpdater(settings, flush_period=60)
+        flags = {"Operator_Pump_start": 1, "START_pompa_1": 1}
+        while clock.monotonic() < hours * 3600:
+            updater.tick(tick, flags)
+            clock.sleep(tick)
+        updater.flush()
+    elapsed = time.perf_counter() - start
+    return {"tick_s": tick,
+            "read_flags": read_flags,
+            "simulated_h": round(clock.monotonic() / 3600, 2),
+            "wall_s": round(elapsed, 2),
+            "simulated_h_per_wall_s": round(clock.monotonic() / 3600 / elapsed, 2),
+            "rb_hours": int(settings.get_setting("impianto_RB_Counter_hour")),
+            "rb_service": settings.get_setting("impianto_RB_SERVICE"),
+            "tl_service": settings.get_setting("impianto_TL_SERVICE"),
+            "pump_1_hours": int(settings.get_setting("impianto_Pompa_1_Counter_hour"))}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rb-limit", type=int, default=720, help="RB limit in hours")
+    parser.add_argument("--hours", type=float, default=24, help="simulated hours")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for read_flags in (False, True):
+            for tick in (1, 60, 3600):
+                print(benchmark(directory, tick, args.hours, args.rb_limit, read_flags))
+
+
+if __name__ == "__main__":
+    main()
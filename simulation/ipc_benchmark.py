@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Compares the IPC transports between the SocketProcess and a
+# CanProcess: a stand-in CanProcess answers every command with a
+# message shaped like the real ones, and the round trip is measured.
+# Run from the repository root with: python -m simulation.ipc_benchmark
+import argparse
+import statistics
+import time
+from multiprocessing import Process
+from processes.transport import create_transport
+
+# Like CanProcess.__build_data__: settings come from the database as
+# strings, the signals from the telemetry buffer
+INFO = {"inlet_pressure": 1, "inlet_temperature": 0, "outlet_pressure": 1003, "outlet_pressure_target": "100",
+        "working_hours_counter": "1234", "working_minutes_counter": "56", "anti_drip": False, "alarms": "[]",
+        "tl_service": "0", "bk_service": "0", "rb_service": "0", "run": True, "running": True}
+# Like CanProcess.__build_metrics__
+METRICS = {"output": {"writes": 123456, "suppressed": 654321, "latency_avg_ms": 0.21, "latency_max_ms": 3.4},
+           "supervision": {"discoveries": 2, "latency_avg_ms": 812.5, "latency_max_ms": 1210.2,
+                           "nodes": {"1": "active", "2": "active", "3": "silent"}},
+           "node_pool": {"operations": 5400, "speedup": 2.7}}
+ANSWERS = {"GET_INFO": INFO, "GET_METRICS": METRICS, "STOP": "OK"}
+
+
+def can_process_stand_in(read_queue, write_queue):
+    while True:
+        command = read_queue.get()
+        if command is None:
+            return
+        write_queue.put(ANSWERS[command])
+
+
+def benchmark(kind, command, messages):
+    can_read_queue, can_write_queue, socket_read_queue, socket_write_queue = create_transport(kind)
+    process = Process(target=can_process_stand_in, args=(can_read_queue, can_write_queue))
+    process.start()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(messages):
+        sent = time.perf_counter()
+        socket_write_queue.put(command)
+        socket_read_queue.get()
+        latencies.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - start
+    socket_write_queue.put(None)
+    process.join()
+    latencies.sort()
+    return {"transport": kind,
+            "command": command,
+            "messages_per_s": round(messages / elapsed),
+            "latency_median_us": round(statistics.median(latencies) * 1000000, 1),
+            "latency_p99_us": round(latencies[int(len(latencies) * 0.99)] * 1000000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+    for command in ANSWERS:
+        for kind in ("queue", "pipe"):
+            print(benchmark(kind, command, args.messages))
+
+
+if __name__ == "__main__":
+    main()
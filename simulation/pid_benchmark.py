@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# Compares the old proportional controller of CanProcess with the
+# PidController on a simulated hour of operation.
+# Run from the repository root with: python -m simulation.pid_benchmark
+from processes.pidcontroller import PidController
+from simulation.plant import PressurePlant
+
+TARGET = 100
+DT = 0.05
+DURATION = 3600
+# (start second, demand in l/min)
+DEMAND_PROFILE = [(0, 4.0), (600, 8.0), (1200, 12.0), (1800, 2.0), (2400, 0.0), (3000, 6.0)]
+TOLERANCE = 2
+
+
+def demand_at(t):
+    demand = 0
+    for start, value in DEMAND_PROFILE:
+        if t >= start:
+            demand = value
+    return demand
+
+
+class LegacyController:
+    """
+    The controller CanProcess used before the PID: once per second,
+    speed = min(difference * 30, 3000), stop as soon as the target is
+    reached.
+    """
+    period = 1
+
+    def __init__(self):
+        self.running = False
+        self.starts = 0
+
+    def step(self, pressure):
+        difference = TARGET - pressure
+        if difference > 0:
+            if not self.running:
+                self.running = True
+                self.starts += 1
+            return min(difference * 30, 3000)
+        self.running = False
+        return 0
+
+
+class PidStrategy:
+    """
+    The control_step of CanProcess, with the default settings.
+    """
+
+    def __init__(self, kp=30, ki=5, kd=0, period=0.2, rate_limit=600, hysteresis=2):
+        self.period = period
+        self.hysteresis = hysteresis
+        self.pid = PidController(kp, ki, kd, period, output_min=0, output_max=3000, rate_limit=rate_limit)
+        self.running = False
+        self.starts = 0
+
+    def step(self, pressure):
+        if not self.running:
+            if pressure < TARGET - self.hysteresis:
+                self.pid.reset(0)
+                self.running = True
+                self.starts += 1
+            else:
+                return 0
+        elif pressure > TARGET + self.hysteresis:
+            self.pid.reset(0)
+            self.running = False
+            return 0
+        return self.pid.update(TARGET, pressure)
+
+
+def simulate(controller):
+    """
+    :return: a dictionary with the settling time after every demand
+             change, the number of starts per hour and the mean
+             absolute error.
+    """
+    plant = PressurePlant()
+    steps_per_control = round(controller.period / DT)
+    change_times = [start for start, _ in DEMAND_PROFILE]
+    settling_times = []
+    last_outside = 0
+    error_sum = 0
+    steps = int(DURATION / DT)
+    for i in range(steps):
+        t = i * DT
+        if t in change_times and t > 0:
+            settling_times.append(last_outside - change_times[change_times.index(t) - 1])
+            last_outside = t
+        plant.demand = demand_at(t)
+        if i % steps_per_control == 0:
+            plant.speed = controller.step(plant.pressure)
+        pressure = plant.step(DT)
+        if abs(pressure - TARGET) > TOLERANCE:
+            last_outside = t
+        error_sum += abs(pressure - TARGET)
+    settling_times.append(last_outside - change_times[-1])
+    settling_times = [None if settling >= 600 - 1 else settling for settling in settling_times]
+    return {"settling_times": settling_times,
+            "starts_per_hour": controller.starts * 3600 / DURATION,
+            "mean_abs_error": error_sum / steps}
+
+
+def main():
+    for name, controller in (("legacy", LegacyController()), ("pid", PidStrategy())):
+        result = simulate(controller)
+        settling = ", ".join("never" if s is None else f"{s:.1f}s" for s in result["settling_times"])
+        print(f"{name:>6}: settling within ±{TOLERANCE} bar after each demand change: {settling}")
+        print(f"{'':>6}  starts per hour: {result['starts_per_hour']:.0f},"
+              f" mean absolute error: {result['mean_abs_error']:.2f} bar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+from interfaces.faulthistory import FaultHistory
+
+
+class PressurePlant:
+    """
+    A very simple model of the hydraulic circuit, good enough to
+    compare pressure controllers offline.
+
+    The pumps deliver a flow proportional to their speed, reduced as
+    the outlet pressure approaches the maximum head. Users draw the
+    demand flow, and a small leak makes the pressure decay slowly even
+    when nobody is drawing water, which is what causes the pumps to
+    restart periodically.
+    """
+
+    def __init__(self, max_rpm=3000, max_flow=40.0, max_head=200.0, capacity=0.1, leak=0.005):
+        """
+        :param max_rpm: the speed at which the pumps deliver max_flow.
+        :param max_flow: the flow in l/min at max_rpm and no pressure.
+        :param max_head: the pressure in bar at which the flow is zero.
+        :param capacity: l/min needed to raise the pressure by one bar
+            per second.
+        :param leak: l/min lost for every bar of pressure.
+        """
+        self.max_rpm = max_rpm
+        self.max_flow = max_flow
+        self.max_head = max_head
+        self.capacity = capacity
+        self.leak = leak
+        self.pressure = 0.0
+        self.speed = 0.0
+        self.demand = 0.0
+
+    def step(self, dt: float) -> float:
+        """
+        Advances the simulation by dt seconds.
+
+        :return: the new outlet pressure in bar.
+        """
+        flow_in = self.max_flow * (self.speed / self.max_rpm) * max(0.0, 1 - self.pressure / self.max_head)
+        flow_out = (self.demand + self.leak * self.pressure) if self.pressure > 0 else 0.0
+        self.pressure = max(0.0, self.pressure + (flow_in - flow_out) / self.capacity * dt)
+        return self.pressure
+
+
+class SimulatedNode:
+    def __init__(self, node_id: int):
+        self.id = node_id
+
+
+class PlantNetwork:
+    """
+    Stands in for the CanNetwork of a CanProcess, so that the whole
+    process can run on a VirtualClock: the pumps drive a PressurePlant
+    instead of the inverters, and the plant is advanced to the time of
+    the clock whenever the pressure is read.
+
+    The nodes are always available and never faulty, and every
+    setpoint takes effect immediately.
+    """
+
+    def __init__(self, plant: PressurePlant, clock, demand, pumps=2, step=0.05):
+        """
+        :param plant: the model of the hydraulic circuit.
+        :param clock: the clock of the CanProcess.
+        :param demand: a function returning the demand in l/min at the
+            given clock.monotonic() time.
+        :param pumps: the number of pumps, with node ids from 1.
+        :param step: the maximum integration step of the plant.
+        """
+        self.plant = plant
+        self.clock = clock
+        self.demand = demand
+        self.step = step
+        self.nodes_list = [SimulatedNode(node_id) for node_id in range(1, pumps + 1)]
+        self.speeds = {}
+        self.running = set()
+        self.fault_history = FaultHistory()
+        self.last_update = None
+
+    def update(self) -> None:
+        now = self.clock.monotonic()
+        if self.last_update is not None:
+            self.plant.speed = sum(self.speeds.get(node_id, 0) for node_id in self.running)
+            self.plant.demand = self.demand(now)
+            remaining = now - self.last_update
+            while remaining > 0:
+                self.plant.step(min(remaining, self.step))
+                remaining -= self.step
+        self.last_update = now
+
+    def read_outlet_pressure(self):
+        # In tenths of bar, like the sensor
+        self.update()
+        return round(self.plant.pressure * 10)
+
+    def read_inlet_pressure(self):
+        return 1
+
+    def read_inlet_temperature(self):
+        return 20
+
+    def is_available(self, node) -> bool:
+        return True
+
+    def is_faulty(self, node) -> bool:
+        return False
+
+    def is_running(self, node) -> bool:
+        return node.id in self.running
+
+    def get_node_speed(self, node):
+        return self.speeds.get(node.id, 0)
+
+    def set_node_speed(self, node, rpm) -> None:
+        self.update()
+        self.speeds[node.id] = rpm
+
+    def run_nodes(self, nodes: list) -> None:
+        self.update()
+        self.running.update(node.id for node in nodes)
+
+    def halt_nodes(self, nodes: list) -> None:
+        self.update()
+        for node in nodes:
+            self.speeds[node.id] = 0
+            self.running.discard(node.id)
+
+    def stop_all_nodes(self) -> None:
+        self.update()
+        self.running.clear()
+
+    def supervise(self) -> list:
+        return []
+
+    def get_faulty_nodes(self) -> list:
+        return []
+
+    def get_fault_history(self) -> dict:
+        return self.fault_history.history()
+
+    def connect(self) -> None:
+        pass
+
+    def initialize_nodes(self) -> None:
+        pass
+
+    def reset_faulty_nodes(self) -> None:
+        pass
+
+    def advance_enabling(self) -> None:
+        pass
+
+    def print_all_states(self) -> None:
+        pass
+
+    def get_output_statistics(self) -> dict:
+        return {}
+
+    def get_supervision_statistics(self) -> dict:
+        return {}
+
+    def get_node_pool_statistics(self) -> dict:
+        return {}
+
+    def get_bus_statistics(self) -> dict:
+        return {}
+
+    def get_recording_statistics(self):
+        return None
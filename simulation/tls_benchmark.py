@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Measures full and resumed TLS handshakes of the TlsConnector against
+# a local stand-in of the server, reached through a proxy that adds the
+# round trip time of a 2G/3G link.
+# Run from the repository root with: python -m simulation.tls_benchmark
+# A self-signed certificate is generated with the openssl command.
+import argparse
+import os
+import socket as sk
+import ssl
+import subprocess
+import tempfile
+import time
+from threading import Thread
+from processes.tlsconnector import TlsConnector
+
+
+def create_certificate(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                    "-days", "1", "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost"],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return cert, key
+
+
+def server_thread(listener, context):
+    # Like the real server, ask for identification right away
+    while True:
+        connection, _ = listener.accept()
+        try:
+            with context.wrap_socket(connection, server_side=True) as tls_connection:
+                tls_connection.send(b"ID_SUPPLICANT")
+                tls_connection.recv(1024)
+        except (ssl.SSLError, OSError):
+            pass
+
+
+def forward(source, destination, delay):
+    try:
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            time.sleep(delay)
+            destination.sendall(data)
+    except OSError:
+        pass
+    finally:
+        destination.close()
+
+
+def proxy_thread(listener, server_port, rtt):
+    # Half of the round trip time is added in each direction
+    while True:
+        client, _ = listener.accept()
+        server = sk.create_connection(("127.0.0.1", server_port))
+        for source, destination in ((client, server), (server, client)):
+            t = Thread(target=forward, args=(source, destination, rtt / 2))
+            t.daemon = True
+            t.start()
+
+
+def listen():
+    listener = sk.socket(sk.AF_INET, sk.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    return listener
+
+
+def benchmark(cert, key, rtt, reconnections, tls_version):
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    server_context.maximum_version = tls_version
+    server = listen()
+    proxy = listen()
+    for target, args in ((server_thread, (server, server_context)),
+                         (proxy_thread, (proxy, server.getsockname()[1], rtt))):
+        t = Thread(target=target, args=args)
+        t.daemon = True
+        t.start()
+
+    connector = TlsConnector("localhost", ca_file=cert)
+    for _ in range(reconnections + 1):
+        socket = sk.create_connection(("127.0.0.1", proxy.getsockname()[1]))
+        tls_socket = connector.wrap(socket)
+        tls_socket.recv(1024)
+        connector.save_session(tls_socket)
+        tls_socket.send(b"111222333444555")
+        tls_socket.close()
+    return connector.statistics()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=0.3, help="round trip time in seconds")
+    parser.add_argument("--reconnections", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = create_certificate(directory)
+        for name, version in (("TLS 1.2", ssl.TLSVersion.TLSv1_2), ("TLS 1.3", ssl.TLSVersion.TLSv1_3)):
+            statistics = benchmark(cert, key, args.rtt, args.reconnections, version)
+            print(f"{name}, rtt {args.rtt * 1000:.0f}ms: {statistics}")
+
+
+if __name__ == "__main__":
+    main()
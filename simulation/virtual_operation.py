@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Runs a whole CanProcess, with its time counters, on a VirtualClock
+# against a model of the plant, and checks that the anti-drip and the
+# RB/BK time limits stop the pumps when they should. About half a
+# simulated hour runs per wall-clock second with the 0.2s PID period of
+# the plant: the 24 hour scenario takes under a minute.
+# Run from the repository root with: python -m simulation.virtual_operation
+# The databases are created in a temporary directory.
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from queue import Queue
+from picandb.settingsmanager import SettingsManager
+from processes.canprocess import CanProcess
+from processes.clock import VirtualClock
+from processes.timeprocess import TimeUpdater
+from simulation.plant import PressurePlant, PlantNetwork
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+class SimulatedCanProcess(CanProcess):
+    """
+    A CanProcess that also counts the time limits, once per second of
+    virtual time, like the time_updater process does in real time, and
+    records the starts, the runtime and the pressure of every hour. The
+    counters are written once per simulated minute.
+    """
+    FLUSH_PERIOD = 60
+
+    def __init__(self, clock):
+        super().__init__(Queue(), Queue(), clock=clock)
+        self.time_updater = TimeUpdater(self.settings, self.FLUSH_PERIOD)
+        self.hourly = []
+        self.running_nodes = set()
+        self.was_anti_drip = False
+
+    def housekeeping(self):
+        super().housekeeping()
+        # The flags the time_updater would read from the database
+        flags = {f"START_pompa_{node.id}": int(self.can_network.is_running(node))
+                 for node in self.can_network.nodes_list}
+        flags["Operator_Pump_start"] = int(self.operator_pump_start)
+        self.time_updater.tick(1, flags)
+        self.record_hour()
+
+    def record_hour(self):
+        hour = int(self.clock.monotonic() // HOUR)
+        if not self.hourly or self.hourly[-1]["hour"] != hour:
+            self.hourly.append({"hour": hour, "starts": 0, "runtime_s": 0, "pressure_min": None,
+                                "pressure_max": None, "anti_drip": 0})
+        row = self.hourly[-1]
+        running = {node.id for node in self.can_network.nodes_list if self.can_network.is_running(node)}
+        row["starts"] += len(running - self.running_nodes)
+        row["runtime_s"] += len(running)
+        self.running_nodes = running
+        if self.outlet_pressure is not None:
+            if row["pressure_min"] is None:
+                row["pressure_min"] = row["pressure_max"] = self.outlet_pressure
+            row["pressure_min"] = min(row["pressure_min"], self.outlet_pressure)
+            row["pressure_max"] = max(row["pressure_max"], self.outlet_pressure)
+        if self.anti_drip and not self.was_anti_drip:
+            row["anti_drip"] += 1
+        self.was_anti_drip = self.anti_drip
+
+
+def dripping_valve(t):
+    # A valve that opens for 30s every 2 minutes, day and night
+    return 3.0 if t % 120 < 30 else 0.0
+
+
+def occasional_valve(t):
+    # The same valve, opening every 10 minutes
+    return 3.0 if t % 600 < 30 else 0.0
+
+
+def working_hours(t):
+    # Water is drawn from 6 to 22, nothing is drawn at night
+    return 6.0 if 6 * HOUR <= t % DAY < 22 * HOUR else 0.0
+
+
+def run_scenario(settings_values, demand, leak, hours, control_period):
+    """
+    :param settings_values: the settings that differ from the defaults.
+    :param demand: the demand in l/min as a function of the time.
+    :param leak: the leak of the plant, see PressurePlant.
+    :param hours: the hours of operation to simulate.
+    :param control_period: the PID period in seconds.
+    :return: the summary of every simulated hour, the time counters and
+             SERVICE settings at the end, and the wall-clock seconds
+             the simulation took.
+    """
+    settings = SettingsManager("piCANclient.db")
+    settings.update_settings(dict(settings_values, PID_Periodo=control_period))
+    clock = VirtualClock(epoch=0)
+    process = SimulatedCanProcess(clock)
+    process.initialize_settings()
+    process.can_network = PlantNetwork(PressurePlant(leak=leak), clock, demand)
+    start = time.perf_counter()
+    process.bring_up()
+    # Like the operator pressing start on the app
+    process.execute_command("RUN")
+    process.loop(hours * HOUR)
+    process.time_updater.flush()
+    elapsed = time.perf_counter() - start
+    hourly = process.hourly
+    counters = settings.get_settings([f"impianto_{name}_{key}" for name in ("RB", "BK", "TL")
+                                      for key in ("Counter_hour", "SERVICE")])
+    counters = {key.replace("impianto_", ""): int(value) for key, value in counters.items()}
+    return hourly, counters, elapsed
+
+
+def drip_check(hourly, counters):
+    # One activation, then the pumps are never started again
+    activations = [row["hour"] for row in hourly if row["anti_drip"] > 0]
+    return len(activations) == 1 and all(row["starts"] == 0 for row in hourly if row["hour"] > activations[0])
+
+
+def window_check(hourly, counters):
+    # 6 starts per hour, never 10 in the sliding window of one hour
+    return all(row["starts"] > 0 and row["anti_drip"] == 0 for row in hourly if row["hour"] < 3)
+
+
+def limits_check(hourly, counters):
+    # After filling the plant, the pumps follow the demand from 6:00
+    # until the RB limit is reached at 10:00, and are never started
+    # again: the counters go on while the operator wants the pumps
+    # running, up to their limits
+    return (counters["RB_SERVICE"] == 1 and counters["RB_Counter_hour"] == 10
+            and counters["BK_SERVICE"] == 1 and counters["BK_Counter_hour"] == 12
+            and counters["TL_SERVICE"] == 0 and counters["TL_Counter_hour"] == 24
+            and all(row["runtime_s"] > 0 for row in hourly if 6 <= row["hour"] < 10)
+            and all(row["runtime_s"] == 0 for row in hourly if 0 < row["hour"] < 6 or row["hour"] > 10)
+            and not any(row["anti_drip"] for row in hourly))
+
+
+SCENARIOS = [
+    # name, settings, demand, leak, hours, check
+    ("a dripping valve triggers the anti-drip",
+     {"Pressione_Uscita_Target": 40, "AntisgoccPeriodoControllo": HOUR, "AntisgoccNpartenze": 10,
+      "AntisgoccDurataPartenze": 5},
+     dripping_valve, 0.0, 3, drip_check),
+    ("starts below the limit do not trigger the anti-drip",
+     {"Pressione_Uscita_Target": 40, "AntisgoccPeriodoControllo": HOUR, "AntisgoccNpartenze": 10,
+      "AntisgoccDurataPartenze": 5},
+     occasional_valve, 0.0, 3, window_check),
+    ("the RB and BK limits stop the pumps",
+     {"Pressione_Uscita_Target": 40, "AntisgoccPeriodoControllo": HOUR, "AntisgoccNpartenze": 100000,
+      "impianto_RB_Counter_SetCounter": 10, "impianto_BK_Counter_SetCounter": 12,
+      "impianto_TL_Counter_SetCounter": 1000},
+     working_hours, 0.0, 24, limits_check),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--period", type=float, default=0.2,
+                        help="PID period in seconds (0.2 on the plant, slower to simulate)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    failed = 0
+    # tmpfs, where available, so that the commits are not slowed down
+    # by the disk
+    parent = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    cwd = os.getcwd()
+    for name, settings_values, demand, leak, hours, check in SCENARIOS:
+        with tempfile.TemporaryDirectory(dir=parent) as directory:
+            # The CanProcess uses piCANclient.db in the current directory
+            os.chdir(directory)
+            try:
+                hourly, counters, elapsed = run_scenario(settings_values, demand, leak, hours, args.period)
+            finally:
+                os.chdir(cwd)
+        passed = check(hourly, counters)
+        failed += 0 if passed else 1
+        print(f"{'OK  ' if passed else 'FAIL'} {name}: {hours} simulated hours in {elapsed:.1f}s"
+              f" ({hours / elapsed:.2f} simulated h per wall-clock second)")
+        print(f"     {counters}")
+        for row in hourly:
+            print(f"     {row}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()